@@ -14,12 +14,17 @@ def draw_menu_import(self, context):
     bl_label = "Puni"
     bl_idname = "TOPBAR_MT_file_Puni_import"
     self.layout.operator(ImportEZ.bl_idname, text="Zip (EZ)")    
+    self.layout.operator(LoadClipsEZ.bl_idname, text="EZ animation clips")
 
 def register():
     bpy.utils.register_class(ImportEZ)
+    bpy.utils.register_class(YMDClipItem)
+    bpy.utils.register_class(LoadClipsEZ)
     bpy.types.TOPBAR_MT_file_import.append(draw_menu_import)
 
 def unregister():
+    bpy.utils.unregister_class(LoadClipsEZ)
+    bpy.utils.unregister_class(YMDClipItem)
     bpy.utils.unregister_class(ImportEZ)
     bpy.types.TOPBAR_MT_file_import.remove(draw_menu_import)
 
@@ -0,0 +1,26 @@
+from .archive import decrypt_bytes, decrypt_file, read_ez_members
+from .gltf import write_glb
+from .keyframes import REDUCTION_MODES, bezier_handles, key_slopes, reduce_keys
+from .materials import MaterialResolver
+from .model import Bone, Clip, Mesh, Model, Sections, Skin
+from .parser import (
+    KEY_LOCATION,
+    KEY_ROTATION,
+    KEY_SCALE,
+    KEY_TIME,
+    Reader,
+    group_influences,
+    index_sections,
+    load_aura,
+    load_clip,
+    open_source,
+    parse_ymd,
+    select_clips,
+    vertex_influences,
+    versions,
+)
+from .obj import write_obj
+from .schema import Record
+from .timing import Stats, profiled
+from .transforms import transform_locations, transform_rotations, transform_scales
+from .weld import weld_mesh, weld_model
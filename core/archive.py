@@ -0,0 +1,74 @@
+import json
+import os
+import posixpath
+
+from Crypto.Cipher import AES
+
+key = b'\x2a\xb5\x11\xf4\x77\x97\x7d\x25\xcf\x6f\x7a\x8a\xe0\x49\xa1\x25'
+
+
+def decrypt_bytes(key, data):
+    cipher = AES.new(key, AES.MODE_CBC, b'0000000000000000')
+    return cipher.decrypt(data)
+
+def encrypt_bytes(key, data):
+    """
+    Encrypts data the way .ez archives are, zero padding it to the AES block size.
+    """
+    cipher = AES.new(key, AES.MODE_CBC, b'0000000000000000')
+    return cipher.encrypt(bytes(data) + b'\0' * (-len(data) % 16))
+
+def decrypt_file(key, input_file, output_file=None, chunksize=64*1024):
+    if not output_file:
+        output_file = os.path.splitext(input_file)[0] + '.zip'
+
+    filesize = os.path.getsize(input_file)
+
+    cipher = AES.new(key, AES.MODE_CBC, b'0000000000000000')
+
+    with open(input_file, 'rb') as infile:
+        with open(output_file, 'wb') as outfile:
+            while True:
+                chunk = infile.read(chunksize)
+                if len(chunk) == 0:
+                    break
+                outfile.write(cipher.decrypt(chunk))
+
+            outfile.truncate(filesize)
+
+def read_ez_members(zf, filename):
+    """
+    Reads the .ymd, the textures and modelInfo.txt straight from an opened archive.
+
+    Args:
+    - zf (ZipFile): Decrypted archive.
+    - filename (str): Archive name without extension, used to pick the .ymd.
+
+    Returns:
+    Tuple containing the .ymd bytes (or None), a dict of texture name to PNG bytes, the parsed modelInfo (or None)
+    and a dict of name to bytes of the other .ymd next to it, the aura effect files.
+    """
+    names = [i for i in zf.namelist() if not i.endswith('/')]
+    ymd_names = [i for i in names if i.lower().endswith('.ymd')]
+    if not ymd_names:
+        return None, {}, None, {}
+
+    ymd_name = next((i for i in ymd_names if posixpath.basename(i) == filename + '.ymd'), ymd_names[0])
+    folder = posixpath.dirname(ymd_name)
+    ymd_data = zf.read(ymd_name)
+
+    textures = {}
+    model_info = None
+    auras = {}
+    for name in names:
+        if posixpath.dirname(name) != folder:
+            continue
+        basename = posixpath.basename(name)
+        if basename.lower().endswith('.png'):
+            textures[basename] = zf.read(name)
+        elif basename == 'modelInfo.txt':
+            model_info = json.loads(zf.read(name))
+        elif basename.lower().endswith('.ymd') and name != ymd_name:
+            auras[basename] = zf.read(name)
+
+    return ymd_data, textures, model_info, auras
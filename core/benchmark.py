@@ -0,0 +1,277 @@
+"""
+Headless benchmark of the pipeline stages on synthetic archives.
+
+    python -m core.benchmark [--sizes small medium large] [--repeat N] [--version V]
+                             [--baseline FILE] [--save] [--tolerance 0.25] [--json FILE]
+
+Each size is a synthetic .ez (see core.synthetic) run through decrypt_bytes,
+decrypt_file, the zip members, parse_ymd (index, meshes, skins, bones, clips),
+the skin expansion, load_aura and the OBJ and glTF writers. Every stage keeps
+its median time over the repeats and the peak memory of its step, measured in
+a separate run under tracemalloc. With --baseline, the results are compared to
+a stored run and the command exits with 1 when a stage got slower, or a step
+hungrier, than the tolerance allows; --save stores the run as the new baseline.
+A baseline recorded with another version, repeat count or size is not compared
+(exit 2).
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from zipfile import ZipFile
+
+import numpy as np
+
+from .archive import decrypt_bytes, decrypt_file, key, read_ez_members
+from .gltf import write_glb
+from .obj import write_obj
+from .parser import load_aura, parse_ymd, vertex_influences, versions
+from .synthetic import synthetic_archive
+from .timing import Stats
+
+SIZES = {
+    "small": {"meshes": 4, "vertices": 3000, "bones": 32, "groups": 16, "clips": 2, "keys": 60, "auras": 1},
+    "medium": {"meshes": 16, "vertices": 30000, "bones": 128, "groups": 64, "clips": 4, "keys": 300, "auras": 2},
+    "large": {"meshes": 32, "vertices": 150000, "bones": 256, "groups": 256, "clips": 4, "keys": 600, "auras": 4},
+}
+
+# Stages faster than this are too noisy to flag
+MIN_SECONDS = 0.002
+# Fewer timed runs make the median too noisy for the default tolerance
+MIN_REPEAT = 3
+# Peak memory growth ignored regardless of the tolerance
+MIN_PEAK = 1 << 20
+
+
+def pipeline_steps(ez_data, work_dir):
+    """
+    Returns the (name, step) pairs of the pipeline. Each step takes a Stats and
+    records one or more stages; later steps use the output of earlier ones.
+    """
+    state = {}
+
+    def decrypt(stats):
+        with stats.stage("decrypt", len(ez_data)):
+            state["zip"] = decrypt_bytes(key, ez_data)
+
+    def decrypt_to_file(stats):
+        ez_file = os.path.join(work_dir, "benchmark.ez")
+        if not os.path.exists(ez_file):
+            with open(ez_file, 'wb') as f:
+                f.write(ez_data)
+        with stats.stage("decrypt_file", len(ez_data)):
+            decrypt_file(key, ez_file, os.path.join(work_dir, "benchmark.zip"))
+
+    def unzip(stats):
+        with stats.stage("unzip") as measures:
+            with ZipFile(io.BytesIO(state["zip"])) as zf:
+                state["members"] = read_ez_members(zf, "benchmark")
+            measures["bytes"] = len(state["members"][0])
+
+    def parse(stats):
+        state["model"] = parse_ymd(state["members"][0], stats=stats)
+
+    def influences(stats):
+        with stats.stage("influences") as measures:
+            for mesh in state["model"].meshes:
+                measures["count"] += len(vertex_influences(mesh.skin, mesh.face_groups_idx)[0])
+
+    def auras(stats):
+        aura_files = state["members"][3]
+        with stats.stage("auras", sum(len(i) for i in aura_files.values()), len(aura_files)):
+            for data in aura_files.values():
+                load_aura(data)
+
+    def obj(stats):
+        model = state["model"]
+        with stats.stage("obj", count=sum(len(i.positions) for i in model.meshes)):
+            write_obj(model, os.path.join(work_dir, "obj"), "single", textures=state["members"][1], model_info=state["members"][2])
+
+    def glb(stats):
+        model, textures, model_info = state["model"], state["members"][1], state["members"][2]
+        with stats.stage("glb", count=sum(len(i.positions) for i in model.meshes)):
+            write_glb(model, os.path.join(work_dir, "model.glb"), textures, model_info)
+
+    return [
+        ("decrypt", decrypt), ("decrypt_file", decrypt_to_file), ("unzip", unzip), ("parse", parse),
+        ("influences", influences), ("auras", auras), ("obj", obj), ("glb", glb),
+    ]
+
+def run_size(options, repeat=5, version=20181101, log=print):
+    """
+    Benchmarks every stage on one synthetic archive.
+
+    Args:
+    - options (dict): Arguments of synthetic_archive, e.g. an entry of SIZES.
+    - repeat (int): Timed runs of each step, the median is kept.
+    - version (int): Header version of the synthetic files.
+    - log (callable): Receives progress lines.
+
+    Returns:
+    Dict with the options, the archive size in "bytes", per stage "stages" (median and
+    best seconds, bytes, count, MB/s and items/s) and the tracemalloc peak of each step in "peaks".
+    """
+    ez_data = synthetic_archive("benchmark", version, **options)
+    stages = {}
+    peaks = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, step in pipeline_steps(ez_data, work_dir):
+            runs = {}
+            for i in range(repeat):
+                stats = Stats()
+                step(stats)
+                for stage_name, entry in stats.to_dict().items():
+                    runs.setdefault(stage_name, []).append(entry)
+
+            tracemalloc.start()
+            try:
+                step(Stats())
+                peaks[name] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+            median = {}
+            for stage_name, entries in runs.items():
+                entry = entries[0]
+                median[stage_name] = statistics.median(i["seconds"] for i in entries)
+                seconds = max(median[stage_name], 1e-9)
+                stages[stage_name] = {
+                    "seconds": median[stage_name],
+                    "best": min(i["seconds"] for i in entries),
+                    "bytes": entry["bytes"],
+                    "count": entry["count"],
+                    "mb_per_s": entry["bytes"] / seconds / 1e6,
+                    "items_per_s": entry["count"] / seconds,
+                }
+            log("  %-12s %8.4fs %8.1f MB peak" % (name, sum(median.values()), peaks[name] / 1e6))
+
+    return {"options": dict(options), "bytes": len(ez_data), "stages": stages, "peaks": peaks}
+
+def run_benchmark(sizes=("small", "medium"), repeat=5, version=20181101, log=print):
+    """
+    Runs run_size for each named size of SIZES.
+
+    Returns:
+    Dict with the environment and the result of each size under "sizes".
+    """
+    results = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "version": version,
+        "repeat": repeat,
+        "sizes": {},
+    }
+    for size in sizes:
+        log("%s (%s)" % (size, ", ".join("%s=%s" % i for i in SIZES[size].items())))
+        results["sizes"][size] = run_size(SIZES[size], repeat, version, log)
+    return results
+
+def mismatches(results, baseline):
+    """
+    Returns the run parameters that differ between a run and a baseline, which
+    make their timings incomparable: header version, repeat count and the options of each shared size.
+    """
+    found = []
+    for name in ("version", "repeat"):
+        if results.get(name) != baseline.get(name):
+            found.append("%s %s, baseline %s" % (name, results.get(name), baseline.get(name)))
+    for size, result in results["sizes"].items():
+        reference = baseline.get("sizes", {}).get(size)
+        if reference is not None and result.get("options") != reference.get("options"):
+            found.append("%s options %s, baseline %s" % (size, result.get("options"), reference.get("options")))
+    return found
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Compares a run to a baseline recorded with the same parameters, see mismatches.
+
+    Args:
+    - results (dict): Output of run_benchmark.
+    - baseline (dict): Earlier output of run_benchmark.
+    - tolerance (float): Allowed relative slowdown and memory growth.
+
+    Returns:
+    Tuple of the report lines and the list of regressions.
+    """
+    lines = []
+    regressions = []
+    for size, result in results["sizes"].items():
+        reference = baseline.get("sizes", {}).get(size)
+        if reference is None:
+            lines.append("%s: not in the baseline" % size)
+            continue
+
+        for name, entry in result["stages"].items():
+            before = reference["stages"].get(name)
+            if before is None:
+                continue
+            ratio = entry["seconds"] / max(before["seconds"], 1e-9)
+            line = "%-7s %-12s %8.4fs -> %8.4fs  %+6.1f%%" % (size, name, before["seconds"], entry["seconds"], (ratio - 1) * 100)
+            if ratio > 1 + tolerance and entry["seconds"] > MIN_SECONDS:
+                line += "  SLOWER"
+                regressions.append("%s %s is %.0f%% slower" % (size, name, (ratio - 1) * 100))
+            lines.append(line)
+
+        for name, peak in result["peaks"].items():
+            before = reference["peaks"].get(name)
+            if before is not None and peak > before * (1 + tolerance) + MIN_PEAK:
+                lines.append("%-7s %-12s %8.1f MB -> %8.1f MB peak  MORE MEMORY" % (size, name, before / 1e6, peak / 1e6))
+                regressions.append("%s %s peak memory grew from %.1f to %.1f MB" % (size, name, before / 1e6, peak / 1e6))
+
+    return lines, regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m core.benchmark", description="Benchmark the pipeline stages without Blender.")
+    parser.add_argument("--sizes", nargs="+", default=["small", "medium"], choices=list(SIZES))
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per stage, the median is kept (default: 5, at least %d)" % MIN_REPEAT)
+    parser.add_argument("--version", type=int, default=20181101, choices=versions, help=".ymd header version of the synthetic files")
+    parser.add_argument("--baseline", default=None, help="baseline .json to compare to (or to write with --save)")
+    parser.add_argument("--save", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown and memory growth (default: 0.25)")
+    parser.add_argument("--json", default=None, help="also write the results to this .json")
+    args = parser.parse_args(argv)
+    if args.repeat < MIN_REPEAT:
+        parser.error("--repeat must be at least %d" % MIN_REPEAT)
+
+    results = run_benchmark(args.sizes, args.repeat, args.version)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+
+    if not args.baseline:
+        return 0
+    if args.save or not os.path.exists(args.baseline):
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+        print("Saved baseline %s" % args.baseline)
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    different = mismatches(results, baseline)
+    if different:
+        print("Not comparable with %s, run with the same parameters or --save a new baseline:" % args.baseline)
+        for line in different:
+            print("  " + line)
+        return 2
+    lines, regressions = compare(results, baseline, args.tolerance)
+    for line in lines:
+        print(line)
+    if regressions:
+        print("%d regression(s) against %s:" % (len(regressions), args.baseline))
+        for regression in regressions:
+            print("  " + regression)
+        return 1
+    print("No regression against %s" % args.baseline)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,471 @@
+"""
+Content-addressed cache of parsed models.
+
+Each entry is one flat file named after the hash of the archive bytes and
+the parser version. It holds a JSON header followed by the model arrays,
+64-byte aligned, so a hit is served as read-only views over a memory map.
+
+    python -m core.cache info|clear [--dir DIR]
+"""
+import argparse
+import dataclasses
+import hashlib
+import io
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+from zipfile import ZipFile
+
+import numpy as np
+
+from .archive import decrypt_bytes, key, read_ez_members
+from .model import Bone, Clip, Mesh, Model, Skin
+from .parser import PARSER_VERSION, load_aura, load_clip, open_source, parse_ymd, select_clips
+from .timing import stage
+
+DEFAULT_MAX_SIZE = 1 << 30
+EXTENSION = ".ymdc"
+MAGIC = b"YMDC"
+ALIGN = 64
+# Temporary files older than this are left over from interrupted writes
+STALE_SECONDS = 3600
+# Raised reading a truncated or malformed entry, which is then treated as a miss
+ENTRY_ERRORS = (OSError, ValueError, KeyError, IndexError, TypeError, AttributeError, struct.error)
+
+
+def default_cache_dir():
+    """
+    Returns $YMD_CACHE_DIR, or ~/.cache/ymd-io.
+    """
+    return os.environ.get("YMD_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "ymd-io")
+
+def cache_key(archive_bytes):
+    digest = hashlib.sha256(archive_bytes)
+    digest.update(b"parser-%d" % PARSER_VERSION)
+    return digest.hexdigest()
+
+def entry_path(cache_dir, key):
+    return os.path.join(cache_dir, key + EXTENSION)
+
+def describe_model(model, ref):
+    """
+    Returns the JSON-able description of a model, its arrays replaced by the indices ref gives them.
+    """
+    return {
+        "version": model.version,
+        "meshes": [{
+            "object_name": mesh.object_name,
+            "name": mesh.name,
+            "positions": ref(mesh.positions),
+            "normals": ref(mesh.normals),
+            "uvs": ref(mesh.uvs),
+            "faces": ref(mesh.faces),
+            "face_groups_idx": ref(mesh.face_groups_idx),
+            "skin": {
+                "bone_names": mesh.skin.bone_names,
+                "offsets": ref(mesh.skin.offsets),
+                "bone_idx": ref(mesh.skin.bone_idx),
+                "weight": ref(mesh.skin.weight),
+            },
+        } for mesh in model.meshes],
+        "bones": [{
+            "name": bone.name,
+            "parent": bone.parent,
+            "mesh_name": bone.mesh_name,
+            "transform": ref(bone.transform),
+            "matrix": None if bone.matrix is None else ref(bone.matrix),
+        } for bone in model.bones],
+        "clips": [{
+            "name": clip.name,
+            "offset": clip.offset,
+            "size": clip.size,
+            "bone_count": clip.bone_count,
+            "frame_count": clip.frame_count,
+            "stride": clip.stride,
+            "tracks": None if clip.tracks is None else {name: ref(keys) for name, keys in clip.tracks.items()},
+        } for clip in model.clips],
+    }
+
+def rebuild_model(entry, arrays):
+    """
+    Inverse of describe_model.
+    """
+    meshes = []
+    for mesh in entry["meshes"]:
+        skin = mesh["skin"]
+        meshes.append(Mesh(
+            mesh["object_name"], mesh["name"],
+            arrays[mesh["positions"]], arrays[mesh["normals"]], arrays[mesh["uvs"]],
+            arrays[mesh["faces"]], arrays[mesh["face_groups_idx"]],
+            Skin(skin["bone_names"], arrays[skin["offsets"]], arrays[skin["bone_idx"]], arrays[skin["weight"]]),
+        ))
+
+    bones = [
+        Bone(bone["name"], bone["parent"], bone["mesh_name"], arrays[bone["transform"]],
+             None if bone["matrix"] is None else arrays[bone["matrix"]])
+        for bone in entry["bones"]
+    ]
+
+    clips = [
+        Clip(clip["name"], clip["offset"], clip["size"], clip["bone_count"], clip["frame_count"], clip["stride"],
+             None if clip["tracks"] is None else {name: arrays[i] for name, i in clip["tracks"].items()})
+        for clip in entry["clips"]
+    ]
+
+    return Model(entry["version"], meshes, bones, {bone.name: i for i, bone in enumerate(bones)}, clips)
+
+def pack_model(model, textures, model_info, auras=None):
+    """
+    Splits a model, its textures, modelInfo and aura files into a JSON-able
+    header and a list of arrays the header refers to by index.
+    """
+    arrays = []
+
+    def ref(array):
+        arrays.append(np.ascontiguousarray(array))
+        return len(arrays) - 1
+
+    header = describe_model(model, ref)
+    header.update({
+        "parser_version": PARSER_VERSION,
+        "textures": {name: ref(np.frombuffer(bytes(data), np.uint8)) for name, data in textures.items()},
+        "model_info": model_info,
+        "auras": {
+            name: {"model": describe_model(aura, ref), "textures": shape_textures}
+            for name, (aura, shape_textures) in (auras or {}).items()
+        },
+    })
+    return header, arrays
+
+def unpack_model(header, arrays):
+    """
+    Rebuilds the model, textures, modelInfo and aura files from pack_model output.
+    """
+    model = rebuild_model(header, arrays)
+    textures = {name: arrays[i].tobytes() for name, i in header["textures"].items()}
+    auras = {name: (rebuild_model(entry["model"], arrays), entry["textures"]) for name, entry in header["auras"].items()}
+    return model, textures, header["model_info"], auras
+
+def write_entry(path, header, arrays):
+    """
+    Writes an entry atomically: MAGIC, header size, JSON header, then the aligned arrays.
+    """
+    layout = []
+    offset = 0
+    for array in arrays:
+        layout.append({"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset})
+        offset += -(-array.nbytes // ALIGN) * ALIGN
+    header = dict(header, arrays=layout)
+
+    header_bytes = json.dumps(header, ensure_ascii=False).encode()
+    start = -(-(len(MAGIC) + 8 + len(header_bytes)) // ALIGN) * ALIGN
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC + struct.pack("<Q", len(header_bytes)) + header_bytes)
+            for entry, array in zip(layout, arrays):
+                f.seek(start + entry["offset"])
+                f.write(array.tobytes())
+            f.truncate(start + offset)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+def read_entry(path):
+    """
+    Maps an entry and returns its header and read-only array views.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("not a cache entry: %s" % path)
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    start = -(-(len(MAGIC) + 8 + header_size) // ALIGN) * ALIGN
+
+    size = os.path.getsize(path)
+    blob = np.memmap(path, dtype=np.uint8, mode='r') if size > 0 else np.empty(0, np.uint8)
+    arrays = []
+    for entry in header["arrays"]:
+        dtype = np.dtype(entry["dtype"])
+        count = int(np.prod(entry["shape"], dtype=np.int64))
+        begin = start + entry["offset"]
+        arrays.append(blob[begin:begin + count * dtype.itemsize].view(dtype).reshape(entry["shape"]))
+    return header, arrays
+
+def load_cached(key, cache_dir=None):
+    """
+    Returns (model, textures, model_info, auras) for a cache key, or None on a miss.
+    A hit marks the entry as recently used. A corrupt entry is a miss, the next store replaces it.
+    """
+    path = entry_path(cache_dir or default_cache_dir(), key)
+    try:
+        header, arrays = read_entry(path)
+        if header.get("parser_version") != PARSER_VERSION:
+            return None
+        cached = unpack_model(header, arrays)
+    except ENTRY_ERRORS:
+        return None
+
+    try:
+        os.utime(path)
+    except OSError:
+        # Read-only cache, or evicted meanwhile: the views stay valid, only the recency is lost
+        pass
+    return cached
+
+def store_cached(key, model, textures, model_info, auras=None, cache_dir=None, max_size=DEFAULT_MAX_SIZE):
+    """
+    Stores a parsed model, then evicts the least recently used entries above max_size bytes.
+    The new entry is kept even when it alone is larger than max_size.
+    """
+    cache_dir = cache_dir or default_cache_dir()
+    header, arrays = pack_model(model, textures, model_info, auras)
+    path = entry_path(cache_dir, key)
+    write_entry(path, header, arrays)
+    evict(cache_dir, max_size, keep=path)
+
+def cache_entries(cache_dir=None):
+    """
+    Returns (path, size, last use) of every entry, least recently used first.
+    """
+    cache_dir = cache_dir or default_cache_dir()
+    if not os.path.isdir(cache_dir):
+        return []
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(EXTENSION):
+            path = os.path.join(cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Evicted by another process since listdir
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+    entries.sort(key=lambda entry: entry[2])
+    return entries
+
+def remove_stale_files(cache_dir, max_age=STALE_SECONDS):
+    """
+    Removes the temporary files of writes interrupted more than max_age seconds ago.
+    """
+    now = time.time()
+    for name in os.listdir(cache_dir):
+        if name.endswith(".tmp"):
+            path = os.path.join(cache_dir, name)
+            try:
+                if now - os.stat(path).st_mtime > max_age:
+                    os.remove(path)
+            except OSError:
+                pass
+
+def evict(cache_dir, max_size, keep=None):
+    if os.path.isdir(cache_dir):
+        remove_stale_files(cache_dir)
+    entries = cache_entries(cache_dir)
+    total = sum(entry[1] for entry in entries)
+    for path, size, last_use in entries:
+        if total <= max_size:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            # Still mapped by another import on Windows
+            pass
+
+def cache_info(cache_dir=None):
+    """
+    Returns a dict with the cache directory, its entry count and total size in bytes.
+    """
+    entries = cache_entries(cache_dir)
+    return {
+        "directory": cache_dir or default_cache_dir(),
+        "entries": len(entries),
+        "size": sum(entry[1] for entry in entries),
+    }
+
+def clear_cache(cache_dir=None):
+    """
+    Removes every entry. Returns the number removed.
+    """
+    removed = 0
+    for path, size, last_use in cache_entries(cache_dir):
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+def read_archive(input_file, stats=None):
+    with stage(stats, "read") as measures:
+        with open(input_file, 'rb') as infile:
+            archive_bytes = infile.read()
+        measures["bytes"] = len(archive_bytes)
+    return archive_bytes
+
+def decrypt_archive(input_file, archive_bytes, stats=None, extract_dir=None):
+    """
+    Returns the members of an archive as read_ez_members does, raising ValueError without a .ymd.
+    The decrypted archive is also extracted to extract_dir when given.
+    """
+    filename = os.path.splitext(os.path.basename(input_file))[0]
+    with stage(stats, "decrypt", len(archive_bytes)):
+        buffer = decrypt_bytes(key, archive_bytes)
+    with stage(stats, "unzip") as measures:
+        with ZipFile(io.BytesIO(buffer), 'r') as zf:
+            if extract_dir is not None:
+                zf.extractall(extract_dir)
+            members = read_ez_members(zf, filename)
+        measures["count"] = 1 + len(members[1]) + len(members[3])
+    if members[0] is None:
+        raise ValueError("no .ymd in archive")
+    return members
+
+def requested_clips(model, clip_names):
+    """
+    Returns model with the tracks of the clips clip_names does not select set to
+    None, on copies of those clips so that a cached model is left as it is.
+    """
+    if clip_names is None:
+        return model
+    selected = {id(i) for i in select_clips(model.clips, clip_names)}
+    clips = [clip if id(clip) in selected else dataclasses.replace(clip, tracks=None) for clip in model.clips]
+    return dataclasses.replace(model, clips=clips)
+
+def load_ez(input_file, use_cache=True, cache_dir=None, max_size=DEFAULT_MAX_SIZE, stats=None, log=print, clip_names=None, extract_dir=None):
+    """
+    Decrypts and parses an .ez archive, or serves it from the cache when its bytes were seen before.
+
+    Args:
+    - input_file (str): Path to the .ez.
+    - use_cache (bool): Look up and store the parsed model in the cache.
+    - cache_dir (str): Cache directory, None for default_cache_dir().
+    - max_size (int): Cache size limit in bytes.
+    - stats (Stats): Receives the timing of every stage.
+    - log (callable): Receives warnings.
+    - clip_names (list): Names or patterns of the animation clips to decode, None for all of them.
+      The others keep tracks set to None, for load_ez_clips. A cache entry lacking a requested
+      clip is parsed again and replaced by one holding its clips and the requested ones, only
+      the requested ones are returned with their tracks.
+    - extract_dir (str): Also extract the archive there, from the buffer decrypted for parsing.
+
+    Returns:
+    Tuple containing the Model, a dict of texture name to PNG bytes, the parsed modelInfo (or None)
+    and a dict of aura file name to its (Model, shape textures), as load_aura returns them.
+    """
+    archive_bytes = read_archive(input_file, stats)
+    parsed_clips = clip_names
+
+    if use_cache:
+        with stage(stats, "cache") as measures:
+            entry_key = cache_key(archive_bytes)
+            cached = load_cached(entry_key, cache_dir)
+            complete = cached is not None and all(i.tracks is not None for i in select_clips(cached[0].clips, clip_names))
+            measures["count"] = int(complete)
+        if complete:
+            if extract_dir is not None:
+                decrypt_archive(input_file, archive_bytes, stats, extract_dir)
+            return (requested_clips(cached[0], clip_names),) + tuple(cached[1:])
+        if cached is not None and clip_names is not None:
+            parsed_clips = list(clip_names) + [i.name for i in cached[0].clips if i.tracks is not None]
+        cached = None
+
+    ymd_data, textures, model_info, aura_data = decrypt_archive(input_file, archive_bytes, stats, extract_dir)
+
+    model = parse_ymd(ymd_data, clip_names=parsed_clips, stats=stats)
+    if model is None:
+        raise ValueError("no geometry section in .ymd")
+
+    auras = {}
+    with stage(stats, "auras", sum(len(i) for i in aura_data.values()), len(aura_data)):
+        for name, data in aura_data.items():
+            try:
+                auras[name] = load_aura(data)
+            except (struct.error, ValueError, UnicodeDecodeError) as e:
+                log("Could not read aura %s: %s" % (name, e))
+
+    if use_cache:
+        with stage(stats, "cache"):
+            try:
+                store_cached(entry_key, model, textures, model_info, auras, cache_dir, max_size)
+            except OSError as e:
+                log("Could not write parse cache: %s" % e)
+    return requested_clips(model, clip_names), textures, model_info, auras
+
+def load_ez_clips(input_file, clips, use_cache=True, cache_dir=None, max_size=DEFAULT_MAX_SIZE, stats=None, log=print):
+    """
+    Decodes clips of an archive parsed before from the byte ranges its clip catalog
+    recorded, without parsing the rest of the .ymd again. The tracks come from the
+    cache entry when it holds them, otherwise the archive is decrypted, only those
+    ranges are decoded and the cache entry, if any, is updated with them.
+
+    Args:
+    - input_file (str): Path to the .ez.
+    - clips (list): Entries of Model.clip_catalog, or Clip.
+    - use_cache (bool): Look up and update the cache.
+    - cache_dir (str): Cache directory, None for default_cache_dir().
+    - max_size (int): Cache size limit in bytes.
+    - stats (Stats): Receives the timing of every stage.
+    - log (callable): Receives warnings.
+
+    Returns:
+    List of the Clip, in the order of clips, with their tracks.
+    """
+    wanted = [i if isinstance(i, Clip) else Clip.from_catalog(i) for i in clips]
+    archive_bytes = read_archive(input_file, stats)
+
+    cached = None
+    if use_cache:
+        with stage(stats, "cache") as measures:
+            entry_key = cache_key(archive_bytes)
+            cached = load_cached(entry_key, cache_dir)
+            by_name = {i.name: i for i in cached[0].clips} if cached is not None else {}
+            hits = [by_name.get(i.name) for i in wanted]
+            measures["count"] = sum(i is not None and i.tracks is not None for i in hits)
+        if all(i is not None and i.tracks is not None for i in hits):
+            return hits
+
+    ymd_data = decrypt_archive(input_file, archive_bytes, stats)[0]
+    with stage(stats, "clips") as measures:
+        data = open_source(ymd_data)
+        for clip in wanted:
+            load_clip(data, clip)
+            measures["bytes"] += clip.size
+            measures["count"] += sum(len(i) for i in clip.tracks.values())
+
+    if cached is not None:
+        for clip in wanted:
+            if clip.name in by_name:
+                by_name[clip.name].tracks = clip.tracks
+        with stage(stats, "cache"):
+            try:
+                store_cached(entry_key, *cached, cache_dir=cache_dir, max_size=max_size)
+            except OSError as e:
+                log("Could not write parse cache: %s" % e)
+    return wanted
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m core.cache", description="Inspect or clear the parse cache.")
+    parser.add_argument("command", choices=["info", "clear"])
+    parser.add_argument("--dir", default=None, help="cache directory (default: %s)" % default_cache_dir())
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        info = cache_info(args.dir)
+        print("%s: %d entries, %.1f MB" % (info["directory"], info["entries"], info["size"] / (1024 * 1024)))
+    else:
+        print("Removed %d entries" % clear_cache(args.dir))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,261 @@
+"""
+Batch converter for .ez archives, runs without Blender.
+
+    python -m core.convert INPUT [INPUT ...] -o OUTPUT [--workers N] [--resume] [--cache [DIR]]
+                           [--obj split|single] [--weld] [--glb] [--timing FILE] [--quiet]
+
+Every .ez found under the inputs is decrypted, parsed and exported to
+OUTPUT/<relative path>/: one .obj per mesh (or a single model.obj), the
+textures, modelInfo.txt and a model.json describing the skeleton and the
+animation clips. --glb adds a model.glb with the skins and animations.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from .cache import load_ez
+from .gltf import write_glb
+from .obj import OBJ_MODES, write_obj
+from .timing import Stats
+from .weld import weld_model
+
+PROGRESS_FILE = ".convert_progress.jsonl"
+
+
+def find_archives(inputs):
+    """
+    Returns (path, path relative to its input) for every .ez under the inputs, sorted.
+    """
+    archives = []
+    for input_path in inputs:
+        if os.path.isfile(input_path):
+            archives.append((input_path, os.path.basename(input_path)))
+            continue
+        for directory, dirnames, filenames in os.walk(input_path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.lower().endswith(".ez"):
+                    path = os.path.join(directory, filename)
+                    archives.append((path, os.path.relpath(path, input_path)))
+    return archives
+
+def output_dirs(archives, output):
+    """
+    Returns the output directory of every archive, mirroring its relative path.
+
+    Raises:
+    ValueError when two archives, e.g. with the same relative path under two inputs, would share one.
+    """
+    dirs = []
+    seen = {}
+    for path, relative in archives:
+        directory = os.path.join(output, os.path.splitext(relative)[0])
+        key = os.path.normcase(os.path.abspath(directory))
+        if key in seen:
+            raise ValueError("%s and %s would both be written to %s" % (seen[key], path, directory))
+        seen[key] = path
+        dirs.append(directory)
+    return dirs
+
+def model_summary(model):
+    return {
+        "version": model.version,
+        "meshes": [
+            {"object": mesh.object_name, "name": mesh.name, "vertices": len(mesh.positions), "triangles": len(mesh.faces)}
+            for mesh in model.meshes
+        ],
+        "bones": [{"name": bone.name, "parent": bone.parent, "mesh": bone.mesh_name} for bone in model.bones],
+        "clips": [{"name": clip.name, "bones": clip.bone_count, "frames": clip.frame_count} for clip in model.clips],
+    }
+
+def failed_result(input_file, error=None):
+    return {"path": input_file, "ok": False, "error": error, "bytes": 0, "seconds": 0.0, "stages": {}}
+
+def convert_file(input_file, output_dir, cache_dir=False, obj_mode="split", weld=False, glb=False):
+    """
+    Converts one archive. Never raises: failures are reported in the result.
+    cache_dir is False to bypass the parse cache, None for its default directory.
+    weld merges duplicate vertices once, before every writer, obj_mode is passed to write_obj
+    and glb also writes model.glb.
+
+    Returns:
+    Dict with the input path, "ok", "error", the archive size in bytes, the elapsed seconds
+    and the per-stage "stages" of a Stats.
+    """
+    start = time.perf_counter()
+    stats = Stats()
+    result = failed_result(input_file)
+    try:
+        result["bytes"] = os.path.getsize(input_file)
+        model, textures, model_info, auras = load_ez(input_file, cache_dir is not False, cache_dir or None, stats=stats)
+
+        os.makedirs(output_dir, exist_ok=True)
+        if weld:
+            with stats.stage("weld", count=len(model.meshes)):
+                weld_model(model)
+        with stats.stage("obj", count=len(model.meshes)):
+            write_obj(model, output_dir, obj_mode, textures=textures, model_info=model_info)
+        if glb:
+            with stats.stage("glb", count=len(model.meshes)):
+                write_glb(model, os.path.join(output_dir, "model.glb"), textures, model_info)
+        with stats.stage("write", count=len(textures)):
+            for name, data in textures.items():
+                with open(os.path.join(output_dir, name), 'wb') as f:
+                    f.write(data)
+            if model_info is not None:
+                with open(os.path.join(output_dir, "modelInfo.txt"), 'w', encoding='utf-8') as f:
+                    json.dump(model_info, f, ensure_ascii=False)
+            with open(os.path.join(output_dir, "model.json"), 'w', encoding='utf-8') as f:
+                json.dump(model_summary(model), f, ensure_ascii=False, indent=1)
+
+        result["ok"] = True
+    except Exception:
+        result["error"] = traceback.format_exc()
+    result["seconds"] = time.perf_counter() - start
+    result["stages"] = stats.to_dict()
+    return result
+
+def run_pool(jobs, workers, handle):
+    """
+    Runs convert_file on every job, the tuple of its arguments, and passes each
+    result to handle as it completes.
+
+    Returns:
+    The jobs left without a result because a worker process died, which breaks the pool.
+    """
+    unfinished = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(convert_file, *job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                unfinished.append(job)
+                continue
+            except Exception:
+                result = failed_result(job[0], traceback.format_exc())
+            handle(result)
+    return unfinished
+
+def load_progress(output):
+    """
+    Returns the input paths already converted, read from the progress file.
+    """
+    done = set()
+    path = os.path.join(output, PROGRESS_FILE)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Last line of an interrupted run
+                    continue
+                if entry.get("ok"):
+                    done.add(entry["path"])
+    return done
+
+def convert(inputs, output, workers=None, resume=False, cache_dir=False, obj_mode="split", weld=False, glb=False, timing_file=None, quiet=False, log=print):
+    """
+    Converts every archive under inputs on a process pool. A worker process dying,
+    e.g. killed for memory, breaks the pool: the archives it left unconverted are
+    retried one per process, so that only the one killing its worker fails.
+
+    Args:
+    - inputs (list): Archive files or directories searched recursively.
+    - output (str): Output directory, the input tree is mirrored below it.
+    - workers (int): Number of worker processes, None for the CPU count.
+    - resume (bool): Skip archives converted by a previous run.
+    - cache_dir (str): Parse cache directory, None for the default one, False to bypass the cache.
+    - obj_mode (str): "split" for one .obj per mesh, "single" for one model.obj per archive.
+    - weld (bool): Write indexed vertices, merging the duplicate corners of the triangle soup.
+    - glb (bool): Also write a binary glTF per archive.
+    - timing_file (str): Write the per-stage timings summed over all archives to this .json, and log them.
+    - quiet (bool): Only log failures and the summary.
+    - log (callable): Receives progress lines.
+
+    Returns:
+    List of the result dicts of convert_file, in completion order.
+
+    Raises:
+    ValueError when two archives would be written to the same directory.
+    """
+    archives = find_archives(inputs)
+    directories = output_dirs(archives, output)
+    os.makedirs(output, exist_ok=True)
+    done = load_progress(output) if resume else set()
+    pending = [(os.path.abspath(path), directory) for (path, relative), directory in zip(archives, directories)
+               if os.path.abspath(path) not in done]
+    if len(pending) != len(archives):
+        log("Skipping %d archives converted by a previous run" % (len(archives) - len(pending)))
+
+    results = []
+    stats = Stats()
+    start = time.perf_counter()
+    with open(os.path.join(output, PROGRESS_FILE), 'a' if resume else 'w', encoding='utf-8') as progress:
+        def record(result):
+            results.append(result)
+            stats.merge(Stats.from_dict(result["stages"]))
+            progress.write(json.dumps({"path": result["path"], "ok": result["ok"]}) + "\n")
+            progress.flush()
+
+            status = "ok" if result["ok"] else "FAILED"
+            if not quiet or not result["ok"]:
+                log("[%d/%d] %s %s (%.2fs)" % (len(results), len(pending), status, result["path"], result["seconds"]))
+            if not result["ok"]:
+                log(result["error"].rstrip())
+
+        jobs = [(path, directory, cache_dir, obj_mode, weld, glb) for path, directory in pending]
+        unfinished = run_pool(jobs, workers, record)
+        if unfinished:
+            log("A worker process died, retrying %d archives one at a time" % len(unfinished))
+        for job in unfinished:
+            if run_pool([job], 1, record):
+                record(failed_result(job[0], "worker process died while converting %s" % job[0]))
+
+    elapsed = time.perf_counter() - start
+    log(summary(results, elapsed))
+    if timing_file:
+        for line in stats.report():
+            log(line)
+        stats.write_json(timing_file)
+    return results
+
+def summary(results, elapsed):
+    converted = [i for i in results if i["ok"]]
+    size = sum(i["bytes"] for i in converted) / (1024 * 1024)
+    rate = len(converted) / elapsed if elapsed > 0 else 0.0
+    throughput = size / elapsed if elapsed > 0 else 0.0
+    return "%d converted, %d failed in %.2fs (%.1f files/s, %.1f MB/s)" % (
+        len(converted), len(results) - len(converted), elapsed, rate, throughput)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m core.convert", description="Convert .ez archives without Blender.")
+    parser.add_argument("inputs", nargs="+", help=".ez files or directories searched recursively")
+    parser.add_argument("-o", "--output", required=True, help="output directory")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--resume", action="store_true", help="skip archives converted by a previous run")
+    parser.add_argument("--cache", nargs="?", const=None, default=False, metavar="DIR",
+                        help="reuse and store parsed models in the parse cache (default dir: $YMD_CACHE_DIR or ~/.cache/ymd-io)")
+    parser.add_argument("--obj", choices=OBJ_MODES, default="split", help="one .obj per mesh or a single model.obj")
+    parser.add_argument("--weld", action="store_true", help="write indexed vertices, merging duplicates")
+    parser.add_argument("--glb", action="store_true", help="also write model.glb with skins and animations")
+    parser.add_argument("--timing", metavar="FILE", default=None, help="write per-stage timings (summed over the workers) to this .json")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only print failures and the summary")
+    args = parser.parse_args(argv)
+
+    try:
+        results = convert(args.inputs, args.output, args.workers, args.resume, args.cache, args.obj, args.weld, args.glb,
+                          args.timing, args.quiet)
+    except ValueError as e:
+        parser.error(str(e))
+    return 0 if all(i["ok"] for i in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+"""
+Binary glTF (.glb) export of a parsed model: meshes, skins, the bone
+hierarchy, textures and animation clips.
+
+Every buffer view is written straight from a contiguous numpy array.
+The .ymd is Y-up like glTF, so no axis conversion is applied; Blender's
+importer rotates the armature instead.
+"""
+import json
+import os
+import struct
+
+import numpy as np
+
+from .materials import MaterialResolver
+from .parser import KEY_LOCATION, KEY_ROTATION, KEY_SCALE, KEY_TIME, group_influences
+from .transforms import matrix_to_quaternion
+
+FLOAT = 5126
+UNSIGNED_BYTE = 5121
+UNSIGNED_SHORT = 5123
+UNSIGNED_INT = 5125
+
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+
+# Rate of the clips whose key times are not strictly increasing
+DEFAULT_FPS = 30
+
+
+class GlbBuilder:
+    """
+    Collects the glTF JSON and the arrays of the binary chunk.
+    """
+
+    def __init__(self):
+        self.gltf = {
+            "asset": {"version": "2.0", "generator": "blender-ymd-io"},
+            "buffers": [],
+            "bufferViews": [],
+            "accessors": [],
+        }
+        self.chunks = []
+        self.length = 0
+
+    def add(self, key, item):
+        items = self.gltf.setdefault(key, [])
+        items.append(item)
+        return len(items) - 1
+
+    def buffer_view(self, array, target=None):
+        array = np.ascontiguousarray(array)
+        view = {"buffer": 0, "byteOffset": self.length, "byteLength": array.nbytes}
+        if target is not None:
+            view["target"] = target
+        self.chunks.append(array)
+        self.length += array.nbytes
+
+        padding = -self.length % 4
+        if padding:
+            self.chunks.append(np.zeros(padding, np.uint8))
+            self.length += padding
+        return self.add("bufferViews", view)
+
+    def accessor(self, array, component_type, accessor_type, target=None, bounds=False):
+        """
+        Adds a buffer view over array and an accessor describing it.
+        """
+        accessor = {
+            "bufferView": self.buffer_view(array, target),
+            "componentType": component_type,
+            "count": len(array),
+            "type": accessor_type,
+        }
+        if bounds and len(array):
+            accessor["min"] = array.min(axis=0).reshape(-1).tolist()
+            accessor["max"] = array.max(axis=0).reshape(-1).tolist()
+        return self.add("accessors", accessor)
+
+    def write(self, output_file):
+        self.gltf["buffers"].append({"byteLength": self.length})
+        header = json.dumps(self.gltf, ensure_ascii=False, separators=(",", ":")).encode()
+        header += b" " * (-len(header) % 4)
+
+        with open(output_file, 'wb') as f:
+            f.write(struct.pack("<4sII", b"glTF", 2, 12 + 8 + len(header) + 8 + self.length))
+            f.write(struct.pack("<I4s", len(header), b"JSON"))
+            f.write(header)
+            f.write(struct.pack("<I4s", self.length, b"BIN\0"))
+            for array in self.chunks:
+                f.write(array.data)
+
+def rest_matrices(model):
+    """
+    Returns the (B,4,4) armature space rest matrices, the inverse of the skin
+    bind matrices. Bones without a bind matrix rest at the origin.
+    """
+    matrices = np.tile(np.eye(4), (len(model.bones), 1, 1))
+    for i, bone in enumerate(model.bones):
+        if bone.matrix is not None:
+            try:
+                matrices[i] = np.linalg.inv(bone.matrix)
+            except np.linalg.LinAlgError:
+                pass
+    return matrices
+
+def decompose(matrices):
+    """
+    Splits (B,4,4) affine matrices into translations, x,y,z,w rotations and scales.
+    """
+    translations = matrices[:, :3, 3]
+    scales = np.linalg.norm(matrices[:, :3, :3], axis=1)
+    rotations = matrix_to_quaternion(matrices[:, :3, :3])[:, [1, 2, 3, 0]]
+    return translations, rotations, scales
+
+def skin_attributes(mesh, joint_of_bone, fallback_joint):
+    """
+    Packs the skin of a mesh into JOINTS_n/WEIGHTS_n sets of four influences,
+    strongest first, with the weights of every vertex normalized.
+
+    Args:
+    - mesh (Mesh): Parsed mesh.
+    - joint_of_bone (numpy.ndarray): Joint index of each skin bone, -1 for bones outside the tree.
+    - fallback_joint (int): Joint of the vertices without influences.
+
+    Returns:
+    List of (joints, weights) arrays, each (N,4).
+    """
+    count = len(mesh.positions)
+    if len(mesh.skin.offsets) < 2 or count == 0:
+        return [(np.full((count, 4), [fallback_joint, 0, 0, 0], np.uint16), np.tile(np.float32([1, 0, 0, 0]), (count, 1)))]
+
+    # Vertices share the influences of their face group, so they are packed per group and gathered
+    offsets, bone_idx, weight = group_influences(mesh.skin)
+    groups = len(offsets) - 1
+    group = np.repeat(np.arange(groups), np.diff(offsets))
+    keep = bone_idx < len(joint_of_bone)
+    group, bone_idx, weight = group[keep], bone_idx[keep], weight[keep]
+    joints = joint_of_bone[bone_idx]
+    keep = joints >= 0
+    group, joints, weight = group[keep], joints[keep], weight[keep]
+
+    order = np.lexsort((-weight, group))
+    group, joints, weight = group[order], joints[order], weight[order]
+    influence_counts = np.bincount(group, minlength=groups)
+    used = np.zeros(groups, bool)
+    used[mesh.face_groups_idx] = True
+    slots = max(int(influence_counts[used].max()) if used.any() else 0, 1)
+    slots = -(-slots // 4) * 4
+
+    rank = np.arange(len(group)) - np.repeat(np.cumsum(influence_counts) - influence_counts, influence_counts)
+    group_joints = np.zeros((groups, slots), np.uint16)
+    group_weights = np.zeros((groups, slots), np.float32)
+    group_joints[group, rank] = joints
+    group_weights[group, rank] = weight
+
+    totals = group_weights.sum(axis=1)
+    unweighted = totals <= 0
+    group_joints[unweighted, 0] = fallback_joint
+    group_weights[unweighted, 0] = 1.0
+    totals[unweighted] = 1.0
+    group_weights /= totals[:, None]
+
+    dense_joints = group_joints[mesh.face_groups_idx]
+    dense_weights = group_weights[mesh.face_groups_idx]
+    return [(dense_joints[:, i:i + 4], dense_weights[:, i:i + 4]) for i in range(0, slots, 4)]
+
+def write_glb(model, output_file, textures=None, model_info=None, fps=DEFAULT_FPS):
+    """
+    Writes a parsed model as binary glTF.
+
+    Only the meshes attached to a bone are exported, like the Blender importer.
+    Each mesh gets its own skin over the bones of its skin section, and each
+    loaded clip becomes an animation of the bone nodes.
+
+    Args:
+    - model (Model): Parsed .ymd.
+    - output_file (str): Path of the .glb.
+    - textures (dict): Texture name to PNG bytes, embedded as materials.
+    - model_info (dict): Parsed modelInfo, used to assign the textures.
+    - fps (int): Key rate of the clips whose key times are unusable.
+    """
+    textures = textures or {}
+    builder = GlbBuilder()
+    bone_count = len(model.bones)
+
+    # Bone nodes first so node i is bone i, then the armature root holding the top bones
+    rest = rest_matrices(model)
+    parents = np.array([bone.parent for bone in model.bones], dtype=np.int64)
+    parent_rest = np.where((parents >= 0)[:, None, None], rest[np.maximum(parents, 0)], np.eye(4))
+    local = np.linalg.solve(parent_rest, rest) if bone_count else rest
+    translations, rotations, scales = decompose(local)
+
+    children = [[] for _ in range(bone_count + 1)]
+    for i, bone in enumerate(model.bones):
+        children[bone.parent if bone.parent >= 0 else bone_count].append(i)
+
+    for i, bone in enumerate(model.bones):
+        node = {
+            "name": bone.name,
+            "translation": translations[i].tolist(),
+            "rotation": rotations[i].tolist(),
+            "scale": scales[i].tolist(),
+        }
+        if children[i]:
+            node["children"] = children[i]
+        builder.add("nodes", node)
+
+    armature_name = model.root_bone().name if bone_count else "Armature"
+    armature = builder.add("nodes", {"name": armature_name, "children": children[bone_count]})
+    scene_nodes = [armature]
+
+    mesh_names = model.mesh_names()
+    resolver = MaterialResolver(textures, model_info)
+    materials = {}
+    for name in resolver.referenced(mesh.object_name for mesh in model.meshes if mesh.name in mesh_names):
+        image = builder.add("images", {
+            "name": os.path.splitext(name)[0],
+            "mimeType": "image/png",
+            "bufferView": builder.buffer_view(np.frombuffer(textures[name], np.uint8)),
+        })
+        texture = builder.add("textures", {"source": image})
+        materials[name] = builder.add("materials", {
+            "name": os.path.splitext(name)[0],
+            "pbrMetallicRoughness": {"baseColorTexture": {"index": texture}, "metallicFactor": 0.0},
+        })
+
+    # Joints also include the armature node, the anchor of unweighted vertices
+    inverse_rest = np.linalg.inv(rest) if bone_count else rest
+    for mesh in model.meshes:
+        if mesh.name not in mesh_names:
+            continue
+
+        positions = np.ascontiguousarray(mesh.positions, np.float32)
+        normals = np.asarray(mesh.normals, np.float32)
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        normals = np.where(lengths > 0, normals / np.where(lengths > 0, lengths, 1), [0.0, 1.0, 0.0]).astype(np.float32)
+        uvs = np.array(mesh.uvs, np.float32)
+        if model.version >= 20181101:
+            uvs[:, 1] = 1.0 - uvs[:, 1]
+        faces = np.asarray(mesh.faces).ravel()
+        if len(positions) < 65536:
+            indices = builder.accessor(faces.astype(np.uint16), UNSIGNED_SHORT, "SCALAR", ELEMENT_ARRAY_BUFFER)
+        else:
+            indices = builder.accessor(faces.astype(np.uint32), UNSIGNED_INT, "SCALAR", ELEMENT_ARRAY_BUFFER)
+
+        attributes = {
+            "POSITION": builder.accessor(positions, FLOAT, "VEC3", ARRAY_BUFFER, bounds=True),
+            "NORMAL": builder.accessor(normals, FLOAT, "VEC3", ARRAY_BUFFER),
+            "TEXCOORD_0": builder.accessor(uvs, FLOAT, "VEC2", ARRAY_BUFFER),
+        }
+
+        bone_names = mesh.skin.bone_names
+        skin_bones = np.array([model.bone_index.get(i, -1) for i in bone_names], dtype=np.int64)
+        used = np.unique(skin_bones[skin_bones >= 0])
+        joint_nodes = used.tolist() + [armature]
+        joint_of_bone = np.full(len(bone_names), -1, np.int64)
+        joint_of_bone[skin_bones >= 0] = np.searchsorted(used, skin_bones[skin_bones >= 0])
+
+        for n, (joints, weights) in enumerate(skin_attributes(mesh, joint_of_bone, len(used))):
+            if len(joint_nodes) <= 256:
+                attributes["JOINTS_%d" % n] = builder.accessor(joints.astype(np.uint8), UNSIGNED_BYTE, "VEC4", ARRAY_BUFFER)
+            else:
+                attributes["JOINTS_%d" % n] = builder.accessor(joints, UNSIGNED_SHORT, "VEC4", ARRAY_BUFFER)
+            attributes["WEIGHTS_%d" % n] = builder.accessor(weights, FLOAT, "VEC4", ARRAY_BUFFER)
+
+        primitive = {"attributes": attributes, "indices": indices, "mode": 4}
+        texture_name = resolver.resolve(mesh.object_name)
+        if texture_name is not None:
+            primitive["material"] = materials[texture_name]
+
+        inverse_binds = np.concatenate((inverse_rest[used], np.eye(4)[None]))
+        skin = builder.add("skins", {
+            "joints": joint_nodes,
+            "skeleton": armature,
+            "inverseBindMatrices": builder.accessor(
+                np.ascontiguousarray(inverse_binds.transpose(0, 2, 1), np.float32), FLOAT, "MAT4"),
+        })
+        gltf_mesh = builder.add("meshes", {"name": mesh.name, "primitives": [primitive]})
+        scene_nodes.append(builder.add("nodes", {"name": mesh_names[mesh.name], "mesh": gltf_mesh, "skin": skin}))
+
+    # The keys are the bone transforms relative to the parent bone
+    for clip in model.clips:
+        if not clip.tracks:
+            continue
+        frame_count = len(next(iter(clip.tracks.values())))
+        channels = []
+        samplers = []
+        for bone_name, keys in clip.tracks.items():
+            node = model.bone_index.get(bone_name)
+            keys = keys[:frame_count]
+            if node is None or len(keys) == 0:
+                continue
+
+            times = keys[:, KEY_TIME]
+            if len(times) > 1 and not np.all(np.diff(times) > 0):
+                times = np.arange(len(keys), dtype=np.float32) / fps
+            times = np.ascontiguousarray(times - times[0], np.float32)
+            rotations = np.asarray(keys[:, KEY_ROTATION], np.float64)
+            lengths = np.linalg.norm(rotations, axis=1, keepdims=True)
+            rotations = np.where(lengths > 0, rotations / np.where(lengths > 0, lengths, 1), [0.0, 0.0, 0.0, 1.0])
+
+            time_accessor = builder.accessor(times, FLOAT, "SCALAR", bounds=True)
+            for path, values, accessor_type in (
+                ("translation", keys[:, KEY_LOCATION], "VEC3"),
+                ("rotation", rotations, "VEC4"),
+                ("scale", np.abs(keys[:, KEY_SCALE]), "VEC3"),
+            ):
+                output = builder.accessor(np.ascontiguousarray(values, np.float32), FLOAT, accessor_type)
+                channels.append({"sampler": len(samplers), "target": {"node": node, "path": path}})
+                samplers.append({"input": time_accessor, "output": output, "interpolation": "LINEAR"})
+
+        if channels:
+            builder.add("animations", {"name": clip.name, "channels": channels, "samplers": samplers})
+
+    builder.gltf["scenes"] = [{"nodes": scene_nodes}]
+    builder.gltf["scene"] = 0
+    builder.write(output_file)
@@ -0,0 +1,137 @@
+"""
+Keyframe reduction of sampled animation tracks, before any F-curve is created.
+
+Tracks hold a key on every frame for every channel. reduce_keys keeps, per
+channel, only the keys needed for the curve through them to stay within a
+tolerance of every original sample: constant channels keep a single key,
+other keys are dropped when the linear or Bezier segment between their kept
+neighbours reproduces them.
+"""
+import numpy as np
+
+REDUCTION_MODES = ["NONE", "LINEAR", "BEZIER"]
+
+
+def key_slopes(frames, values):
+    """
+    Returns the slope of every channel at every key, from the original samples:
+    central differences inside the track, one-sided at its ends.
+
+    Args:
+    - frames (numpy.ndarray): (F,) increasing key frames.
+    - values (numpy.ndarray): (F,C) key values.
+    """
+    if len(frames) < 2:
+        return np.zeros(values.shape, np.float64)
+    return np.gradient(np.asarray(values, np.float64), np.asarray(frames, np.float64), axis=0)
+
+def interpolate(frames, values, slopes, prev, next):
+    """
+    Evaluates, at every sample, the segment between the kept keys prev and next
+    around it: linear when slopes is None, otherwise the cubic Hermite matching
+    the values and slopes at both keys, i.e. a Bezier with handles a third of
+    the segment long.
+    """
+    t0, t1 = frames[prev], frames[next]
+    v0 = np.take_along_axis(values, prev, axis=0)
+    v1 = np.take_along_axis(values, next, axis=0)
+    span = t1 - t0
+    s = np.divide(frames[:, None] - t0, span, out=np.zeros(span.shape), where=span > 0)
+
+    if slopes is None:
+        return v0 + (v1 - v0) * s
+
+    m0 = np.take_along_axis(slopes, prev, axis=0) * span
+    m1 = np.take_along_axis(slopes, next, axis=0) * span
+    s2 = s * s
+    s3 = s2 * s
+    return (2 * s3 - 3 * s2 + 1) * v0 + (s3 - 2 * s2 + s) * m0 + (3 * s2 - 2 * s3) * v1 + (s3 - s2) * m1
+
+def reduce_keys(frames, values, tolerance=0.001, mode="LINEAR"):
+    """
+    Picks the keys to keep in every channel of a track.
+
+    Keys are removed in passes over the whole (F,C) track at once. Each pass
+    tries every other kept key, so that no two tried keys are neighbours, and
+    drops those whose removal keeps every original sample of the merged segment
+    within tolerance. Passes alternate between odd and even ranks until neither
+    removes anything. The first and last keys are always kept, and a constant
+    channel is left with its first key only.
+
+    Args:
+    - frames (numpy.ndarray): (F,) increasing key frames.
+    - values (numpy.ndarray): (F,C) key values, one column per channel.
+    - tolerance (float): Largest allowed difference to an original sample.
+    - mode (str): "LINEAR" or "BEZIER", the interpolation the kept keys will use.
+      Bezier keys need the handles of bezier_handles.
+
+    Returns:
+    (F,C) bool array of the keys to keep.
+    """
+    if mode not in REDUCTION_MODES[1:]:
+        raise ValueError("unknown key reduction mode %r" % mode)
+
+    frames = np.asarray(frames, np.float64)
+    values = np.asarray(values, np.float64)
+    count, channels = values.shape
+    keep = np.ones((count, channels), bool)
+    if count == 0:
+        return keep
+
+    slopes = key_slopes(frames, values) if mode == "BEZIER" else None
+    index = np.broadcast_to(np.arange(count)[:, None], keep.shape)
+    interior = np.zeros(count, bool)
+    interior[1:-1] = True
+
+    parity = 1
+    idle = 0 if count > 2 else 2
+    while idle < 2:
+        rank = np.cumsum(keep, axis=0)
+        tried = keep & interior[:, None] & (rank % 2 == parity)
+        parity ^= 1
+        if not tried.any():
+            idle += 1
+            continue
+
+        trial = keep & ~tried
+        prev = np.maximum.accumulate(np.where(trial, index, 0), axis=0)
+        next = np.minimum.accumulate(np.where(trial, index, count - 1)[::-1], axis=0)[::-1]
+        error = np.abs(values - interpolate(frames, values, slopes, prev, next))
+
+        # Largest error of each segment of the trial, channel by channel
+        flat = trial.T.ravel()
+        segment_error = np.maximum.reduceat(error.T.ravel(), np.flatnonzero(flat))
+        segment = (np.cumsum(flat) - 1).reshape(channels, count).T
+        removed = tried & (segment_error[segment] <= tolerance)
+
+        if removed.any():
+            keep &= ~removed
+            idle = 0
+        else:
+            idle += 1
+
+    constant = np.ptp(values, axis=0) <= tolerance
+    keep[1:, constant] = False
+    return keep
+
+def bezier_handles(frames, values, slopes):
+    """
+    Returns the left and right handles of kept Bezier keys, along the slope of
+    the original samples and a third of the neighbouring segment long, which
+    makes the curve the Hermite segment reduce_keys checked.
+
+    Args:
+    - frames (numpy.ndarray): (K,) frames of the kept keys of one channel.
+    - values (numpy.ndarray): (K,) their values.
+    - slopes (numpy.ndarray): (K,) their slopes, from key_slopes.
+
+    Returns:
+    Tuple of the (K,2) left and right handle coordinates.
+    """
+    frames = np.asarray(frames, np.float64)
+    values = np.asarray(values, np.float64)
+    gaps = np.diff(frames) / 3
+    left = np.concatenate((gaps[:1], gaps)) if len(gaps) else np.ones(len(frames))
+    right = np.concatenate((gaps, gaps[-1:])) if len(gaps) else np.ones(len(frames))
+    return (np.stack((frames - left, values - slopes * left), axis=1),
+            np.stack((frames + right, values + slopes * right), axis=1))
@@ -0,0 +1,50 @@
+import os
+
+
+class MaterialResolver:
+    """
+    Picks the texture of each mesh object, indexing the textures and modelInfo once.
+
+    An "*XX01" object uses the texture whose name ends with XX, otherwise the
+    first texture modelInfo lists for it, otherwise the first texture.
+    """
+
+    def __init__(self, texture_names, model_info=None):
+        self.texture_names = list(texture_names)
+        self.stems = {}
+        self.by_suffix = {}
+        for name in self.texture_names:
+            stem = os.path.splitext(name)[0]
+            self.stems.setdefault(stem, name)
+            self.by_suffix.setdefault(stem[-2:], name)
+
+        self.by_object = {}
+        if model_info is not None:
+            for material in model_info.get("material", []):
+                if material.get("texture"):
+                    self.by_object.setdefault(material.get("name"), material["texture"][0])
+
+    def resolve(self, object_name):
+        """
+        Returns the texture file name for a mesh object, None when there are no textures.
+        """
+        if not self.texture_names:
+            return None
+
+        if object_name[-2:] == "01" and object_name[-5:-3] in self.by_suffix:
+            return self.by_suffix[object_name[-5:-3]]
+
+        texture = self.by_object.get(object_name)
+        if texture is not None:
+            name = self.stems.get(texture, self.stems.get(os.path.splitext(texture)[0]))
+            if name is not None:
+                return name
+
+        return self.texture_names[0]
+
+    def referenced(self, object_names):
+        """
+        Returns the texture file names used by the given objects, in texture order.
+        """
+        used = {self.resolve(i) for i in object_names}
+        return [i for i in self.texture_names if i in used]
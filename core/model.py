@@ -0,0 +1,142 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class Skin:
+    """
+    Skin weights of a mesh held as CSR arrays: the influences of face group g
+    are bone_idx[offsets[g]:offsets[g+1]] and weight[offsets[g]:offsets[g+1]].
+    """
+    __slots__ = ("bone_names", "offsets", "bone_idx", "weight")
+    bone_names: list
+    offsets: np.ndarray
+    bone_idx: np.ndarray
+    weight: np.ndarray
+
+    @classmethod
+    def empty(cls):
+        return cls([], np.zeros(1, np.int32), np.empty(0, np.int32), np.empty(0, np.float32))
+
+
+@dataclass
+class Mesh:
+    """
+    Unindexed triangle mesh: positions, normals, uvs and face_groups_idx hold
+    one entry per vertex, faces (F,3) index into them.
+    """
+    __slots__ = ("object_name", "name", "positions", "normals", "uvs", "faces", "face_groups_idx", "skin")
+    object_name: str
+    name: str
+    positions: np.ndarray
+    normals: np.ndarray
+    uvs: np.ndarray
+    faces: np.ndarray
+    face_groups_idx: np.ndarray
+    skin: Skin
+
+
+@dataclass
+class Bone:
+    """
+    Node of the bone tree. parent is the index of the parent bone, -1 for roots.
+    matrix is the (4,4) bind matrix from the skin section, None if no skin uses the bone.
+    """
+    __slots__ = ("name", "parent", "mesh_name", "transform", "matrix")
+    name: str
+    parent: int
+    mesh_name: str
+    transform: np.ndarray
+    matrix: np.ndarray
+
+
+@dataclass
+class Clip:
+    """
+    Animation clip. tracks maps a bone name to its (n,11) float32 keys
+    (time, scale, rotation xyzw, location), None until the clip is loaded.
+    offset and size give its byte range in the .ymd.
+    """
+    __slots__ = ("name", "offset", "size", "bone_count", "frame_count", "stride", "tracks")
+    name: str
+    offset: int
+    size: int
+    bone_count: int
+    frame_count: int
+    stride: int
+    tracks: dict
+
+    @classmethod
+    def from_catalog(cls, entry):
+        """
+        Rebuilds an unloaded clip from an entry of Model.clip_catalog.
+        """
+        return cls(entry["name"], entry["offset"], entry["size"], entry["bone_count"], entry["frame_count"], entry["stride"], None)
+
+
+@dataclass
+class Sections:
+    """
+    Byte offsets of the sections of a .ymd, as found by index_sections.
+    """
+    __slots__ = ("version", "meshes", "skins", "bones", "bone_count", "clips")
+    version: int
+    meshes: list
+    skins: list
+    bones: int
+    bone_count: int
+    clips: list
+
+
+@dataclass
+class Model:
+    """
+    Parsed .ymd. bone_index maps a bone name to its index in bones.
+    """
+    __slots__ = ("version", "meshes", "bones", "bone_index", "clips")
+    version: int
+    meshes: list
+    bones: list
+    bone_index: dict
+    clips: list
+
+    def mesh_names(self):
+        """
+        Returns a dict of mesh name to the bone it is attached to.
+        """
+        return {bone.mesh_name: bone.name for bone in self.bones if bone.mesh_name}
+
+    def bone_tree(self):
+        """
+        Returns the bone hierarchy as nested {name: {child: {...}}} dicts.
+        """
+        tree = {}
+        nodes = []
+        for bone in self.bones:
+            node = {}
+            nodes.append(node)
+            (nodes[bone.parent] if bone.parent >= 0 else tree)[bone.name] = node
+        return tree
+
+    def root_bone(self):
+        """
+        Returns the first root bone, which names the armature.
+        """
+        return next(bone for bone in self.bones if bone.parent < 0)
+
+    def clip_catalog(self):
+        """
+        Returns the JSON-able description of every clip: name, byte range, bone and
+        frame counts and key stride, enough to rebuild it with Clip.from_catalog and
+        load it later with load_clip. "loaded" tells whether its tracks are decoded.
+        """
+        return [{
+            "name": clip.name,
+            "offset": clip.offset,
+            "size": clip.size,
+            "bone_count": clip.bone_count,
+            "frame_count": clip.frame_count,
+            "stride": clip.stride,
+            "loaded": clip.tracks is not None,
+        } for clip in self.clips]
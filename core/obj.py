@@ -0,0 +1,133 @@
+import os
+
+import numpy as np
+
+from .materials import MaterialResolver
+from .weld import weld_rows
+
+OBJ_MODES = ["split", "single"]
+
+# Rows formatted per write, bounds the size of the text buffer
+CHUNK_ROWS = 1 << 16
+
+
+def write_rows(obj_file, line, array, chunk_rows=CHUNK_ROWS):
+    """
+    Writes one formatted line per row of array, formatting a whole chunk with a single % operation.
+
+    Args:
+    - obj_file (file): Text file to write to.
+    - line (str): Format of one row, e.g. "v %f %f %f\\n".
+    - array (numpy.ndarray): (N,C) rows, C matching the placeholders of line.
+    - chunk_rows (int): Rows per write.
+    """
+    array = np.asarray(array)
+    for start in range(0, len(array), chunk_rows):
+        chunk = array[start:start + chunk_rows]
+        obj_file.write((line * len(chunk)) % tuple(chunk.ravel().tolist()))
+
+def material_name(mesh):
+    """
+    Returns the material of a mesh. Meshes of different objects often share a
+    name but not a texture, so the object is part of it.
+    """
+    return "%s_%s" % (mesh.object_name, mesh.name)
+
+def write_mtl(file_name, materials):
+    """
+    Writes the materials the usemtl lines of an .obj name.
+
+    Args:
+    - file_name (str): Path of the .mtl.
+    - materials (dict): Material name to its texture path relative to the .mtl, or None.
+    """
+    with open(file_name, 'w', encoding='utf-8') as mtl_file:
+        for name, texture in materials.items():
+            mtl_file.write("newmtl %s\nKa 1.000000 1.000000 1.000000\nKd 1.000000 1.000000 1.000000\nKs 0.000000 0.000000 0.000000\nd 1.000000\nillum 1\n" % name)
+            if texture is not None:
+                mtl_file.write("map_Kd %s\n" % texture)
+            mtl_file.write("\n")
+
+def write_mesh(obj_file, mesh, base, weld=False, chunk_rows=CHUNK_ROWS):
+    """
+    Writes one mesh as an o/g/usemtl group.
+
+    Args:
+    - obj_file (file): Text file to write to.
+    - mesh (Mesh): Parsed mesh.
+    - base (int): Number of vertices already written to the file.
+    - weld (bool): Merge vertices with equal position, uv and normal.
+
+    Returns:
+    Number of vertices written.
+    """
+    positions, uvs, normals, faces = mesh.positions, mesh.uvs, mesh.normals, mesh.faces
+    if weld:
+        keep, remap = weld_rows(positions, uvs, normals)
+        positions, uvs, normals, faces = positions[keep], uvs[keep], normals[keep], remap[faces]
+
+    obj_file.write("o %s\ng %s\nusemtl %s\n" % (mesh.object_name, mesh.name, material_name(mesh)))
+    write_rows(obj_file, "v %f %f %f\n", positions, chunk_rows)
+    write_rows(obj_file, "vt %f %f\n", uvs, chunk_rows)
+    write_rows(obj_file, "vn %f %f %f\n", normals, chunk_rows)
+
+    # v, vt and vn share one index per vertex
+    indices = np.repeat(np.asarray(faces, np.int64) + (base + 1), 3, axis=1)
+    write_rows(obj_file, "f %d/%d/%d %d/%d/%d %d/%d/%d\n", indices, chunk_rows)
+    return len(positions)
+
+def write_obj(model, output_path, mode="split", weld=False, textures=None, model_info=None, chunk_rows=CHUNK_ROWS):
+    """
+    Writes mesh data to .obj files based on the parsed model. Every .obj gets an
+    .mtl of the same name defining its materials, one per mesh named by
+    material_name, textured with the texture MaterialResolver picks, expected
+    next to the .obj files.
+
+    Args:
+    - model (Model): Parsed .ymd.
+    - output_path (str): Path to the directory where the .obj files will be written.
+    - mode (str): "split" for one <object>_<mesh>.obj per mesh, "single" for every mesh in model.obj.
+    - weld (bool): Write indexed vertices, merging those with equal position, uv and normal.
+    - textures (iterable): Texture file names of the archive, None for untextured materials.
+    - model_info (dict): Parsed modelInfo.txt, used to pick the textures.
+    - chunk_rows (int): Rows formatted per write.
+
+    Returns:
+    List of the written file paths.
+    """
+    if mode not in OBJ_MODES:
+        raise ValueError("unknown OBJ mode %r" % mode)
+
+    os.makedirs(output_path, exist_ok=True)
+    resolver = MaterialResolver(textures or [], model_info)
+
+    def materials(meshes, file_name):
+        textures = {}
+        for mesh in meshes:
+            texture = resolver.resolve(mesh.object_name)
+            if texture is not None:
+                texture = os.path.relpath(os.path.join(output_path, texture), os.path.dirname(file_name)).replace(os.sep, "/")
+            textures[material_name(mesh)] = texture
+        return textures
+
+    if mode == "single":
+        file_name = os.path.join(output_path, "model.obj")
+        write_mtl(os.path.splitext(file_name)[0] + ".mtl", materials(model.meshes, file_name))
+        with open(file_name, 'w', encoding='utf-8', buffering=1 << 20) as obj_file:
+            obj_file.write("mtllib model.mtl\n")
+            base = 0
+            for mesh in model.meshes:
+                base += write_mesh(obj_file, mesh, base, weld, chunk_rows)
+        return [file_name]
+
+    file_names = []
+    for mesh in model.meshes:
+        file_name = os.path.join(output_path, "%s_%s.obj" % (mesh.object_name, mesh.name))
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        mtl_name = os.path.splitext(file_name)[0] + ".mtl"
+        write_mtl(mtl_name, materials([mesh], file_name))
+        with open(file_name, 'w', encoding='utf-8', buffering=1 << 20) as obj_file:
+            obj_file.write("mtllib %s\n" % os.path.basename(mtl_name))
+            write_mesh(obj_file, mesh, 0, weld, chunk_rows)
+        file_names.append(file_name)
+    return file_names
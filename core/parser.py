@@ -0,0 +1,680 @@
+import fnmatch
+import mmap
+import os
+
+import numpy as np
+
+from .model import Bone, Clip, Mesh, Model, Sections, Skin
+from .schema import AURA_MATERIAL_STRINGS, AURA_MOTION_KEY, INFLUENCE, INT, KEY, MATRIX, TRANSFORM, VERTEX
+from .timing import stage
+
+versions = [
+    20158017,
+    20181101
+]
+
+patterns = ["geometries", "skin","sikn"]
+
+# Bump when the parsed output changes, invalidates the parse cache
+PARSER_VERSION = 3
+
+# Columns of a decoded keyframe row
+KEY_TIME = KEY.column("time").start
+KEY_SCALE = KEY.column("scale")
+KEY_ROTATION = KEY.column("rotation")
+KEY_LOCATION = KEY.column("location")
+
+# Largest time between two keys, in seconds, believed when a track has only two (24 fps)
+MAX_KEY_STEP = 1 / 24 + 1e-4
+
+
+class Reader:
+    """
+    Cursor over a .ymd held in memory or memory-mapped, with the read, seek and
+    tell of a binary file. Ints are decoded in place with unpack_from and
+    read returns memoryview slices; blocks of records are viewed with
+    Record.array, so they reach NumPy without a copy.
+    Arrays taken from the buffer keep it alive, a mapping included.
+    """
+
+    def __init__(self, buffer):
+        self.view = memoryview(buffer).cast("B")
+        self.offset = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __len__(self):
+        return len(self.view)
+
+    def tell(self):
+        return self.offset
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.offset
+        elif whence == 2:
+            offset += len(self.view)
+        self.offset = offset
+        return offset
+
+    def read(self, size=-1):
+        start = self.offset
+        self.offset = len(self.view) if size < 0 else min(start + size, len(self.view))
+        return self.view[start:self.offset]
+
+    def read_int(self):
+        value = INT.struct.unpack_from(self.view, self.offset)[0]
+        self.offset += 4
+        return value
+
+    def read_string(self):
+        length = self.read_int()
+        return str(self.read(length), "utf-8")
+
+def open_source(source):
+    """
+    Returns a Reader over a .ymd given as a path, which is memory-mapped, or as its contents.
+    """
+    if isinstance(source, Reader):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        return Reader(source)
+    with open(source, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return Reader(b"")
+        return Reader(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+def read_int(data):
+    return data.read_int()
+
+def read_string(data):
+    return data.read_string()
+
+def get_geometries(data,a_mesh_length):
+    """
+    Extracts mesh geometries from binary data.
+
+    Args:
+    - data (Reader): Binary data stream.
+    - a_mesh_length (int): Size in bytes of one vertex record.
+
+    Returns:
+    Tuple containing positions (N,3), uvs (N,2), normals (N,3), faces (N/3,3) and face_groups_idx (N,) arrays.
+    """
+    # Get mesh data
+    mesh_length = read_int(data)
+    if mesh_length <= 0:
+        return (np.empty((0, 3), np.float32), np.empty((0, 2), np.float32), np.empty((0, 3), np.float32),
+                np.empty((0, 3), np.int32), np.empty(0, np.int32))
+
+    # The interleaved records are split into one contiguous array per attribute
+    block = VERTEX.padded(a_mesh_length).array(data, mesh_length)
+    positions = np.ascontiguousarray(block["position"], dtype=np.float32)
+    normals = np.ascontiguousarray(block["normal"], dtype=np.float32)
+    uvs = np.ascontiguousarray(block["uv"], dtype=np.float32)
+
+    # Create triangle according to number of faces
+    faces_count = read_int(data)
+    faces = np.arange(faces_count - faces_count % 3, dtype=np.int32).reshape(-1, 3)
+
+    face_groups_idx = INT.array(data, faces_count).astype(np.int32, copy=False)
+
+    return positions, uvs, normals, faces, face_groups_idx
+
+def skip_geometries(data, a_mesh_length):
+    """
+    Seeks past a geometry block without decoding it.
+    """
+    mesh_length = read_int(data)
+    if mesh_length > 0:
+        data.seek(mesh_length * a_mesh_length, 1)
+        data.seek(read_int(data) * 4, 1)
+
+def read_mesh_header(data, i):
+    """
+    Reads a mesh record up to its geometry block. Records holding several
+    geometry blocks only keep the last one, the others are skipped.
+
+    Args:
+    - data (Reader): Binary data stream, at the start of the record.
+    - i (int): Index of the mesh, used to name unnamed meshes.
+
+    Returns:
+    Tuple containing the object name, the mesh name and the vertex record size.
+    """
+    mesh_name = "unnamed_mesh_" + str(i)
+    mesh_lentgh = read_int(data)
+
+    if mesh_lentgh == 1:
+        data.seek(4, 1)
+        object_name = read_string(data)
+        a_mesh_length = read_int(data)
+    else:
+        mesh_name = str(data.read(mesh_lentgh), "utf-8")
+        loop_count = read_int(data)
+        for j in range(loop_count - 1):
+            data.seek(8, 1)
+            object_name = read_string(data)
+            skip_geometries(data, read_int(data))
+        data.seek(8, 1)
+        object_name = read_string(data)
+        a_mesh_length = read_int(data)
+
+    return object_name, mesh_name, a_mesh_length
+
+def read_face_groups(data):
+    """
+    Reads the skin influence groups of a mesh as CSR arrays.
+
+    The groups only walk their counts; the (bone, weight) pairs are then
+    gathered from one int32 view of the whole block.
+
+    Args:
+    - data (Reader): Binary data stream.
+
+    Returns:
+    Tuple of offsets (G+1,), bone_idx and weight arrays; the influences of group g are offsets[g]:offsets[g+1].
+    """
+    start = data.tell()
+    counts = []
+    for i in range(read_int(data)):
+        count = read_int(data)
+        counts.append(count)
+        INFLUENCE.skip(data, count)
+
+    offsets = np.zeros(len(counts) + 1, np.int32)
+    np.cumsum(counts, out=offsets[1:])
+
+    # Influence k of group g sits after the block count, the g + 1 group counts and k pairs
+    words = np.frombuffer(data.view, INT.dtype, (data.tell() - start) // INT.size, start)
+    groups = np.repeat(np.arange(len(counts)), counts)
+    pairs = 2 + groups + 2 * np.arange(offsets[-1])
+    return offsets, words[pairs].astype(np.int32), words[pairs + 1].view(np.float32)
+
+def skip_face_groups(data):
+    for i in range(read_int(data)):
+        INFLUENCE.skip(data, read_int(data))
+
+def group_influences(skin):
+    """
+    Returns the CSR face groups of a skin with zero weights dropped and the
+    weights of a bone listed twice in a group summed. Work is done per group,
+    of which there are far fewer than vertices.
+
+    Returns:
+    Tuple of the offsets, bone index and weight arrays, as in Skin.
+    """
+    offsets = skin.offsets
+    groups = len(offsets) - 1
+    group = np.repeat(np.arange(groups, dtype=np.int64), np.diff(offsets))
+    keep = skin.weight != 0
+    group, bone_idx, weight = group[keep], skin.bone_idx[keep], skin.weight[keep]
+
+    # One int64 key per (group, bone) pair, repeated keys are repeated bones
+    bone_count = int(bone_idx.max()) + 1 if len(bone_idx) else 1
+    keys, inverse = np.unique(group * bone_count + bone_idx, return_inverse=True)
+    if len(keys) != len(group):
+        weight = np.bincount(inverse.ravel(), weights=weight, minlength=len(keys)).astype(np.float32)
+        group, bone_idx = keys // bone_count, (keys % bone_count).astype(np.int32)
+
+    offsets = np.zeros(groups + 1, np.int64)
+    np.cumsum(np.bincount(group, minlength=groups), out=offsets[1:])
+    return offsets, bone_idx, weight
+
+def vertex_influences(skin, face_groups_idx):
+    """
+    Expands CSR face groups to one (vertex, bone, weight) entry per influence.
+    Zero weights are dropped and repeated bones of a vertex are summed.
+
+    Args:
+    - skin (Skin): CSR skin of the mesh.
+    - face_groups_idx (numpy.ndarray): Face group index of each vertex.
+
+    Returns:
+    Tuple of vertex index, bone index and weight arrays.
+    """
+    if len(skin.offsets) < 2 or len(face_groups_idx) == 0:
+        return np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.float32)
+
+    offsets, bone_idx, weight = group_influences(skin)
+    starts = offsets[face_groups_idx]
+    counts = offsets[face_groups_idx + 1] - starts
+    total = int(counts.sum())
+
+    vertices = np.repeat(np.arange(len(face_groups_idx), dtype=np.int32), counts)
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    influence = np.repeat(starts, counts) + np.arange(total) - first
+    return vertices, bone_idx[influence], weight[influence]
+
+def read_skin_header(data):
+    """
+    Reads the mesh name and bone count of a skin block. Some blocks carry
+    64 extra bytes before the bone count, detected by an implausible count.
+    """
+    object_name = read_string(data)
+    tmp = data.tell()
+    bone_length = read_int(data)
+    if bone_length > 100:
+        data.seek(tmp + 64)
+        bone_length = read_int(data)
+    return object_name, bone_length
+
+def read_skin(data, matrices, weights=True):
+    """
+    Reads a skin block: the bind matrix of each bone and the face groups.
+
+    Args:
+    - data (Reader): Binary data stream, at the start of the block.
+    - matrices (dict): Receives the (4,4) bind matrix of each bone name.
+    - weights (bool): Decode the face groups, otherwise they are skipped.
+
+    Returns:
+    Tuple containing the mesh name and its Skin (None if skipped).
+    """
+    object_name, bone_length = read_skin_header(data)
+
+    bone_names = []
+    for j in range(bone_length):
+        bone_name = read_string(data)
+        bone_names.append(bone_name)
+        matrices[bone_name] = MATRIX.values(data).reshape(4, 4)
+
+    if not weights:
+        skip_face_groups(data)
+        return object_name, None
+
+    return object_name, Skin(bone_names, *read_face_groups(data))
+
+def read_bone(data, bones, bone_index):
+    """
+    Reads one node of the bone tree and appends it to bones.
+    A bone whose parent is unknown is added as a root.
+    """
+    bone_name = read_string(data)
+    next_bone_name_length = read_int(data)
+    parent = -1
+    if next_bone_name_length != 0:
+        parent = bone_index.get(str(data.read(next_bone_name_length), "utf-8"), -1)
+
+    mesh_name = None
+    if read_int(data) != 0:
+        mesh_name = read_string(data)
+    transform = TRANSFORM.values(data)
+
+    bone = Bone(bone_name, parent, mesh_name, transform, None)
+    bone_index[bone_name] = len(bones)
+    bones.append(bone)
+    return bone
+
+def skip_bone(data):
+    """
+    Seeks past one node of the bone tree without decoding it.
+    """
+    data.seek(read_int(data), 1)
+    data.seek(read_int(data), 1)
+    if read_int(data) != 0:
+        data.seek(read_int(data), 1)
+    TRANSFORM.skip(data)
+
+def detect_key_stride(data, key_count, max_stride=128):
+    """
+    Finds the length, in floats, of one keyframe record of a track.
+
+    The time of each key is the first float of its record, so the stride is
+    the smallest offset at which the times read as evenly spaced increasing
+    values. Two keys give a single step, which padding floats can fake, so
+    it must also be a plausible frame step, at most MAX_KEY_STEP. A single
+    key has no step to measure, so it falls back to the smallest record, 12
+    floats, rather than guessing from the bytes after it, which belong to the
+    next track.
+
+    Args:
+    - data (bytes): Track data, starting at the first key.
+    - key_count (int): Number of keys in the track.
+    - max_stride (int): Largest stride considered.
+
+    Returns:
+    Stride in floats, at least 12.
+    """
+    rows = min(key_count, 8)
+    if rows < 2:
+        return KEY.size // 4
+
+    values = np.frombuffer(data, dtype="<f4", count=len(data) // 4).astype(np.float64)
+    strides = np.arange(KEY.size // 4, max_stride + 1)
+    strides = strides[strides * (rows - 1) < len(values)]
+    times = values[strides[:, None] * np.arange(rows)]
+    steps = np.diff(times, axis=1)
+    increasing = np.all(steps > 0, axis=1)
+    if rows == 2:
+        increasing &= steps[:, 0] <= MAX_KEY_STEP
+    even = increasing & np.all(np.abs(steps - steps[:, :1]) <= 1e-3 * np.abs(steps[:, :1]) + 1e-6, axis=1)
+    for found in (even, increasing):
+        if found.any():
+            return int(strides[np.argmax(found)])
+    return KEY.size // 4
+
+def key_record_length(data, key_count, stride=None):
+    """
+    Returns the record length, in floats, of the track at the current position.
+
+    Args:
+    - data (Reader): Binary data stream, at the first key.
+    - key_count (int): Number of keys in the track.
+    - stride (int): Record length found for an earlier track of the same clip, or None.
+
+    Returns:
+    Tuple of the record length of this track and the stride to reuse for the next track.
+    """
+    if stride is not None:
+        return stride, stride
+    if key_count <= 0:
+        return 0, None
+
+    tmp = data.tell()
+    record_length = detect_key_stride(data.read(8 * 128 * 4), key_count)
+    data.seek(tmp)
+
+    # One or two keys cannot confirm the stride, so only remember it from longer tracks
+    return record_length, record_length if key_count >= 3 else None
+
+def read_keys(data, key_count, stride=None):
+    """
+    Reads every keyframe of a track in one strided read.
+
+    Args:
+    - data (Reader): Binary data stream, at the first key.
+    - key_count (int): Number of keys in the track.
+    - stride (int): Record length in floats found for an earlier track of the same clip, or None.
+
+    Returns:
+    Tuple of the (n,11) float32 keys (time, scale, rotation xyzw, location) and the stride to reuse for the next track.
+    """
+    if key_count <= 0:
+        return np.empty((0, 11), np.float32), stride
+
+    record_length, stride = key_record_length(data, key_count, stride)
+    keys = KEY.padded(record_length * 4).array(data, key_count).view("<f4").reshape(key_count, record_length)
+    return np.ascontiguousarray(keys[:, :KEY_LOCATION.stop], dtype=np.float32), stride
+
+def load_clip(data, clip):
+    """
+    Decodes the tracks of a clip recorded by index_sections into clip.tracks.
+
+    Returns:
+    Dict of bone name to its (n,11) keys.
+    """
+    data.seek(clip.offset)
+    if read_string(data) != clip.name:
+        raise ValueError("clip %r is not at offset %d" % (clip.name, clip.offset))
+    data.seek(4, 1)
+
+    tracks = {}
+    stride = clip.stride
+    for j in range(read_int(data)):
+        bone_name = read_string(data)
+        tracks[bone_name], stride = read_keys(data, read_int(data), stride)
+
+    clip.tracks = tracks
+    return tracks
+
+def select_clips(clips, clip_names):
+    """
+    Returns the clips whose name matches one of clip_names, given as names or
+    fnmatch patterns like "attack*". None selects every clip.
+    """
+    if clip_names is None:
+        return list(clips)
+    return [clip for clip in clips if any(fnmatch.fnmatchcase(clip.name, i) for i in clip_names)]
+
+def index_sections(data):
+    """
+    Records where each section of a .ymd starts, in one pass that seeks over
+    the bulk data instead of decoding it.
+
+    Args:
+    - data (Reader): Binary data stream.
+
+    Returns:
+    Sections, or None if no geometry section is found. Its clips are not loaded yet.
+    """
+    data.seek(0)
+    ver = read_int(data)
+    data.seek(0)
+    # Read the first 300 bytes of the file
+    head = bytes(data.read(300))
+
+    geometrie_offset = None
+    for pattern in patterns:
+        pos = head.find(pattern.encode())
+        if pos >= 0:
+            geometrie_offset = pos - 8
+            break
+    if geometrie_offset is None:
+        return None
+
+    sections = Sections(ver, [], [], 0, 0, [])
+
+    data.seek(geometrie_offset)
+    for i in range(read_int(data)):
+        sections.meshes.append(data.tell())
+        object_name, mesh_name, a_mesh_length = read_mesh_header(data, i)
+        skip_geometries(data, a_mesh_length)
+
+    for i in range(read_int(data)):
+        sections.skins.append(data.tell())
+        object_name, bone_length = read_skin_header(data)
+        for j in range(bone_length):
+            data.seek(read_int(data) + MATRIX.size, 1)
+        skip_face_groups(data)
+
+    sections.bone_count = read_int(data)
+    sections.bones = data.tell()
+    for i in range(sections.bone_count):
+        skip_bone(data)
+
+    for i in range(read_int(data)):
+        offset = data.tell()
+        name = read_string(data)
+        data.seek(4, 1)
+        bone_count = read_int(data)
+        frame_count = 0
+        stride = None
+        for j in range(bone_count):
+            data.seek(read_int(data), 1)
+            key_count = read_int(data)
+            if j == 0:
+                frame_count = key_count
+            record_length, stride = key_record_length(data, key_count, stride)
+            data.seek(key_count * record_length * 4, 1)
+        data.seek(4, 1)
+        sections.clips.append(Clip(name, offset, data.tell() - offset, bone_count, frame_count, stride, None))
+
+    return sections
+
+def read_meshes(data, sections, weights=True, stats=None):
+    """
+    Decodes the meshes and skin blocks of a .ymd.
+
+    Args:
+    - data (Reader): Binary data stream.
+    - sections (Sections): Section offsets returned by index_sections.
+    - weights (bool): Decode the meshes and their skins, otherwise only the bind matrices are read.
+    - stats (Stats): Receives the "meshes" and "skins" stages.
+
+    Returns:
+    Tuple of the list of Mesh and the dict of bone name to bind matrix.
+    """
+    meshes = {}
+    by_name = {}
+    if weights:
+        with stage(stats, "meshes") as measures:
+            for i, offset in enumerate(sections.meshes):
+                data.seek(offset)
+                object_name, mesh_name, a_mesh_length = read_mesh_header(data, i)
+                positions, uvs, normals, faces, face_groups_idx = get_geometries(data,a_mesh_length)
+                measures["bytes"] += data.tell() - offset
+                measures["count"] += len(positions)
+
+                mesh = meshes.get((object_name, mesh_name))
+                if mesh is not None:
+                    # Geometry split across several records of the same mesh
+                    mesh.faces = np.concatenate((mesh.faces, faces + len(mesh.positions)))
+                    mesh.positions = np.concatenate((mesh.positions, positions))
+                    mesh.uvs = np.concatenate((mesh.uvs, uvs))
+                    mesh.normals = np.concatenate((mesh.normals, normals))
+                    mesh.face_groups_idx = np.concatenate((mesh.face_groups_idx, face_groups_idx))
+                else:
+                    mesh = Mesh(object_name, mesh_name, positions, normals, uvs, faces, face_groups_idx, Skin.empty())
+                    meshes[(object_name, mesh_name)] = mesh
+                    by_name.setdefault(mesh_name, mesh)
+
+    # The bind matrices are needed for the skeleton, the weights only with meshes
+    matrices = {}
+    with stage(stats, "skins") as measures:
+        for offset in sections.skins:
+            data.seek(offset)
+            mesh_name, skin = read_skin(data, matrices, weights)
+            measures["bytes"] += data.tell() - offset
+            if mesh_name in by_name:
+                by_name[mesh_name].skin = skin
+                measures["count"] += len(skin.bone_idx)
+
+    return list(meshes.values()), matrices
+
+def read_bones(data, sections, matrices):
+    """
+    Decodes the bone tree into a list of Bone and a name to index dict.
+    """
+    bones, bone_index = [], {}
+    data.seek(sections.bones)
+    for i in range(sections.bone_count):
+        bone = read_bone(data, bones, bone_index)
+        bone.matrix = matrices.get(bone.name)
+    return bones, bone_index
+
+def parse_ymd(source, load_meshes=True, clip_names=None, stats=None):
+    """
+    Parses a .ymd without Blender.
+
+    Args:
+    - source (str or bytes): Path to the .ymd file, or its contents.
+    - load_meshes (bool): Decode the meshes and their weights, otherwise only the skeleton is read.
+    - clip_names (list): Names or patterns of the animation clips to decode, None for all of them.
+      The other clips are listed with tracks set to None and can be loaded later with load_clip.
+    - stats (Stats): Receives the timing of each section.
+
+    Returns:
+    Model, or None if the file has no geometry section.
+    """
+    with open_source(source) as data:
+        with stage(stats, "index") as measures:
+            sections = index_sections(data)
+            measures["bytes"] = data.tell()
+        if sections is None:
+            return None
+
+        meshes, matrices = read_meshes(data, sections, load_meshes, stats)
+        with stage(stats, "bones", count=sections.bone_count):
+            bones, bone_index = read_bones(data, sections, matrices)
+
+        with stage(stats, "clips") as measures:
+            for clip in select_clips(sections.clips, clip_names):
+                load_clip(data, clip)
+                measures["bytes"] += clip.size
+                measures["count"] += sum(len(i) for i in clip.tracks.values())
+
+    return Model(sections.version, meshes, bones, bone_index, sections.clips)
+
+def read_shape(data):
+    """
+    Reads one shape of an aura file: 48-byte vertex records laid out like the
+    geometry blocks of the main file, then one int per vertex.
+
+    Returns:
+    Tuple containing the Mesh and the name of its material.
+    """
+    shape_name = read_string(data)
+    data.seek(12, 1)
+    material_name = read_string(data)
+    data.seek(4, 1)
+    count = read_int(data)
+
+    block = VERTEX.padded(48).array(data, count)
+    positions = np.ascontiguousarray(block["position"], dtype=np.float32)
+    normals = np.ascontiguousarray(block["normal"], dtype=np.float32)
+    uvs = np.ascontiguousarray(block["uv"], dtype=np.float32)
+    face_groups_idx = INT.array(data, count).astype(np.int32, copy=False)
+    data.seek(4, 1)
+
+    faces = np.arange(count - count % 3, dtype=np.int32).reshape(-1, 3)
+    return Mesh(material_name, shape_name, positions, normals, uvs, faces, face_groups_idx, Skin.empty()), material_name
+
+def load_aura(file_path):
+    """
+    Decodes an aura effect file: textured shapes, a bone tree attaching them and one clip.
+
+    Args:
+    - file_path (str or bytes): Path to the aura .ymd, or its contents.
+
+    Returns:
+    Tuple containing the Model, whose meshes are the shapes and whose bones carry
+    the shape they show in mesh_name, and a dict of shape name to texture name.
+    """
+    bones = []
+    bone_index = {}
+    meshes = []
+    shape_textures = {}
+
+    with open_source(file_path) as file:
+        v = read_int(file)
+        # material
+        textures = {}
+        strings = AURA_MATERIAL_STRINGS.get(v, AURA_MATERIAL_STRINGS[20158017])
+        for i in range(read_int(file)):
+            header = {field: read_string(file) for field in strings}
+            name = header["name"]
+
+            if read_int(file) != 1:
+                read_string(file)
+            textures[name] = read_string(file)
+            for j in range(read_int(file)):
+                file.seek(4, 1)
+                read_string(file)
+                read_string(file)
+
+        # shapes
+        for i in range(read_int(file)):
+            mesh, material_name = read_shape(file)
+            meshes.append(mesh)
+            if material_name in textures:
+                shape_textures[mesh.name] = textures[material_name]
+
+        #structure
+        file.seek(4, 1)
+        for i in range(read_int(file)):
+            read_bone(file, bones, bone_index)
+        file.seek(4, 1)
+
+        # animation
+        offset = file.tell()
+        clip_name = read_string(file)
+        file.seek(4, 1)
+        tracks = {}
+        stride = None
+        for i in range(read_int(file)):
+            name = read_string(file)
+            tracks[name], stride = read_keys(file, read_int(file), stride)
+        frame_count = max((len(i) for i in tracks.values()), default=0)
+        clip = Clip(clip_name, offset, file.tell() - offset, len(tracks), frame_count, stride, tracks)
+
+        # animation??? (9 floats per key, unused)
+        for i in range(read_int(file)):
+            read_string(file)
+            AURA_MOTION_KEY.skip(file, read_int(file))
+
+    return Model(v, meshes, bones, bone_index, [clip]), shape_textures
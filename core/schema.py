@@ -0,0 +1,122 @@
+"""
+Fixed-size records of the .ymd format, declared once and shared by the main
+loader, the aura loader and the synthetic writer.
+
+A Record lists its fields as (name, format, shape) and is compiled to a NumPy
+dtype, used to view blocks of records in place, and to a struct.Struct for
+single records packed or unpacked as Python values. Records whose size varies between
+files (vertex records, keyframes) are declared with their known fields and
+padded per file with Record.padded, which is cached.
+"""
+import functools
+import struct
+
+import numpy as np
+
+
+def field_shape(shape):
+    return shape if isinstance(shape, tuple) else (shape,)
+
+class Record:
+    """
+    Fixed-size record. A single unnamed field gives a plain (possibly
+    subarray) dtype, named fields give a structured dtype.
+    """
+
+    def __init__(self, fields, itemsize=None):
+        self.fields = tuple((field[0], field[1], field_shape(field[2] if len(field) > 2 else ())) for field in fields)
+
+        names, formats, offsets, codes = [], [], [], []
+        offset = 0
+        for name, fmt, shape in self.fields:
+            dtype = np.dtype(fmt)
+            names.append(name)
+            formats.append((dtype, shape) if shape else dtype)
+            offsets.append(offset)
+            count = int(np.prod(shape)) if shape else 1
+            codes.append("%d%s" % (count, dtype.char))
+            offset += dtype.itemsize * count
+
+        self.size = itemsize or offset
+        if self.size < offset:
+            raise ValueError("record of %d bytes cannot hold %d bytes of fields" % (self.size, offset))
+
+        if len(self.fields) == 1 and names[0] is None and self.size == offset:
+            self.dtype = np.dtype(formats[0])
+        else:
+            self.dtype = np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": self.size})
+        self.offsets = dict(zip(names, offsets))
+
+        # Records made of one scalar type, packed, can also be read as a flat array of values
+        scalars = {np.dtype(fmt) for name, fmt, shape in self.fields}
+        self.scalar = scalars.pop() if len(scalars) == 1 and self.size == offset else None
+        self.struct = struct.Struct("<" + "".join(codes) + ("%dx" % (self.size - offset) if self.size > offset else ""))
+
+    @functools.lru_cache(maxsize=None)
+    def padded(self, itemsize):
+        """
+        Returns the same fields in a record of itemsize bytes.
+        """
+        return Record(self.fields, itemsize)
+
+    def column(self, name, width=4):
+        """
+        Returns the slice of a field in a row of width-byte columns, e.g. the floats of a keyframe.
+        """
+        name, fmt, shape = next(i for i in self.fields if i[0] == name)
+        count = int(np.prod(shape)) if shape else 1
+        start = self.offsets[name] // width
+        return slice(start, start + count * np.dtype(fmt).itemsize // width)
+
+    def array(self, data, count):
+        """
+        Returns count records at the position of a Reader as a read-only view and moves past them.
+        """
+        array = np.frombuffer(data.view, self.dtype, count, data.offset)
+        data.offset += count * self.size
+        return array
+
+    def values(self, data):
+        """
+        Returns one record at the position of a Reader as a flat view of its values and moves past it.
+        Only for records whose fields share one scalar type.
+        """
+        values = np.frombuffer(data.view, self.scalar, self.size // self.scalar.itemsize, data.offset)
+        data.offset += self.size
+        return values
+
+    def skip(self, data, count=1):
+        data.seek(count * self.size, 1)
+
+    def zeros(self, count):
+        """
+        Returns count zeroed records, to be filled by field and written with tobytes.
+        """
+        return np.zeros(count, self.dtype)
+
+
+INT = Record([(None, "<i4")])
+
+# Vertex record of the geometry blocks and aura shapes, padded to its size in the file
+VERTEX = Record([("position", "<f4", 3), ("normal", "<f4", 3), ("uv", "<f4", 2)])
+
+# One skin influence of a face group
+INFLUENCE = Record([("bone_idx", "<i4"), ("weight", "<f4")])
+
+# Bind matrix of a bone in a skin block
+MATRIX = Record([(None, "<f4", (4, 4))])
+
+# Rest transform of a node of the bone tree
+TRANSFORM = Record([("scale", "<f4", 3), ("rotation", "<f4", 4), ("location", "<f4", 3)])
+
+# Keyframe of an animation track, rotation as xyzw. Files pad it to a stride of at least 12 floats
+KEY = Record([("time", "<f4"), ("scale", "<f4", 3), ("rotation", "<f4", 4), ("location", "<f4", 3)], 48)
+
+# Key of the second, unused, animation block of aura files
+AURA_MOTION_KEY = Record([(None, "<f4", 9)])
+
+# Strings opening a material of an aura file, per version
+AURA_MATERIAL_STRINGS = {
+    20158017: ("name",),
+    20181101: ("name", "extra"),
+}
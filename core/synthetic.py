@@ -0,0 +1,311 @@
+"""
+Synthetic .ymd and .ez files, laid out the way the parser reads them, for
+benchmarks and for trying the importer without game assets.
+
+    python -m core.synthetic OUTPUT.ymd|OUTPUT.ez [--version V] [--meshes N] [--vertices N] [--bones N]
+                             [--groups N] [--influences N] [--clips N] [--keys N] [--auras N] [--seed N]
+
+The contents are random but well formed: unit normals and quaternions, uvs
+in [0,1], skin weights summing to 1 and evenly spaced key times.
+"""
+import argparse
+import io
+import json
+import os
+import struct
+import sys
+import zlib
+from zipfile import ZIP_DEFLATED, ZipFile
+
+import numpy as np
+
+from .archive import encrypt_bytes, key
+from .parser import versions
+from .schema import AURA_MATERIAL_STRINGS, INFLUENCE, INT, KEY, MATRIX, TRANSFORM, VERTEX
+
+# read_skin_header takes a larger bone count for a padded block
+MAX_SKIN_BONES = 100
+
+
+def int_bytes(value):
+    return INT.struct.pack(value)
+
+def string_bytes(text):
+    data = text.encode()
+    return int_bytes(len(data)) + data
+
+def unit_rows(rng, count, columns):
+    rows = rng.standard_normal((count, columns))
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+def bone_names(count):
+    """
+    Returns the bone names of a synthetic skeleton, a binary tree under "root".
+    """
+    return ["root"] + ["bone_%03d" % i for i in range(1, count)]
+
+def bone_bytes(names, parents, mesh_names):
+    """
+    Returns a bone tree block. parents holds the index of each parent, -1 for
+    roots, and mesh_names the mesh shown by each bone or None.
+    """
+    rest = TRANSFORM.zeros(1)
+    rest["scale"] = 1
+    rest["rotation"] = (0, 0, 0, 1)
+
+    out = bytearray()
+    for name, parent, mesh_name in zip(names, parents, mesh_names):
+        out += string_bytes(name)
+        out += string_bytes(names[parent]) if parent >= 0 else int_bytes(0)
+        out += int_bytes(1) + string_bytes(mesh_name) if mesh_name else int_bytes(0)
+        out += rest.tobytes()
+    return bytes(out)
+
+def vertex_bytes(rng, count, vertex_size):
+    """
+    Returns count vertex records of vertex_size bytes: position, normal, uv, then zeros.
+    """
+    records = VERTEX.padded(vertex_size).zeros(count)
+    records["position"] = rng.uniform(-1, 1, (count, 3))
+    records["normal"] = unit_rows(rng, count, 3)
+    records["uv"] = rng.random((count, 2))
+    return records.tobytes()
+
+def geometry_bytes(rng, count, vertex_size, groups):
+    """
+    Returns a geometry block: the vertex records, then the face group of each vertex.
+    """
+    face_groups_idx = rng.integers(0, max(groups, 1), count, dtype=np.int32).astype("<i4")
+    return int_bytes(count) + vertex_bytes(rng, count, vertex_size) + int_bytes(count) + face_groups_idx.tobytes()
+
+def face_group_bytes(rng, groups, influences, bone_count):
+    """
+    Returns the influence groups of a skin, each with influences distinct bones.
+    """
+    influences = min(influences, bone_count)
+    records = np.zeros(groups, [("count", INT.dtype), ("influences", INFLUENCE.dtype, (influences,))])
+    records["count"] = influences
+    records["influences"]["bone_idx"] = rng.random((groups, bone_count)).argsort(axis=1)[:, :influences]
+    weights = rng.random((groups, influences)) + 0.1
+    records["influences"]["weight"] = weights / weights.sum(axis=1, keepdims=True)
+    return int_bytes(groups) + records.tobytes()
+
+def key_bytes(rng, count, key_stride, fps=30):
+    """
+    Returns count keyframe records of key_stride floats: time, scale, rotation xyzw, location, then zeros.
+    """
+    keys = KEY.padded(key_stride * 4).zeros(count)
+    keys["time"] = np.arange(count) / fps
+    keys["scale"] = 1 + rng.uniform(-0.1, 0.1, (count, 3))
+    keys["rotation"] = unit_rows(rng, count, 4)
+    keys["location"] = rng.uniform(-1, 1, (count, 3))
+    return keys.tobytes()
+
+def clip_bytes(rng, name, track_names, keys, key_stride):
+    """
+    Returns an animation clip with one track of keys keyframes per bone.
+    """
+    out = bytearray(string_bytes(name) + int_bytes(0) + int_bytes(len(track_names)))
+    for track_name in track_names:
+        out += string_bytes(track_name) + int_bytes(keys) + key_bytes(rng, keys, key_stride)
+    return bytes(out)
+
+def check_layout(version, vertex_size, key_stride, bones):
+    if version not in versions:
+        raise ValueError("unknown .ymd version %r" % version)
+    if vertex_size < VERTEX.size or vertex_size % 4:
+        raise ValueError("vertex records hold at least position, normal and uv in %d bytes, got %d" % (VERTEX.size, vertex_size))
+    if key_stride < KEY.size // 4:
+        raise ValueError("keyframe records hold at least %d floats, got %d" % (KEY.size // 4, key_stride))
+    if bones < 1:
+        raise ValueError("a skeleton needs at least one bone")
+
+def synthetic_ymd(version=20181101, meshes=4, vertices=3000, vertex_size=48, bones=32, groups=16, influences=2,
+                  clips=2, keys=60, key_stride=12, seed=0):
+    """
+    Builds a well formed .ymd.
+
+    Args:
+    - version (int): Header version, one of versions.
+    - meshes (int): Number of meshes, each with its own skin block.
+    - vertices (int): Vertices per mesh, rounded down to whole triangles.
+    - vertex_size (int): Bytes per vertex record, at least 32.
+    - bones (int): Bones in the tree. A skin uses at most 100 of them.
+    - groups (int): Skin influence groups per mesh.
+    - influences (int): Bones per influence group.
+    - clips (int): Animation clips, each with a track per bone.
+    - keys (int): Keyframes per track.
+    - key_stride (int): Floats per keyframe record, at least 12.
+    - seed (int): Seed of the random contents.
+
+    Returns:
+    The .ymd contents as bytes.
+    """
+    check_layout(version, vertex_size, key_stride, bones)
+    rng = np.random.default_rng(seed)
+    names = bone_names(bones)
+    count = vertices - vertices % 3
+    # The parser finds the mesh section by the first mesh name, which must start with "geometries"
+    mesh_names = ["geometries_%02d" % i for i in range(meshes)]
+
+    out = bytearray(int_bytes(version) + bytes(16))
+
+    out += int_bytes(meshes)
+    for i, mesh_name in enumerate(mesh_names):
+        out += string_bytes(mesh_name) + int_bytes(1) + bytes(8)
+        out += string_bytes("object_%02d" % i) + int_bytes(vertex_size)
+        out += geometry_bytes(rng, count, vertex_size, groups)
+
+    matrix = np.eye(4, dtype=MATRIX.dtype.base).tobytes()
+    out += int_bytes(meshes)
+    for mesh_name in mesh_names:
+        skin_bones = np.sort(rng.permutation(bones)[:MAX_SKIN_BONES])
+        out += string_bytes(mesh_name) + int_bytes(len(skin_bones))
+        for i in skin_bones:
+            out += string_bytes(names[i]) + matrix
+        out += face_group_bytes(rng, groups, influences, len(skin_bones))
+
+    out += int_bytes(bones)
+    shown = mesh_names[:bones] + [None] * (bones - len(mesh_names))
+    out += bone_bytes(names, [(i - 1) // 2 for i in range(bones)], shown)
+
+    out += int_bytes(clips)
+    for i in range(clips):
+        out += clip_bytes(rng, "clip_%02d" % i, names, keys, key_stride) + int_bytes(0)
+
+    return bytes(out)
+
+def synthetic_aura(version=20181101, shapes=2, vertices=300, bones=4, keys=60, key_stride=12, seed=0):
+    """
+    Builds a well formed aura effect .ymd, read by load_aura.
+
+    Args:
+    - version (int): Header version, one of versions. 20181101 adds a string to each material.
+    - shapes (int): Number of textured shapes, each with its own material "tex_XX.png".
+    - vertices (int): Vertices per shape, rounded down to whole triangles.
+    - bones (int): Bones in the tree, the first ones showing a shape each.
+    - keys (int): Keyframes per track of the clip.
+    - key_stride (int): Floats per keyframe record, at least 12.
+    - seed (int): Seed of the random contents.
+
+    Returns:
+    The .ymd contents as bytes.
+    """
+    check_layout(version, 48, key_stride, bones)
+    rng = np.random.default_rng(seed)
+    names = bone_names(bones)
+    count = vertices - vertices % 3
+    shape_names = ["shape_%02d" % i for i in range(shapes)]
+
+    out = bytearray(int_bytes(version))
+
+    out += int_bytes(shapes)
+    for i in range(shapes):
+        for field in AURA_MATERIAL_STRINGS[version]:
+            out += string_bytes("material_%02d" % i if field == "name" else "")
+        out += int_bytes(1) + string_bytes("tex_%02d.png" % i) + int_bytes(0)
+
+    out += int_bytes(shapes)
+    for i, shape_name in enumerate(shape_names):
+        out += string_bytes(shape_name) + bytes(12) + string_bytes("material_%02d" % i) + bytes(4)
+        out += int_bytes(count) + vertex_bytes(rng, count, 48) + bytes(count * 4) + bytes(4)
+
+    shown = shape_names[:bones] + [None] * (bones - len(shape_names))
+    out += bytes(4) + int_bytes(bones) + bone_bytes(names, [(i - 1) // 2 for i in range(bones)], shown) + bytes(4)
+
+    out += clip_bytes(rng, "aura", names, keys, key_stride) + int_bytes(0)
+
+    return bytes(out)
+
+def solid_png(width=4, height=4, rgba=(128, 128, 128, 255)):
+    """
+    Returns a PNG of a single color.
+    """
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    row = b"\0" + bytes(rgba) * width
+    return b"".join((
+        b"\x89PNG\r\n\x1a\n",
+        chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)),
+        chunk(b"IDAT", zlib.compress(row * height)),
+        chunk(b"IEND", b""),
+    ))
+
+def synthetic_ez(ymd_data, name="synthetic", textures=None, model_info=None, auras=None):
+    """
+    Wraps a .ymd in an encrypted .ez archive, as read by load_ez.
+
+    Args:
+    - ymd_data (bytes): Contents of the main .ymd, stored as <name>.ymd.
+    - name (str): Archive name without extension.
+    - textures (dict): Texture name to PNG bytes. None for a single solid "tex_00.png".
+    - model_info (dict): Written as modelInfo.txt when given.
+    - auras (dict): Aura file name to .ymd bytes, stored next to the main .ymd.
+
+    Returns:
+    The .ez contents as bytes.
+    """
+    if textures is None:
+        textures = {"tex_00.png": solid_png()}
+
+    buffer = io.BytesIO()
+    with ZipFile(buffer, 'w', ZIP_DEFLATED) as zf:
+        zf.writestr(name + ".ymd", ymd_data)
+        for texture_name, data in textures.items():
+            zf.writestr(texture_name, data)
+        if model_info is not None:
+            zf.writestr("modelInfo.txt", json.dumps(model_info))
+        for aura_name, data in (auras or {}).items():
+            zf.writestr(aura_name, data)
+
+    return encrypt_bytes(key, buffer.getvalue())
+
+def synthetic_archive(name="synthetic", version=20181101, meshes=4, auras=0, seed=0, **options):
+    """
+    Builds a complete .ez: a synthetic_ymd, one texture per mesh, a modelInfo
+    listing them and auras synthetic_aura files. options are passed to synthetic_ymd.
+
+    Returns:
+    The .ez contents as bytes.
+    """
+    textures = {"tex_%02d.png" % i: solid_png(rgba=(i * 37 % 256, 128, 255 - i * 37 % 256, 255)) for i in range(max(meshes, 1))}
+    model_info = {"material": [{"name": "object_%02d" % i, "texture": ["tex_%02d" % i]} for i in range(meshes)]}
+    aura_files = {"aura_%02d.ymd" % i: synthetic_aura(version, seed=seed + 1 + i) for i in range(auras)}
+    ymd_data = synthetic_ymd(version, meshes, seed=seed, **options)
+    return synthetic_ez(ymd_data, name, textures, model_info, aura_files)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m core.synthetic", description="Write a synthetic .ymd or .ez.")
+    parser.add_argument("output", help="output .ymd or .ez file")
+    parser.add_argument("--version", type=int, default=20181101, choices=versions)
+    parser.add_argument("--meshes", type=int, default=4)
+    parser.add_argument("--vertices", type=int, default=3000, help="vertices per mesh")
+    parser.add_argument("--vertex-size", type=int, default=48, help="bytes per vertex record")
+    parser.add_argument("--bones", type=int, default=32)
+    parser.add_argument("--groups", type=int, default=16, help="skin influence groups per mesh")
+    parser.add_argument("--influences", type=int, default=2, help="bones per influence group")
+    parser.add_argument("--clips", type=int, default=2)
+    parser.add_argument("--keys", type=int, default=60, help="keyframes per track")
+    parser.add_argument("--key-stride", type=int, default=12, help="floats per keyframe record")
+    parser.add_argument("--auras", type=int, default=0, help="aura files added to an .ez")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    options = {
+        "vertices": args.vertices, "vertex_size": args.vertex_size, "bones": args.bones, "groups": args.groups,
+        "influences": args.influences, "clips": args.clips, "keys": args.keys, "key_stride": args.key_stride,
+    }
+    name = os.path.splitext(os.path.basename(args.output))[0]
+    if args.output.lower().endswith(".ez"):
+        data = synthetic_archive(name, args.version, args.meshes, args.auras, args.seed, **options)
+    else:
+        data = synthetic_ymd(args.version, args.meshes, seed=args.seed, **options)
+
+    with open(args.output, 'wb') as f:
+        f.write(data)
+    print("Wrote %s (%.1f KB)" % (args.output, len(data) / 1024))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
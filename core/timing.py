@@ -0,0 +1,107 @@
+"""
+Per-stage instrumentation of imports and conversions.
+
+A Stats collects, for each named stage, the wall time, the bytes read or
+written and a count of the items handled (vertices, bones, keys...).
+"""
+import cProfile
+import contextlib
+import io
+import json
+import pstats
+import threading
+import time
+
+
+class Stats:
+    """
+    Wall time, bytes and item counts per stage. Stages keep their first-use order.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds=0.0, size=0, count=0):
+        with self.lock:
+            entry = self.stages.setdefault(name, {"seconds": 0.0, "bytes": 0, "count": 0, "calls": 0})
+            entry["seconds"] += seconds
+            entry["bytes"] += size
+            entry["count"] += count
+            entry["calls"] += 1
+
+    @contextlib.contextmanager
+    def stage(self, name, size=0, count=0):
+        """
+        Times the body of a with block. The yielded dict can be updated with
+        "bytes" and "count" once they are known.
+        """
+        measures = {"bytes": size, "count": count}
+        start = time.perf_counter()
+        try:
+            yield measures
+        finally:
+            self.add(name, time.perf_counter() - start, measures["bytes"], measures["count"])
+
+    def merge(self, other):
+        for name, entry in other.stages.items():
+            with self.lock:
+                mine = self.stages.setdefault(name, {"seconds": 0.0, "bytes": 0, "count": 0, "calls": 0})
+                for field in mine:
+                    mine[field] += entry[field]
+
+    def to_dict(self):
+        with self.lock:
+            return {name: dict(entry) for name, entry in self.stages.items()}
+
+    @classmethod
+    def from_dict(cls, stages):
+        stats = cls()
+        stats.stages = {name: dict(entry) for name, entry in stages.items()}
+        return stats
+
+    def report(self):
+        """
+        Returns one line per stage: time, bytes and count.
+        """
+        lines = []
+        for name, entry in self.to_dict().items():
+            line = "%-10s %8.3fs" % (name, entry["seconds"])
+            if entry["bytes"]:
+                line += " %10.1f KB" % (entry["bytes"] / 1024)
+            if entry["count"]:
+                line += " %10d items" % entry["count"]
+            lines.append(line)
+        return lines
+
+    def write_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+def stage(stats, name, size=0, count=0):
+    """
+    stats.stage, or a no-op when stats is None.
+    """
+    if stats is None:
+        return contextlib.nullcontext({"bytes": size, "count": count})
+    return stats.stage(name, size, count)
+
+@contextlib.contextmanager
+def profiled(output_file=None, limit=30):
+    """
+    Runs the body of a with block under cProfile, which only sees the calling thread.
+    The stats are dumped to output_file (.prof, for snakeviz or pstats) when given,
+    otherwise the top functions by cumulative time are printed.
+    """
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield profile
+    finally:
+        profile.disable()
+        if output_file:
+            profile.dump_stats(output_file)
+        else:
+            text = io.StringIO()
+            pstats.Stats(profile, stream=text).sort_stats("cumulative").print_stats(limit)
+            print(text.getvalue())
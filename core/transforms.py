@@ -0,0 +1,59 @@
+import numpy as np
+
+
+def quaternion_to_matrix(quaternions):
+    """
+    Converts (F,4) w,x,y,z quaternions to (F,3,3) rotation matrices.
+    """
+    norm = np.linalg.norm(quaternions, axis=1, keepdims=True)
+    q = np.where(norm > 0, quaternions / np.where(norm > 0, norm, 1), [1.0, 0.0, 0.0, 0.0])
+    w, x, y, z = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+
+    return np.stack((
+        np.stack((1 - 2*(y*y + z*z), 2*(x*y - w*z), 2*(x*z + w*y)), axis=1),
+        np.stack((2*(x*y + w*z), 1 - 2*(x*x + z*z), 2*(y*z - w*x)), axis=1),
+        np.stack((2*(x*z - w*y), 2*(y*z + w*x), 1 - 2*(x*x + y*y)), axis=1),
+    ), axis=1)
+
+def matrix_to_quaternion(matrices):
+    """
+    Converts (F,3,3) matrices to (F,4) w,x,y,z quaternions with w >= 0.
+    The columns are normalized first, like Matrix.to_quaternion.
+    """
+    norm = np.linalg.norm(matrices, axis=1, keepdims=True)
+    m = matrices / np.where(norm > 0, norm, 1)
+    m00, m11, m22 = m[:, 0, 0], m[:, 1, 1], m[:, 2, 2]
+    trace = m00 + m11 + m22
+
+    candidates = np.stack((
+        np.stack((1 + trace, m[:, 2, 1] - m[:, 1, 2], m[:, 0, 2] - m[:, 2, 0], m[:, 1, 0] - m[:, 0, 1]), axis=1),
+        np.stack((m[:, 2, 1] - m[:, 1, 2], 1 + m00 - m11 - m22, m[:, 0, 1] + m[:, 1, 0], m[:, 0, 2] + m[:, 2, 0]), axis=1),
+        np.stack((m[:, 0, 2] - m[:, 2, 0], m[:, 0, 1] + m[:, 1, 0], 1 - m00 + m11 - m22, m[:, 1, 2] + m[:, 2, 1]), axis=1),
+        np.stack((m[:, 1, 0] - m[:, 0, 1], m[:, 0, 2] + m[:, 2, 0], m[:, 1, 2] + m[:, 2, 1], 1 - m00 - m11 + m22), axis=1),
+    ), axis=1)
+
+    # Use the most stable of the four formulas for each matrix
+    best = np.argmax(candidates[:, [0, 1, 2, 3], [0, 1, 2, 3]], axis=1)
+    q = candidates[np.arange(len(m)), best]
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    q[q[:, 0] < 0] *= -1
+
+    return q
+
+def transform_locations(matrix, locations):
+    """
+    Batched calculate_transformed_location over a (F,3) track.
+    """
+    return locations @ matrix[:3, :3].T + matrix[:3, 3]
+
+def transform_rotations(matrix, rotations):
+    """
+    Batched calculate_transformed_rotation over a (F,4) w,x,y,z track.
+    """
+    return matrix_to_quaternion(matrix[:3, :3] @ quaternion_to_matrix(rotations))
+
+def transform_scales(matrix, scales):
+    """
+    Batched calculate_transformed_scale over a (F,3) track.
+    """
+    return np.abs(scales) * np.linalg.norm(matrix[:3, :3], axis=0)
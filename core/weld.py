@@ -0,0 +1,68 @@
+import numpy as np
+
+from .model import Mesh
+
+
+def weld_rows(*arrays):
+    """
+    Finds the unique vertices across the per-vertex arrays, compared bit for bit.
+
+    Args:
+    - arrays (numpy.ndarray): (N,C) arrays with one row per vertex.
+
+    Returns:
+    Tuple containing the index of the first occurrence of each unique vertex, in order,
+    and the (N,) remap of every vertex to its unique index.
+    """
+    count = len(arrays[0])
+    columns = [np.ascontiguousarray(i).reshape(count, -1) for i in arrays]
+    rows = np.empty(count, dtype=[("f%d" % n, i.dtype, i.shape[1:]) for n, i in enumerate(columns)])
+    for n, column in enumerate(columns):
+        rows["f%d" % n] = column
+    keys = rows.view(np.dtype((np.void, rows.dtype.itemsize)))
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+
+    # Keep the file order of the first occurrences
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return first[order], rank[inverse.ravel()]
+
+def weld_mesh(mesh, seams=True):
+    """
+    Merges the corners of the triangle soup into shared, indexed vertices.
+
+    Vertices are merged when their position and face group, hence their skin
+    influences, are equal. With seams, normal and uv must match too, so the
+    result keeps every per-vertex attribute intact; without, the kept normal
+    and uv are those of the first corner and callers needing exact seams
+    should take them per loop from the unwelded mesh, as uvs[faces].
+
+    Args:
+    - mesh (Mesh): Parsed mesh.
+    - seams (bool): Keep vertices apart when their normal or uv differ.
+
+    Returns:
+    New Mesh sharing the skin of the original, with faces and face_groups_idx remapped.
+    """
+    if len(mesh.positions) == 0:
+        return mesh
+
+    keys = [mesh.positions, mesh.face_groups_idx]
+    if seams:
+        keys += [mesh.normals, mesh.uvs]
+    keep, remap = weld_rows(*keys)
+
+    return Mesh(
+        mesh.object_name, mesh.name,
+        mesh.positions[keep], mesh.normals[keep], mesh.uvs[keep],
+        remap[mesh.faces].astype(np.int32), mesh.face_groups_idx[keep],
+        mesh.skin,
+    )
+
+def weld_model(model, seams=True):
+    """
+    Welds every mesh of a model in place with weld_mesh.
+    """
+    model.meshes = [weld_mesh(mesh, seams) for mesh in model.meshes]
+    return model
@@ -1,6 +1,11 @@
 from .file_io_ez import *
+from ..core.timing import Stats, profiled
 from bpy_extras.io_utils import ImportHelper
-from bpy.props import StringProperty
+from bpy.props import BoolProperty, CollectionProperty, EnumProperty, FloatProperty, IntProperty, StringProperty
+import contextlib
+import json
+import os
+import time
 import bpy
 
 class ImportEZ(bpy.types.Operator, ImportHelper):
@@ -9,7 +14,194 @@ class ImportEZ(bpy.types.Operator, ImportHelper):
     bl_options = {'PRESET', 'UNDO'}
     filename_ext = ".ez"
     filter_glob: StringProperty(default="*.ez", options={'HIDDEN'})
+    files: CollectionProperty(type=bpy.types.OperatorFileListElement, options={'HIDDEN', 'SKIP_SAVE'})
+    directory: StringProperty(subtype='DIR_PATH', options={'HIDDEN', 'SKIP_SAVE'})
+    extract_files: BoolProperty(
+        name="Write extracted files",
+        description="Also write the archive contents next to the .ez file",
+        default=False,
+    )
+    use_cache: BoolProperty(
+        name="Use parse cache",
+        description="Reuse the parsed model when the same archive is imported again",
+        default=True,
+    )
+    replace_previous: BoolProperty(
+        name="Replace previous import",
+        description="Delete what an earlier import of the same archive created, other data is left alone",
+        default=False,
+    )
+    weld_vertices: BoolProperty(
+        name="Merge vertices",
+        description="Share the vertices of adjacent triangles, keeping uv and normal seams per face corner",
+        default=False,
+    )
+    export_obj: EnumProperty(
+        name="Export OBJ",
+        description="Also write the meshes as .obj next to the .ez file",
+        items=[
+            ('NONE', "None", "Do not write .obj files"),
+            ('SPLIT', "One file per mesh", "Write <object>_<mesh>.obj for every mesh"),
+            ('SINGLE', "Single file", "Write every mesh to model.obj as o/g/usemtl groups"),
+        ],
+        default='NONE',
+    )
+    weld_obj: BoolProperty(
+        name="Weld OBJ vertices",
+        description="Write indexed vertices, merging those with equal position, uv and normal",
+        default=False,
+    )
+    export_glb: BoolProperty(
+        name="Export glTF",
+        description="Also write the meshes, skins and animations as a .glb next to the .ez file",
+        default=False,
+    )
+    clip_mode: EnumProperty(
+        name="Animation clips",
+        description="Clips to bake into actions, the others can be loaded later from the clip catalog of the import",
+        items=[
+            ('ALL', "All clips", "Decode and bake every clip"),
+            ('SELECTED', "Selected clips", "Decode and bake the clips listed below"),
+            ('NONE', "Skeleton only", "Only record the clip catalog"),
+        ],
+        default='ALL',
+    )
+    clip_names: StringProperty(
+        name="Clip names",
+        description="Comma separated clip names or patterns such as idle* for selected clips",
+        default="",
+    )
+    key_reduction: EnumProperty(
+        name="Reduce keyframes",
+        description="Drop the animation keys that the curve through the remaining ones reproduces",
+        items=[
+            ('NONE', "None", "Keep a key on every frame of every channel"),
+            ('LINEAR', "Linear", "Keep the keys needed by linear interpolation, constant channels keep a single key"),
+            ('BEZIER', "Bezier", "Keep the keys needed by Bezier interpolation, with handles following the original curve"),
+        ],
+        default='NONE',
+    )
+    key_tolerance: FloatProperty(
+        name="Key tolerance",
+        description="Largest difference to an original key allowed when reducing keyframes",
+        default=0.001,
+        min=0.0,
+        precision=4,
+    )
+    report_timing: BoolProperty(
+        name="Report timing",
+        description="List the time, bytes and items of every import stage in the info report",
+        default=True,
+    )
+    timing_file: StringProperty(
+        name="Timing JSON",
+        description="Also write the stage timings to this .json file, left empty to skip",
+        subtype='FILE_PATH',
+        default="",
+    )
+    profile: BoolProperty(
+        name="Profile",
+        description="Run the import under cProfile and print the slowest functions to the system console (main thread only)",
+        default=False,
+    )
     
+    def selected_clips(self):
+        if self.clip_mode == 'ALL':
+            return None
+        if self.clip_mode == 'NONE':
+            return []
+        return [i.strip() for i in self.clip_names.split(",") if i.strip()]
+
     def execute(self, context):
-            return file_io_open_ez(context, self.filepath)
+            filepaths = [os.path.join(self.directory, i.name) for i in self.files if i.name] or [self.filepath]
+            stats = Stats()
+            start = time.perf_counter()
+            with profiled() if self.profile else contextlib.nullcontext():
+                result = file_io_open_ez_files(context, filepaths, self.extract_files, self.use_cache, self.replace_previous, self.weld_vertices, self.export_obj, self.weld_obj, self.export_glb, stats, self.report,
+                                               self.key_reduction, self.key_tolerance, self.selected_clips())
+
+            stages = stats.to_dict()
+            if self.key_reduction != 'NONE' and "key reduction" in stages:
+                removed = stages["key reduction"]["count"]
+                total = removed + stages["keyframes"]["count"]
+                self.report({'INFO'}, "Key reduction removed %d of %d keys (%.0f%%)" % (removed, total, 100.0 * removed / max(total, 1)))
+
+            if self.report_timing:
+                for line in stats.report():
+                    self.report({'INFO'}, line)
+                self.report({'INFO'}, "Imported %d file(s) in %.2fs" % (len(filepaths), time.perf_counter() - start))
+            if self.timing_file:
+                stats.write_json(bpy.path.abspath(self.timing_file))
+            return result
     
+
+class YMDClipItem(bpy.types.PropertyGroup):
+    name: StringProperty()
+    frames: IntProperty()
+    bones: IntProperty()
+    load: BoolProperty(name="Load", default=False)
+
+class LoadClipsEZ(bpy.types.Operator):
+    bl_idname = "import_scene.ez_clips"
+    bl_label = "Load .ez animation clips"
+    bl_description = "Bake clips left out of an earlier .ez import, read from the byte ranges of its clip catalog"
+    bl_options = {'REGISTER', 'UNDO'}
+    clips: CollectionProperty(type=YMDClipItem, options={'SKIP_SAVE'})
+    use_cache: BoolProperty(
+        name="Use parse cache",
+        description="Reuse clips decoded earlier and store the new ones in the cache entry of the archive",
+        default=True,
+    )
+    key_reduction: EnumProperty(
+        name="Reduce keyframes",
+        description="Drop the animation keys that the curve through the remaining ones reproduces",
+        items=[
+            ('NONE', "None", "Keep a key on every frame of every channel"),
+            ('LINEAR', "Linear", "Keep the keys needed by linear interpolation, constant channels keep a single key"),
+            ('BEZIER', "Bezier", "Keep the keys needed by Bezier interpolation, with handles following the original curve"),
+        ],
+        default='NONE',
+    )
+    key_tolerance: FloatProperty(
+        name="Key tolerance",
+        description="Largest difference to an original key allowed when reducing keyframes",
+        default=0.001,
+        min=0.0,
+        precision=4,
+    )
+
+    @classmethod
+    def poll(cls, context):
+        return import_collection(context.object) is not None
+
+    def invoke(self, context, event):
+        collection = import_collection(context.object)
+        self.clips.clear()
+        for entry in json.loads(collection.get("ymd_clips", "[]")):
+            if entry["loaded"]:
+                continue
+            item = self.clips.add()
+            item.name = entry["name"]
+            item.frames = entry["frame_count"]
+            item.bones = entry["bone_count"]
+        if not self.clips:
+            self.report({'INFO'}, "Every clip of %s is loaded" % collection.name)
+            return {'CANCELLED'}
+        return context.window_manager.invoke_props_dialog(self)
+
+    def draw(self, context):
+        layout = self.layout
+        for item in self.clips:
+            layout.prop(item, "load", text="%s (%d frames, %d bones)" % (item.name, item.frames, item.bones))
+        layout.prop(self, "use_cache")
+        layout.prop(self, "key_reduction")
+        layout.prop(self, "key_tolerance")
+
+    def execute(self, context):
+        collection = import_collection(context.object)
+        stats = Stats()
+        result = file_io_load_clips(context, collection, [i.name for i in self.clips if i.load], self.use_cache,
+                                    self.key_reduction, self.key_tolerance, stats, self.report)
+        for line in stats.report():
+            self.report({'INFO'}, line)
+        return result
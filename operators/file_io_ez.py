@@ -1,47 +1,132 @@
+import json
 import os
-from Crypto.Cipher import AES
-from zipfile import ZipFile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ..core.cache import load_ez, load_ez_clips
+from ..core.gltf import write_glb
+from ..core.obj import write_obj
+from ..core.timing import stage
 from .ymd import *
 
 
-def file_io_open_ez(context, filepath):
-    input_file = filepath
+def decode_ez(input_file, extract_files=False, use_cache=True, export_obj='NONE', weld_obj=False, export_glb=False, stats=None, log=print, clip_names=None):
+    """
+    Everything of an import that does not touch bpy: decrypting, parsing and the file exports.
+    Safe to run on a worker thread, AES, zlib and most numpy calls release the GIL.
+    Only the animation clips matching clip_names are decoded, None decodes them all.
+
+    Returns:
+    Tuple containing the Model, the textures, the parsed modelInfo and the aura files.
+    """
     filename = os.path.splitext(os.path.basename(input_file))[0]
     directory = os.path.dirname(input_file)
-    print("Load", filename)
-    
-    # Decrypt and extract file
-    try:
-        decrypt_file(key, input_file)    
-        zf = ZipFile(directory + '/' + filename + '.zip', 'r')
-        zf.extractall(directory + '/' + filename)
-        zf.close()
-    except:
-        pass
 
+    # Decrypt into memory and parse, or reuse the parse of an identical archive
+    extract_dir = directory + '/' + filename if extract_files else None
+    model, textures, model_info, auras = load_ez(input_file, use_cache, stats=stats, log=log, clip_names=clip_names, extract_dir=extract_dir)
 
-    directory2 = os.path.dirname(os.path.abspath(input_file))
-    
-    # Convert .ymd to .obj
-    to_obj(directory + '/' + filename + '/' + filename + '.ymd',directory2 + '/' + filename )
+    if export_obj != 'NONE':
+        with stage(stats, "obj", count=len(model.meshes)):
+            write_obj(model, directory + '/' + filename, export_obj.lower(), weld_obj, textures, model_info)
+    if export_glb:
+        with stage(stats, "glb", count=len(model.meshes)):
+            write_glb(model, directory + '/' + filename + '.glb', textures, model_info)
 
-    return {'FINISHED'}
+    return model, textures, model_info, auras
+
+def file_io_open_ez(context, filepath, extract_files=False, use_cache=True, replace_previous=False, weld_vertices=False, export_obj='NONE', weld_obj=False, export_glb=False, stats=None, report=None, key_reduction='NONE', key_tolerance=0.001, clip_names=None):
+    return file_io_open_ez_files(context, [filepath], extract_files, use_cache, replace_previous, weld_vertices, export_obj, weld_obj, export_glb, stats, report, key_reduction, key_tolerance, clip_names)
+
+def file_io_open_ez_files(context, filepaths, extract_files=False, use_cache=True, replace_previous=False, weld_vertices=False, export_obj='NONE', weld_obj=False, export_glb=False, stats=None, report=None, key_reduction='NONE', key_tolerance=0.001, clip_names=None):
+    """
+    Imports several archives: they are decoded concurrently on a thread pool and
+    each one is built into the scene on the main thread as soon as it is ready.
+    stats receives the timing of every stage, report(type, message) the warnings,
+    like Operator.report. Warnings of the workers are reported from the main thread.
+    An archive failing to decode or to build is reported and skipped.
+    key_reduction and key_tolerance are passed to blender. Only the clips matching
+    clip_names (names or patterns, None for all) are baked, the others stay in the
+    clip catalog of the import for file_io_load_clips.
+    """
+    if report is None:
+        report = lambda type, message: print(message)
+    warnings = []
+
+    imported = 0
+    with ThreadPoolExecutor(max_workers=min(len(filepaths), os.cpu_count() or 1)) as executor:
+        futures = {
+            executor.submit(decode_ez, input_file, extract_files, use_cache, export_obj, weld_obj, export_glb, stats, warnings.append, clip_names): input_file
+            for input_file in filepaths
+        }
+        for future in as_completed(futures):
+            input_file = futures[future]
+            filename = os.path.splitext(os.path.basename(input_file))[0]
+            try:
+                model, textures, model_info, auras = future.result()
+            except Exception as e:
+                warnings.append("Could not open %s: %s" % (input_file, e))
+                continue
+            finally:
+                while warnings:
+                    report({'WARNING'}, warnings.pop(0))
 
-key = b'\x2a\xb5\x11\xf4\x77\x97\x7d\x25\xcf\x6f\x7a\x8a\xe0\x49\xa1\x25'
-def decrypt_file(key, input_file, output_file=None, chunksize=64*1024):
-    if not output_file:
-        output_file = os.path.splitext(input_file)[0] + '.zip'
+            # One archive failing to build does not stop the others
+            try:
+                blender(model, textures, model_info, weld_vertices, filename, replace_previous, auras, stats, key_reduction, key_tolerance, input_file)
+            except Exception as e:
+                report({'WARNING'}, "Could not import %s: %s" % (input_file, e))
+                continue
+            imported += 1
 
-    filesize = os.path.getsize(input_file)
+    return {'FINISHED'} if imported else {'CANCELLED'}
 
-    cipher = AES.new(key, AES.MODE_CBC, b'0000000000000000')
+def file_io_load_clips(context, collection, clip_names, use_cache=True, key_reduction='NONE', key_tolerance=0.001, stats=None, report=None):
+    """
+    Loads clips an import left in its clip catalog: they are decoded from the byte
+    ranges recorded at import, from the cache or the archive, without parsing the
+    model again, and baked onto the armature of the import.
 
-    with open(input_file, 'rb') as infile:
-        with open(output_file, 'wb') as outfile:
-            while True:
-                chunk = infile.read(chunksize)
-                if len(chunk) == 0:
-                    break
-                outfile.write(cipher.decrypt(chunk))
+    Args:
+    - collection (bpy.types.Collection): Collection of the import, from import_collection.
+    - clip_names (list): Names of the catalog clips to load.
 
-            outfile.truncate(filesize)
\ No newline at end of file
+    Returns:
+    {'FINISHED'} when clips were loaded, {'CANCELLED'} otherwise.
+    """
+    if report is None:
+        report = lambda type, message: print(message)
+
+    catalog = json.loads(collection.get("ymd_clips", "[]"))
+    source = collection.get("ymd_source")
+    entries = [i for i in catalog if i["name"] in clip_names and not i["loaded"]]
+    armature_obj = next((i for i in collection.all_objects if i.type == 'ARMATURE'), None)
+    if not entries:
+        return {'CANCELLED'}
+    if source is None or not os.path.exists(source):
+        report({'ERROR'}, "The archive of %s is gone: %s" % (collection.name, source))
+        return {'CANCELLED'}
+    if armature_obj is None:
+        report({'ERROR'}, "%s has no armature" % collection.name)
+        return {'CANCELLED'}
+
+    warnings = []
+    try:
+        clips = load_ez_clips(source, entries, use_cache, stats=stats, log=warnings.append)
+    except Exception as e:
+        report({'ERROR'}, "Could not load the clips of %s: %s" % (source, e))
+        return {'CANCELLED'}
+    finally:
+        for warning in warnings:
+            report({'WARNING'}, warning)
+
+    if context.object is not None and context.object.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+    parents = json.loads(collection.get("ymd_deform_parents", "{}"))
+    actions = build_clips(armature_obj, clips, collection["ymd_import"], parents, key_reduction, key_tolerance, stats)
+    collection["ymd_actions"] = list(collection.get("ymd_actions", [])) + actions
+
+    loaded = {i.name for i in clips}
+    for entry in catalog:
+        if entry["name"] in loaded:
+            entry["loaded"] = True
+    collection["ymd_clips"] = json.dumps(catalog)
+    return {'FINISHED'}
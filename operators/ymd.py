@@ -1,601 +1,454 @@
 import math
 import os
 import pathlib
-import struct
-from zipfile import ZipFile
-import bmesh
 import bpy
+import hashlib
+import time
 import json
-from Crypto.Cipher import AES
+import numpy as np
+
+from mathutils import Matrix
+
+from ..core import (
+    KEY_LOCATION,
+    KEY_ROTATION,
+    KEY_SCALE,
+    MaterialResolver,
+    Stats,
+    bezier_handles,
+    key_slopes,
+    parse_ymd,
+    reduce_keys,
+    transform_locations,
+    transform_rotations,
+    transform_scales,
+    vertex_influences,
+    weld_mesh,
+)
+from ..core.timing import stage
+
+
+def to_obj(file_path,directory,textures=None,model_info=None,load_meshes=True,clip_names=None):
+    """
+    Parses a .ymd and builds it into the scene with blender.
 
-from mathutils import Matrix,Vector,Quaternion
+    Args:
+    - file_path (str or bytes): Path to the input .ymd file, or its contents.
+    - directory (str): Directory holding the textures and modelInfo.txt when they are not given.
+    - textures (dict): Texture file name to PNG bytes, read from the archive.
+    - model_info (dict): Parsed modelInfo.txt, read from the archive.
+    - load_meshes (bool): Decode the meshes and their weights, otherwise only the skeleton is built.
+    - clip_names (list): Names of the animation clips to decode, None for all of them.
 
-versions = [
-    20158017,
-    20181101
-]
+    Returns:
+    True if successful, False otherwise.
+    """
+    if textures is None:
+        textures = {i.name: i for i in pathlib.Path(directory).glob('*.png')}
+    if model_info is None and os.path.exists(f"{directory}/modelInfo.txt"):
+        with open(f"{directory}/modelInfo.txt") as f:
+            model_info = json.load(f)
 
+    model = parse_ymd(file_path, load_meshes, clip_names)
+    if model is None:
+        return False
 
-print("get")
+    blender(model,textures,model_info)
+    return True
 
-def write_obj(objects, output_path):
+def image_index():
     """
-    Writes mesh data to .obj files based on the provided objects dictionary.
-
-    Args:
-    - objects (dict): Dictionary containing object and mesh data.
-    - output_path (str): Path to the directory where the .obj files will be written.
+    Returns a dict of content hash to the images loaded by previous imports.
     """
-    
-    for object_name, meshes in objects.items():
-        for mesh_name, mesh_data in meshes.items():
-            file_name = f"{output_path}/{object_name}_{mesh_name}.obj"
-            
-            # Extract the directory from the file path
-            directory = os.path.dirname(file_name)  
-            
-            # If the directory does not exist, create it
-            if not os.path.exists(directory):
-                os.makedirs(directory)    
-            
-            positions = mesh_data["positions"]
-            uvs = mesh_data["uvs"]
-            normals = mesh_data["normals"]
-            faces = mesh_data["faces"]
-            
-            with open(file_name, 'w', encoding='utf-8') as obj_file:
-                for position in positions:
-                    obj_file.write("v %f %f %f\n" % (position[0], position[1], position[2]))
-                for uv in uvs:
-                    obj_file.write("vt %f %f\n" % (uv[0], uv[1]))
-                for normal in normals:
-                    obj_file.write("vn %f %f %f\n" % (normal[0], normal[1], normal[2])) 
-
-                for face in faces:
-                    obj_file.write("f %i/%i/%i %i/%i/%i %i/%i/%i\n" % (face[0]+1, face[0]+1, face[0]+1, face[1]+1, face[1]+1, face[1]+1, face[2]+1, face[2]+1, face[2]+1)) 
-
-def get_geometries(data,a_mesh_length):
+    return {i["ymd_hash"]: i for i in bpy.data.images if "ymd_hash" in i}
+
+def load_image(name, source, images=None):
     """
-    Extracts mesh geometries from binary data.
+    Loads a texture into bpy.data.images from a file path or from PNG bytes.
+    An image with the same contents in images is reused instead.
 
     Args:
-    - data (io.BufferedReader): Binary data stream.
-
-    Returns:
-    Tuple containing positions, uvs, normals, and faces.
+    - name (str): Texture file name.
+    - source (bytes or pathlib.Path): PNG bytes or path.
+    - images (dict): Content hash to image, from image_index. Updated with the new image.
     """
-    positions = []
-    uvs = []
-    normals = []
-    faces = []
-    face_groups_idx = []
-
-    # Get mesh data
-    mesh_length = struct.unpack('i', data.read(4))[0]
-    if mesh_length > 0:
-        for i in range(mesh_length):
-            positions.append(list(struct.unpack("<%df" % 3, data.read(12))))
-            normals.append(list(struct.unpack("<%df" % 3, data.read(12))))
-            uvs.append(list(struct.unpack("<%df" % 2, data.read(8))))
-            data.read((a_mesh_length-32))
-
-        # Create triangle according to number of faces
-        faces_count = struct.unpack('i', data.read(4))[0]
-        for i in range(0, faces_count, 3):
-            faces.append([i, i+1, i+2])
-
-        # Skip bytes
-        for i in range(faces_count):
-            face_groups_idx.append(list(struct.unpack("<i", data.read(4)))[0])
-
-
-        # Create .obj
-        return positions, uvs, normals, faces, face_groups_idx
-
-patterns = ["geometries", "skin","sikn"]
-key = b'\x2a\xb5\x11\xf4\x77\x97\x7d\x25\xcf\x6f\x7a\x8a\xe0\x49\xa1\x25'
-
-def to_obj(file_path,directory):
+    if isinstance(source, (bytes, bytearray)):
+        data = bytes(source)
+    else:
+        data = pathlib.Path(source).read_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+    if images is not None and digest in images:
+        return images[digest]
+
+    if isinstance(source, (bytes, bytearray)):
+        image = bpy.data.images.new(name, 8, 8)
+        image.pack(data=data, data_len=len(data))
+        image.source = 'FILE'
+    else:
+        image = bpy.data.images.load(str(source))
+    image["ymd_hash"] = digest
+    if images is not None:
+        images[digest] = image
+    return image
+
+def build_mesh(name, positions, faces, loop_uvs, ver, loop_normals=None):
     """
-    Reads an EZ file, extracts mesh data, and writes .obj files.
+    Creates a triangle mesh datablock from flat arrays with foreach_set.
 
     Args:
-    - file_path (str): Path to the input EZ file.
+    - name (str): Name of the new mesh.
+    - positions (numpy.ndarray): (N,3) float32 vertex positions.
+    - faces (numpy.ndarray): (F,3) int32 triangle indices.
+    - loop_uvs (numpy.ndarray): (F*3,2) float32 UVs of every face corner.
+    - ver (int): .ymd version, files older than 20181101 store V flipped.
+    - loop_normals (numpy.ndarray): (F*3,3) normals of every face corner, set as
+      custom split normals so welded vertices keep their shading seams.
 
     Returns:
-    True if successful, False otherwise.
+    The new bpy.types.Mesh.
     """
-    
-    root = {}
+    mesh = bpy.data.meshes.new(name)
+    loop_vertices = np.ascontiguousarray(faces, dtype=np.int32).ravel()
 
-    bones = {}
+    mesh.vertices.add(len(positions))
+    mesh.vertices.foreach_set("co", np.ascontiguousarray(positions, dtype=np.float32).ravel())
 
-    bone_names = []
+    mesh.loops.add(len(loop_vertices))
+    mesh.loops.foreach_set("vertex_index", loop_vertices)
 
-    objects = {}
-    can_be_opened = False
-    
-    geometrie_offset = 0   
-    file_name = os.path.basename(file_path).split(".")[0].strip()
+    mesh.polygons.add(len(faces))
+    mesh.polygons.foreach_set("loop_start", np.arange(0, len(loop_vertices), 3, dtype=np.int32))
+    if bpy.app.version < (4, 0, 0):
+        mesh.polygons.foreach_set("loop_total", np.full(len(faces), 3, dtype=np.int32))
 
-    parent_name = ""
+    mesh.update(calc_edges=True)
 
-    animations = {}
-
-    mesh_names = {}
-
-    aura = {}
-    
-    with open(file_path, 'rb') as file:
-        ver = struct.unpack("<i",  file.read(4))[0]
-        file.seek(0)
-        # Read the first 300 bytes of the file
-        data = file.read(300)
-
-        for pattern in patterns:
-            # Find all occurrences of the text in the data
-            positions = [pos for pos in range(len(data)) if data.startswith(pattern.encode(), pos)]
-            
-            if positions:
-                geometrie_offset = positions[0] - 8
-                can_be_opened = True
-                break
-        
-        print(can_be_opened)
-        
-             
-        if can_be_opened:
-            file.seek(geometrie_offset)
-            meshes_count = struct.unpack("<i", file.read(4))[0]
-
-            for i in range(meshes_count):
-                a_mesh_length = 0
-                mesh_name = "unnamed_mesh_" + str(i)
-                mesh_lentgh = struct.unpack("<i", file.read(4))[0]
-                
-                if mesh_lentgh == 1:
-                    file.read(4)
-                    object_name = file.read(struct.unpack("<i", file.read(4))[0]).decode()
-                    a_mesh_length = struct.unpack("<i", file.read(4))[0]
-                else:
-                    mesh_name = file.read(mesh_lentgh).decode()
-                    loop_count = struct.unpack("<i", file.read(4))[0]
-                    if loop_count == 1:
-                        file.read(8)
-                        object_name = file.read(struct.unpack("<i", file.read(4))[0]).decode()
-                        a_mesh_length = struct.unpack("<i", file.read(4))[0]
-                    else:
-                        tmp = file.tell()
-                        for i in range(loop_count-1):
-                            file.read(8)
-                            object_name = file.read(struct.unpack("<i", file.read(4))[0]).decode()
-                            a_mesh_length = struct.unpack("<i", file.read(4))[0]
-                            get_geometries(file,a_mesh_length)
-                            print(file.tell())
-                        file.read(8)
-                        object_name = file.read(struct.unpack("<i", file.read(4))[0]).decode()
-                        a_mesh_length = struct.unpack("<i", file.read(4))[0]
-                    
-                positions, uvs, normals, faces, face_groups_idx = get_geometries(file,a_mesh_length)
-                
-                if object_name not in objects:
-                    objects[object_name] = {}
-
-                if mesh_name not in objects[object_name]:
-                    objects[object_name][mesh_name] = {}
-
-                objects[object_name][mesh_name].setdefault("positions", []).extend(positions)
-                objects[object_name][mesh_name].setdefault("uvs", []).extend(uvs)
-                objects[object_name][mesh_name].setdefault("normals", []).extend(normals)
-                objects[object_name][mesh_name].setdefault("faces", []).extend(faces)
-                objects[object_name][mesh_name].setdefault("face_groups_idx", []).extend(face_groups_idx)
-                objects[object_name][mesh_name]["bone_names"] = []
-                objects[object_name][mesh_name]["face_groups"] = []
-
-                
-
-            for i in range(struct.unpack("<i", file.read(4))[0]):
-                object_name = file.read(struct.unpack("<i", file.read(4))[0]).decode()
-                # object_nameの座標があるか確認（仮）
-                tmp = file.tell()
-                bone_length = struct.unpack("<i", file.read(4))[0]
-                if(bone_length > 100):
-                    file.seek(tmp)
-                    file.read(64)
-                    bone_length = struct.unpack("<i", file.read(4))[0]
-                d = filter(lambda k: object_name in list(k[1]), objects.items())
-                parent_name = list(dict(d).keys())[0]
-                objects[parent_name][object_name]["bone_names"] = []
-                for j in range(bone_length):
-                    bone_name = file.read(struct.unpack("<i", file.read(4))[0]).decode()
-                    objects[parent_name][object_name]["bone_names"].append(bone_name)
-                    bone = list(struct.unpack("<%df" % 16, file.read(64)))
-                    rotation_matrix = [
-                        [bone[0],bone[1],bone[2],bone[3]],
-                        [bone[4],bone[5],bone[6],bone[7]],
-                        [bone[8],bone[9],bone[10],bone[11]],
-                        [bone[12],bone[13],bone[14],bone[15]]
-                    ]
-                    rotation_matrix = Matrix(rotation_matrix)
-
-                    bones[bone_name] = {}
-                    bones[bone_name]["matrix"] = rotation_matrix
-
-                objects[parent_name][object_name]["face_groups"] = []
-                for j in range(struct.unpack("<i", file.read(4))[0]):
-                    tmp = {}
-                    tmp["bone_idx"]  = []
-                    tmp["weight"] = []
-                    for k in range(struct.unpack("<i", file.read(4))[0]):
-                        tmp["bone_idx"].append(struct.unpack("<i", file.read(4))[0])
-                        tmp["weight"].append(struct.unpack("<f", file.read(4))[0])
-                    objects[parent_name][object_name]["face_groups"].append(tmp)
-
-            for i in range(struct.unpack("<i", file.read(4))[0]): # bones
-                bone_name = file.read(struct.unpack("<i", file.read(4))[0]).decode()
-                bone_names.append(bone_name)
-                next_bone_name_length = struct.unpack("<i", file.read(4))[0]
-                if next_bone_name_length != 0:
-                    next_bone_name = file.read(next_bone_name_length).decode()
-
-                    tmp = root
-                    for j in find_key(root,next_bone_name):
-                        tmp.setdefault(j, {})
-                        tmp = tmp[j]
-                    tmp[bone_name] = {}
-                    if struct.unpack("<i", file.read(4))[0]==0:
-                        list(struct.unpack("<%df" % 10, file.read(40)))
-                    else:
-                        mesh_names[file.read(struct.unpack("<i", file.read(4))[0]).decode()] = bone_name
-                        list(struct.unpack("<%df" % 10, file.read(40)))
-                        pass
-                else:
-                    root[bone_name] = {}
-                    if struct.unpack("<i", file.read(4))[0]==0:
-                        list(struct.unpack("<%df" % 10, file.read(40)))
-                    else:
-                        mesh_names[file.read(struct.unpack("<i", file.read(4))[0]).decode()] = bone_name
-                        list(struct.unpack("<%df" % 10, file.read(40)))
-                        pass
-
-            for i in range(struct.unpack("<i", file.read(4))[0]):
-                animation_name = file.read(struct.unpack("<i", file.read(4))[0]).decode()
-                file.read(4)
-                animations[animation_name] = {}
-                animation_length = 0
-                for j in range(struct.unpack("<i", file.read(4))[0]):
-                    bone_name = file.read(struct.unpack("<i", file.read(4))[0]).decode()
-                    animations[animation_name][bone_name] = []
-                    for k in range(struct.unpack("<i", file.read(4))[0]):
-                        animations[animation_name][bone_name].append({
-                            "time":struct.unpack("<f", file.read(4))[0],
-                            "scale":list(struct.unpack("<%df" % 3, file.read(12))),
-                            "rotation":list(struct.unpack("<%df" % 4, file.read(16))),
-                            "location":list(struct.unpack("<%df" % 3, file.read(12))),
-                        })
-                        file.read(4)
-                        # 長さ確認（仮）
-                        if k == 0:
-                            tmp = file.tell()
-                            time = animations[animation_name][bone_name][0]["time"]
-                            flag = True
-                            animation_length = 12
-                            while flag:
-                                _time =struct.unpack("<f", file.read(4))[0]
-                                if(_time - time < 0.04 and _time - time > 0.03):
-                                    flag = False
-                                else:
-                                    animation_length = animation_length + 1
-                            file.seek(tmp)
-                        (list(struct.unpack("<%df" % (animation_length-12), file.read((animation_length-12)*4))))
-                file.read(4)
-
-            blender(root,bone_names,bones,objects,animations,mesh_names,directory,aura,ver)
-            # write_obj(objects, os.path.dirname(file_path) + "/" + file_name + "/")
-            return True
-        else:
-            return False
-
-def load_aura(file_path):
-    root = {}
-    object_names = []
-    animation_length = 0
-    animations = {}
-    animations2 = {}
-    positions = {}
-    faces = {}
-    mesh_names = {}
-
-    with open(file_path, 'rb') as file:
-        v = struct.unpack("<i",  file.read(4))[0]
-        # material
-        for i in range(struct.unpack("<i", file.read(4))[0]):
-            mesh_name = file.read(struct.unpack("<i", file.read(4))[0]).decode()
-            if v==20181101:
-                material_name = file.read(struct.unpack("<i", file.read(4))[0]).decode()
-            
-            if struct.unpack("<i", file.read(4))[0] == 1:
-                pass
-            else:
-                file.read(struct.unpack("<i", file.read(4))[0]).decode()
-            tex_name = file.read(struct.unpack("<i", file.read(4))[0]).decode()
-            loop_count = struct.unpack("<i", file.read(4))[0]
-            for j in range(loop_count):
-                file.read(4)
-                key = file.read(struct.unpack("<i", file.read(4))[0]).decode()
-                value = file.read(struct.unpack("<i", file.read(4))[0]).decode()
-            blender = False
-            if blender:
-                mat = bpy.data.materials.new(name=i.stem)
-                mat.use_nodes=True 
-                principled_BSDF = mat.node_tree.nodes[0]
-
-        # shapes
-        for i in range(struct.unpack("<i", file.read(4))[0]):
-            shape_name = file.read(struct.unpack("<i", file.read(4))[0]).decode()
-            positions[shape_name] = []
-            faces[shape_name] = []
-            file.read(12)
-            mat_name = file.read(struct.unpack("<i", file.read(4))[0]).decode()
-            file.read(4)
-            count = struct.unpack("<i", file.read(4))[0]
-            for j in range(count):
-                positions[shape_name].append(list(struct.unpack("<%df" % 3, file.read(3*4))))
-                (list(struct.unpack("<%df" % 9, file.read(9*4))))
-            for j in range(count):
-                (struct.unpack("<i", file.read(4)))
-            file.read(4)
-
-            for j in range(0,count,3):
-                faces[shape_name].append([j,j+1,j+2])
-
-        
-        #structure
-        file.read(4)
-        for i in range(struct.unpack("<i", file.read(4))[0]): 
-            object_name = file.read(struct.unpack("<i", file.read(4))[0]).decode()
-            object_names.append(object_name)
-            next_bone_name_length = struct.unpack("<i", file.read(4))[0]
-            if next_bone_name_length != 0:
-                next_bone_name = file.read(next_bone_name_length).decode()
-
-                tmp = root
-                for j in find_key(root,next_bone_name):
-                    tmp.setdefault(j, {})
-                    tmp = tmp[j]
-                tmp[object_name] = {}
-                if struct.unpack("<i", file.read(4))[0]==0:
-                    list(struct.unpack("<%df" % 10, file.read(40)))
-                else:
-                    mesh_names[object_name] = file.read(struct.unpack("<i", file.read(4))[0]).decode()
-                    list(struct.unpack("<%df" % 10, file.read(40)))
-                    pass
-            else:
-                root[object_name] = {}
-                if struct.unpack("<i", file.read(4))[0]==0:
-                    list(struct.unpack("<%df" % 10, file.read(40)))
-                else:
-                    mesh_names[object_name] = file.read(struct.unpack("<i", file.read(4))[0]).decode()
-                    list(struct.unpack("<%df" % 10, file.read(40)))
-                    pass
-        file.read(4)
-
-        # animation
-        file.read(struct.unpack("<i", file.read(4))[0]).decode()
-        file.read(4)
-        for i in range(struct.unpack("<i", file.read(4))[0]):
-            name = file.read(struct.unpack("<i", file.read(4))[0]).decode()
-            animations[name] = []
-            for j in range(struct.unpack("<i", file.read(4))[0]):   
-                if j == 0:
-                    tmp = file.tell()
-                    time = struct.unpack("<f", file.read(4))[0]
-                    file.read(44)
-                    flag = True
-                    animation_length = 12
-                    while flag:
-                        _time =struct.unpack("<f", file.read(4))[0]
-                        if(_time - time < 0.04 and _time - time > 0.03):
-                            flag = False
-                        else:
-                            animation_length = animation_length + 1
-                    file.seek(tmp)
-
-                animations[name].append({
-                    "time":struct.unpack("<f", file.read(4))[0],
-                    "scale":list(struct.unpack("<%df" % 3, file.read(12))),
-                    "rotation":list(struct.unpack("<%df" % 4, file.read(16))),
-                    "location":list(struct.unpack("<%df" % 3, file.read(12))),
-                })
-
-                (list(struct.unpack("<%df" % (animation_length-11), file.read((animation_length-11)*4))))
-        # animation???
-        for i in range(struct.unpack("<i", file.read(4))[0]):
-            name = file.read(struct.unpack("<i", file.read(4))[0]).decode()
-            for j in range(struct.unpack("<i", file.read(4))[0]):   
-                (list(struct.unpack("<%df" % 9, file.read(36))))
-        
-
-        return positions, faces, root, object_names, mesh_names
-        # for k,v in positions.items():
-        #     n_mesh_name = k
-        #     mesh = bpy.data.meshes.new(n_mesh_name)
-        #     obj = bpy.data.objects.new(n_mesh_name,mesh)
-        #     mesh.from_pydata(v,[],faces[k])
-        #     mesh.update()
-
-        #     bpy.context.collection.objects.link(obj)
+    loop_uvs = np.array(loop_uvs, dtype=np.float32).reshape(-1, 2)
+    if ver < 20181101:
+        loop_uvs[:, 1] = 1.0 - loop_uvs[:, 1]
+    uv = mesh.uv_layers.new(name='UVmap')
+    uv.data.foreach_set("uv", loop_uvs.ravel())
 
+    if loop_normals is not None:
+        mesh.polygons.foreach_set("use_smooth", np.ones(len(faces), dtype=bool))
+        if bpy.app.version < (4, 1, 0):
+            mesh.use_auto_smooth = True
+        mesh.normals_split_custom_set(np.asarray(loop_normals, dtype=np.float32).reshape(-1, 3))
 
+    return mesh
 
+def add_vertex_groups(obj, mesh):
+    """
+    Creates one vertex group per skin bone and fills it from the CSR skin.
+    Vertices sharing a weight are added with a single group.add call.
 
-def find_key(d, target):
+    Args:
+    - obj (bpy.types.Object): Mesh object receiving the groups.
+    - mesh (Mesh): Parsed mesh with its skin.
     """
-    辞書 d の中から特定の要素 target の位置を探します。
-    target が見つかった場合、その位置をリストで返します。
-    見つからない場合は None を返します。
+    bone_names = mesh.skin.bone_names
+    vertices, bone_idx, weight = vertex_influences(mesh.skin, mesh.face_groups_idx)
+    keep = bone_idx < len(bone_names)
+    vertices, bone_idx, weight = vertices[keep], bone_idx[keep], weight[keep]
+
+    order = np.lexsort((weight, bone_idx))
+    vertices, bone_idx, weight = vertices[order], bone_idx[order], weight[order]
+    groups = [obj.vertex_groups.new(name=i) for i in bone_names]
+    if len(vertices) == 0:
+        return
+
+    starts = np.flatnonzero(np.r_[True, (bone_idx[1:] != bone_idx[:-1]) | (weight[1:] != weight[:-1])])
+    ends = np.r_[starts[1:], len(vertices)]
+    for start, end in zip(starts, ends):
+        groups[bone_idx[start]].add(vertices[start:end].tolist(), float(weight[start]), 'ADD')
+
+def add_fcurves(action, data_path, frames, values, interpolation='BEZIER', keep=None):
     """
-    def dfs(node, path):
-        if isinstance(node, dict):
-            for key, value in node.items():
-                if key == target:
-                    return path + [key]
-                result = dfs(value, path + [key])
-                if result:
-                    return result
-        return None
-
-    return dfs(d, [])
-
-def blender(root,bone_names,bones,objects,animations,mesh_names,directory,aura,ver):
+    Creates one F-curve per column of values and fills all its keys at once.
 
-    tex_list = list(pathlib.Path(directory).glob('*.png'))
+    Args:
+    - action (bpy.types.Action): Action receiving the F-curves.
+    - data_path (str): Data path of the animated property.
+    - frames (numpy.ndarray): (F,) key frame numbers.
+    - values (numpy.ndarray): (F,C) key values, one column per array index.
+    - interpolation (str): Interpolation of every key.
+    - keep (numpy.ndarray): (F,C) keys to insert per column, from reduce_keys, None for all of them.
+      Reduced Bezier keys get aligned handles following the original samples.
 
-    for item in bpy.data.objects:
-        bpy.data.objects.remove(item)
+    Returns:
+    Number of keys inserted.
+    """
+    ipo = bpy.types.Keyframe.bl_rna.properties['interpolation'].enum_items[interpolation].value
+    slopes = None
+    if keep is not None and interpolation == 'BEZIER':
+        slopes = key_slopes(frames, values)
+        aligned = bpy.types.Keyframe.bl_rna.properties['handle_left_type'].enum_items['ALIGNED'].value
+
+    inserted = 0
+    for i in range(values.shape[1]):
+        rows = np.flatnonzero(keep[:, i]) if keep is not None else np.arange(len(frames))
+        co = np.empty((len(rows), 2), dtype=np.float32)
+        co[:, 0] = frames[rows]
+        co[:, 1] = values[rows, i]
+
+        fcurve = action.fcurves.new(data_path=data_path, index=i)
+        fcurve.keyframe_points.add(len(rows))
+        fcurve.keyframe_points.foreach_set("co", co.ravel())
+        fcurve.keyframe_points.foreach_set("interpolation", [ipo] * len(rows))
+        if slopes is not None:
+            # Set before update(), which would otherwise recompute automatic handles
+            left, right = bezier_handles(frames[rows], values[rows, i], slopes[rows, i])
+            fcurve.keyframe_points.foreach_set("handle_left_type", [aligned] * len(rows))
+            fcurve.keyframe_points.foreach_set("handle_right_type", [aligned] * len(rows))
+            fcurve.keyframe_points.foreach_set("handle_left", left.astype(np.float32).ravel())
+            fcurve.keyframe_points.foreach_set("handle_right", right.astype(np.float32).ravel())
+        fcurve.update()
+        inserted += len(rows)
+    return inserted
+
+def add_transform_fcurves(action, path, frames, locations, rotations, scales, key_reduction='NONE', key_tolerance=0.001, stats=None):
+    """
+    Adds the location, rotation_quaternion and scale F-curves of one track.
+    With key_reduction 'LINEAR' or 'BEZIER', the ten channels are reduced together
+    by reduce_keys first and the kept keys use that interpolation.
 
-    for item in bpy.data.meshes:
-        bpy.data.meshes.remove(item)
+    Args:
+    - path (str): Prefix of the data paths, e.g. 'pose.bones["name"].', empty for an object.
+    - locations, rotations, scales (numpy.ndarray): (F,3), (F,4) wxyz and (F,3) values.
+    - key_tolerance (float): Largest difference to an original key allowed by the reduction.
+    - stats (Stats): Receives the "key reduction" stage, counting the removed keys.
 
-    for item in bpy.data.materials:
-        bpy.data.materials.remove(item)
+    Returns:
+    Number of keys inserted.
+    """
+    channels = (locations, rotations, scales)
+    keep = [None] * 3
+    interpolation = 'BEZIER'
+    if key_reduction != 'NONE':
+        with stage(stats, "key reduction") as measures:
+            reduced = reduce_keys(frames, np.concatenate(channels, axis=1), key_tolerance, key_reduction)
+            measures["count"] = reduced.size - int(reduced.sum())
+        keep = np.split(reduced, [3, 7], axis=1)
+        interpolation = key_reduction
+
+    inserted = 0
+    for data_path, values, rows in zip(("location", "rotation_quaternion", "scale"), channels, keep):
+        inserted += add_fcurves(action, path + data_path, frames, values, interpolation, rows)
+    return inserted
+
+def remove_import(name):
+    """
+    Deletes what previous imports named name created, with a single batch_remove.
+    Only their collections are searched, so the cost does not grow with the scene.
+    Images still used outside of those imports are kept.
+    """
+    ids = set()
+    for collection in [i for i in bpy.data.collections if i.get("ymd_import") == name]:
+        ids.add(collection)
+        for obj in collection.all_objects:
+            ids.add(obj)
+            if obj.data is not None:
+                ids.add(obj.data)
+            if obj.type == 'MESH':
+                ids.update(i for i in obj.data.materials if i is not None)
+        for action_name in collection.get("ymd_actions", []):
+            action = bpy.data.actions.get(action_name)
+            if action is not None and action.get("ymd_import") == name:
+                ids.add(action)
+
+    image_users = {}
+    for material in [i for i in ids if isinstance(i, bpy.types.Material)]:
+        if material.node_tree is not None:
+            for node in material.node_tree.nodes:
+                if node.type == 'TEX_IMAGE' and node.image is not None:
+                    image_users[node.image] = image_users.get(node.image, 0) + 1
+    ids.update(image for image, users in image_users.items() if image.users <= users)
+
+    if ids:
+        bpy.data.batch_remove(ids)
+
+def new_material(texture_name, image):
+    """
+    Creates a node material showing image, named after the texture.
+    """
+    mat = bpy.data.materials.new(name=os.path.splitext(texture_name)[0])
+    mat.use_nodes=True 
+    principled_BSDF = mat.node_tree.nodes[0]
 
-    for item in bpy.data.actions:
-        bpy.data.actions.remove(item)
+    tex_node = mat.node_tree.nodes.new('ShaderNodeTexImage')
+    tex_node.image = image
 
-    for item in bpy.data.images:
-        bpy.data.images.remove(item)
+    if image.alpha_mode != "NONE":
+        principled_BSDF.inputs["Alpha"].default_value = 1.0
     
-    for i in tex_list:
-        bpy.data.images.load(str(i))
-        mat = bpy.data.materials.new(name=i.stem)
-        mat.use_nodes=True 
-        principled_BSDF = mat.node_tree.nodes[0]
-
-        tex_node = mat.node_tree.nodes.new('ShaderNodeTexImage')
-        tex_node.image = bpy.data.images[i.name]
-
-        if bpy.data.images[i.name].alpha_mode != "NONE":
-            principled_BSDF.inputs["Alpha"].default_value = 1.0
-        
-        mat.node_tree.links.new(tex_node.outputs[0], principled_BSDF.inputs[0])
-
-    bpy.ops.object.add(radius=1.0, type='ARMATURE', enter_editmode=False, align='WORLD', location=(0.0, 0.0, 0.0), rotation=(math.pi/2, 0.0, 0.0), scale=(0.0, 0.0, 0.0))
-    bpy.context.active_object.name = list(root.keys())[0]
-
+    mat.node_tree.links.new(tex_node.outputs[0], principled_BSDF.inputs[0])
+    return mat
+
+def blender(model,textures,model_info,weld=False,name=None,replace=False,auras=None,stats=None,key_reduction='NONE',key_tolerance=0.001,source=None):
+    armature_name = model.root_bone().name
+    mesh_names = model.mesh_names()
+    name = name or armature_name
+    stats = stats if stats is not None else Stats()
+
+    if bpy.context.object is not None and bpy.context.object.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+    if replace:
+        with stats.stage("cleanup"):
+            remove_import(name)
+
+    # Everything is built in a new collection, the rest of the file is left alone
+    collection = bpy.data.collections.new(name)
+    collection["ymd_import"] = name
+    bpy.context.scene.collection.children.link(collection)
+
+    # Only the textures some mesh uses are loaded, images already in the file are reused
+    resolver = MaterialResolver(textures, model_info)
+    images = image_index()
+    materials = {}
+    start = time.perf_counter()
+    for texture_name in resolver.referenced(i.object_name for i in model.meshes if i.name in mesh_names):
+        materials[texture_name] = new_material(texture_name, load_image(texture_name, textures[texture_name], images))
+    stats.add("materials", time.perf_counter() - start, count=len(materials))
+
+    armature_obj = bpy.data.objects.new(armature_name, bpy.data.armatures.new(armature_name))
+    armature_obj.rotation_euler = (math.pi/2, 0.0, 0.0)
+    collection.objects.link(armature_obj)
+
+    start = time.perf_counter()
+    bpy.context.view_layer.objects.active = armature_obj
     bpy.ops.object.mode_set(mode='EDIT', toggle=False)
-    bpy.context.view_layer.objects.active = bpy.data.objects[list(root.keys())[0]]
-    for i in bone_names:
-        bone = bpy.data.objects[list(root.keys())[0]].data.edit_bones.new(i)
+    for i in model.bones:
+        bone = armature_obj.data.edit_bones.new(i.name)
         bone.head.x = 0
         bone.head.y = -1
         bone.head.z = 0
         bone.tail.x = 0
         bone.tail.y = 0
         bone.tail.z = 0
-        isDefinedBone = i in bones
+        isDefinedBone = i.matrix is not None
         if isDefinedBone == True:
+            matrix = Matrix(i.matrix.tolist())
             try:
-                bone.matrix = bones[i]["matrix"].inverted()
+                bone.matrix = matrix.inverted()
             except:
-                bone.matrix = bones[i]["matrix"]
+                bone.matrix = matrix
         else:
             bone.matrix = Matrix(((1, 0, 0, 0), (0, 1, 0, 0), (0, 0, 1, 0), (0, 0, 0, 1)))
         
-        if len(find_key(root,i)) == 1:
-            pass
-        else:
-            bone.parent = bpy.data.objects[list(root.keys())[0]].data.edit_bones[find_key(root,i)[-2]]
-    bpy.data.objects[list(root.keys())[0]].data.name = list(root.keys())[0]
-        
+        if i.parent >= 0:
+            bone.parent = armature_obj.data.edit_bones[model.bones[i.parent].name]
+    # Leaving Edit Mode writes the edit bones to armature.bones, which deform_parents reads
+    bpy.ops.object.mode_set(mode='OBJECT')
+    stats.add("armature", time.perf_counter() - start, count=len(model.bones))
 
     # binding
-    for object_name, meshes in objects.items():
-        for mesh_name, mesh_data in meshes.items():
-            if mesh_name in mesh_names.keys():
-                n_mesh_name = mesh_names[mesh_name]
-                mesh = bpy.data.meshes.new(n_mesh_name)
-                obj = bpy.data.objects.new(n_mesh_name,mesh)
-                mesh.from_pydata(mesh_data["positions"],[],mesh_data["faces"])
-                mesh.update()
-
-                bpy.context.collection.objects.link(obj)
-
-                bpy.context.view_layer.objects.active = obj
-                obj.select_set(True)
-                
-                uv = bpy.context.active_object.data.uv_layers.new(name='UVmap')
-
-                for loop in bpy.context.active_object.data.loops:
-                    print(ver)
-                    if ver >= 20181101:
-                        uv.data[loop.index].uv = tuple([objects[object_name][mesh_name]["uvs"][loop.index][0],objects[object_name][mesh_name]["uvs"][loop.index][1]])
-                    else:
-                        uv.data[loop.index].uv = tuple([objects[object_name][mesh_name]["uvs"][loop.index][0],1.0-objects[object_name][mesh_name]["uvs"][loop.index][1]])
-
-                
-                bpy.data.objects[n_mesh_name].parent = bpy.data.objects[list(root.keys())[0]]
-
-                group_vertices = []
-                for i in enumerate(objects[object_name][mesh_name]["bone_names"]):
-                    group_vertices.append([])
-
-                for idx,i in enumerate(objects[object_name][mesh_name]["face_groups_idx"]):
-                    if len(objects[object_name][mesh_name]["face_groups"]) > 0:
-                        for jdx,j in enumerate(objects[object_name][mesh_name]["face_groups"][i]["bone_idx"]):
-                            if objects[object_name][mesh_name]["face_groups"][i]["weight"][jdx] != 0:
-                                group_vertices[j].append([idx,objects[object_name][mesh_name]["face_groups"][i]["weight"][jdx]])
-
-                
-                for idx,i in enumerate(objects[object_name][mesh_name]["bone_names"]):
-                    group = obj.vertex_groups.new(name=i)
-                    for jdx,j in enumerate(group_vertices[idx]):
-                        group.add([j[0]], j[1], 'ADD')
-                
-                obj.modifiers.new("Armature","ARMATURE")
-                obj.modifiers["Armature"].object = bpy.data.objects[list(root.keys())[0]]
-
-                if object_name[-5:-3] in [i[-2:] for i in bpy.data.materials.keys()] and object_name[-2:] == "01":
-                    obj.data.materials.append(bpy.data.materials[[i for i in bpy.data.materials.keys() if i[-2:] == object_name[-5:-3]][0]])
-                else:
-                    if os.path.exists(f"{directory}/modelInfo.txt"):
-                        with open(f"{directory}/modelInfo.txt") as f:
-                            json_data = json.load(f)
-                            if "material" in json_data.keys():
-                                result = filter(lambda item: item["name"] == object_name, json_data["material"])
-                                if len(list(result)) > 0:
-                                    try:
-                                        obj.data.materials.append(bpy.data.materials[list(result)[0]["texture"][0]])
-                                    except:
-                                        obj.data.materials.append(bpy.data.materials[0])
-                                        print("no texture source found. Auto attach to mesh")
-                                else:
-                                    obj.data.materials.append(bpy.data.materials[0])
-                                    print("no texture source found. Auto attach to mesh")
-                            else:
-                                obj.data.materials.append(bpy.data.materials[0])
-                                print("no texture source found. Auto attach to mesh")
-                    else:
-                        obj.data.materials.append(bpy.data.materials[0])
-                        print("no texture source found. Auto attach to mesh")
+    for mesh_data in model.meshes:
+        object_name = mesh_data.object_name
+        if mesh_data.name in mesh_names.keys():
+            n_mesh_name = mesh_names[mesh_data.name]
+            loop_uvs = mesh_data.uvs[mesh_data.faces.ravel()]
+            loop_normals = None
+            if weld:
+                # Seams stay in the per-loop uvs and normals taken before welding
+                loop_normals = mesh_data.normals[mesh_data.faces.ravel()]
+                mesh_data = weld_mesh(mesh_data, seams=False)
+            with stats.stage("mesh build", count=len(mesh_data.positions)):
+                mesh = build_mesh(n_mesh_name, mesh_data.positions, mesh_data.faces, loop_uvs, model.version, loop_normals)
+            obj = bpy.data.objects.new(n_mesh_name,mesh)
+
+            collection.objects.link(obj)
+
+            bpy.context.view_layer.objects.active = obj
+            obj.select_set(True)
+
+            obj.parent = armature_obj
+
+            with stats.stage("weights", count=len(mesh_data.skin.weight)):
+                add_vertex_groups(obj, mesh_data)
+
+            obj.modifiers.new("Armature","ARMATURE")
+            obj.modifiers["Armature"].object = armature_obj
+
+            texture_name = resolver.resolve(object_name)
+            if texture_name is not None:
+                obj.data.materials.append(materials[texture_name])
 
     # animations
+    if armature_obj.animation_data:
+        armature_obj.animation_data_clear()
+    parents = deform_parents(model.bones, armature_obj.data)
+    actions = build_clips(armature_obj, [i for i in model.clips if i.tracks], name, parents, key_reduction, key_tolerance, stats)
+
+    if auras:
+        with stats.stage("aura build", count=len(auras)):
+            actions += build_auras(auras, textures, images, materials, armature_obj, collection, name, key_reduction, key_tolerance, stats)
+
+    collection["ymd_actions"] = actions
+    collection["ymd_clips"] = json.dumps(model.clip_catalog())
+    collection["ymd_deform_parents"] = json.dumps(parents)
+    if source is not None:
+        collection["ymd_source"] = source
+
+def deform_parents(bones, armature):
+    """
+    Returns a dict of bone name to the name of its nearest deforming parent, None
+    when it has none. Parents come before their children in the parsed bones.
+
+    Args:
+    - bones (list): Bones of the Model, parents as indices.
+    - armature (bpy.types.Armature): Armature built from them, out of Edit Mode, for use_deform.
+    """
+    # Nearest deforming parent of every bone, resolved once from the hierarchy index
+    parents = []
+    for bone in bones:
+        parent = bone.parent
+        if parent >= 0 and not armature.bones[bones[parent].name].use_deform:
+            parent = parents[parent]
+        parents.append(parent)
+    return {bone.name: bones[parent].name if parent >= 0 else None for bone, parent in zip(bones, parents)}
+
+def build_clips(armature_obj, clips, name, parents, key_reduction='NONE', key_tolerance=0.001, stats=None):
+    """
+    Bakes decoded animation clips into one action each on an armature. Used by
+    blender for the clips decoded at import, and later for clips loaded from the
+    catalog of the import.
+
+    Args:
+    - armature_obj (bpy.types.Object): Armature the clips animate.
+    - clips (list): Clips with their tracks decoded.
+    - name (str): Import name, recorded on the actions.
+    - parents (dict): Bone name to its nearest deforming parent, from deform_parents.
+    - key_reduction (str): Keyframe reduction mode, see add_transform_fcurves.
+    - key_tolerance (float): Largest error of a reduced channel.
+    - stats (Stats): Receives the "keyframes" and "key reduction" stages.
+
+    Returns:
+    Names of the new actions.
+    """
+    stats = stats if stats is not None else Stats()
     scene = bpy.context.scene
-    armature = bpy.data.objects[list(root.keys())[0]].data
-    
+    armature = armature_obj.data
+
     # Switch to Pose Mode
-    bpy.context.view_layer.objects.active = bpy.data.objects[list(root.keys())[0]]
+    bpy.context.view_layer.objects.active = armature_obj
     bpy.ops.object.mode_set(mode='POSE')
-    
-    if bpy.data.objects[list(root.keys())[0]].animation_data:
-        bpy.data.objects[list(root.keys())[0]].animation_data_clear()
-    
-    bpy.data.objects[list(root.keys())[0]].animation_data_create()
-    for a_name,anim in animations.items():
-        frame_count = len(animations[a_name][list(animations[a_name].keys())[0]])
 
-        action = bpy.data.actions.new(name=a_name)
-        bpy.data.objects[list(root.keys())[0]].animation_data.action = action
+    if not armature_obj.animation_data:
+        armature_obj.animation_data_create()
+
+    pose_bones = armature_obj.pose.bones
+    pose_matrices = {}
+    actions = []
+
+    for clip in clips:
+        if not clip.tracks:
+            continue
+        frame_count = len(next(iter(clip.tracks.values())))
+
+        action = bpy.data.actions.new(name=clip.name)
+        action["ymd_import"] = name
+        actions.append(action.name)
+        armature_obj.animation_data.action = action
         
         scene.frame_start = 0
         scene.frame_end = frame_count
@@ -604,118 +457,134 @@ def blender(root,bone_names,bones,objects,animations,mesh_names,directory,aura,v
         bpy.ops.pose.select_all(action='SELECT')
         bpy.ops.pose.transforms_clear()   
 
-        for frame in range(frame_count):
-            for b_name,bone in animations[a_name].items():
-                pose_bone = bpy.data.objects[list(root.keys())[0]].pose.bones[b_name]
+        start = time.perf_counter()
+        key_count = 0
+        for b_name,bone in clip.tracks.items():
+            pose_bone = pose_bones[b_name]
+            pose_bone.rotation_mode = 'QUATERNION'
 
-                location = calculate_transformed_location(pose_bone,Vector([bone[frame]["location"][0],bone[frame]["location"][1],bone[frame]["location"][2]]))
-                for i in range(3):
-                    fcurve = action.fcurves.find("pose.bones[\"{}\"].location".format(pose_bone.name), index=i)
-                    if not fcurve:
-                        fcurve = action.fcurves.new(data_path="pose.bones[\"{}\"].location".format(pose_bone.name), index=i)
-                    fcurve.keyframe_points.insert(frame, location[i])
+            keys = bone[:frame_count]
+            if len(keys) == 0:
+                continue
+            frames = np.arange(len(keys), dtype=np.float32)
 
-                pose_bone.rotation_mode = 'QUATERNION'
+            if b_name not in pose_matrices:
+                parent = parents.get(b_name)
+                pose_matrices[b_name] = calculate_pose_matrix(armature.bones[b_name], armature.bones[parent] if parent else None)
+            matrix = pose_matrices[b_name]
+            locations = transform_locations(matrix, keys[:, KEY_LOCATION].astype(np.float64))
+            rotations = transform_rotations(matrix, keys[:, KEY_ROTATION].astype(np.float64)[:, [3, 0, 1, 2]])
+            scales = transform_scales(matrix, keys[:, KEY_SCALE].astype(np.float64))
 
-                rotation = calculate_transformed_rotation(pose_bone,Vector([bone[frame]["rotation"][3],bone[frame]["rotation"][0],bone[frame]["rotation"][1],bone[frame]["rotation"][2]]))
-                parent = pose_bone.parent
-                while parent and not parent.bone.use_deform:
-                    parent = parent.parent
-                for i in range(4):
-                    fcurve = action.fcurves.find("pose.bones[\"{}\"].rotation_quaternion".format(pose_bone.name), index=i)
-                    if not fcurve:
-                        fcurve = action.fcurves.new(data_path="pose.bones[\"{}\"].rotation_quaternion".format(pose_bone.name), index=i)
-                    fcurve.keyframe_points.insert(frame, rotation[i])
+            key_count += add_transform_fcurves(action, "pose.bones[\"{}\"].".format(pose_bone.name), frames, locations, rotations, scales,
+                                               key_reduction, key_tolerance, stats)
+        stats.add("keyframes", time.perf_counter() - start, count=key_count)
 
-                scale = calculate_transformed_scale(pose_bone,Vector([bone[frame]["scale"][0],bone[frame]["scale"][1],bone[frame]["scale"][2]]))
-                for i in range(3):
-                    fcurve = action.fcurves.find("pose.bones[\"{}\"].scale".format(pose_bone.name), index=i)
-                    if not fcurve:
-                        fcurve = action.fcurves.new(data_path="pose.bones[\"{}\"].scale".format(pose_bone.name), index=i)
-                    fcurve.keyframe_points.insert(frame, scale[i])
+    return actions
 
-    print("succeed")
+def import_collection(obj):
+    """
+    Returns the collection of the import obj belongs to, None when it is not part of one.
+    """
+    if obj is None:
+        return None
+    return next((i for i in obj.users_collection if i.get("ymd_import")), None)
+
+def build_auras(auras, textures, images, materials, armature_obj, collection, name, key_reduction='NONE', key_tolerance=0.001, stats=None):
+    """
+    Builds the aura effect files of a model. Every aura bone showing a shape
+    gets an object, parented to the armature bone of the same name when there
+    is one; shapes with the same geometry and texture share one mesh datablock.
+    Aura tracks animate the objects of their bones.
 
+    Args:
+    - auras (dict): Aura file name to (Model, shape textures), from load_aura.
+    - textures (dict): Texture name to PNG bytes or path.
+    - images (dict): Content hash to image, from image_index.
+    - materials (dict): Texture name to the materials already created, extended here.
+    - armature_obj (bpy.types.Object): Armature of the model.
+    - collection (bpy.types.Collection): Collection of the import.
+    - name (str): Import name the actions are tagged with.
+    - key_reduction (str): 'NONE', 'LINEAR' or 'BEZIER', see add_transform_fcurves.
+    - key_tolerance (float): Tolerance of the key reduction.
+    - stats (Stats): Receives the "key reduction" stage and the count of the keys inserted under "keyframes".
+
+    Returns:
+    List of the names of the actions created.
+    """
+    texture_names = {os.path.splitext(i)[0]: i for i in textures}
+    shared = {}
+    actions = []
+    key_count = 0
+    for aura_name, (aura, shape_textures) in auras.items():
+        shapes = {i.name: i for i in aura.meshes}
+        objects = {}
+        for bone in aura.bones:
+            shape = shapes.get(bone.mesh_name)
+            if shape is None:
+                continue
+
+            texture_name = shape_textures.get(shape.name)
+            texture_name = texture_name if texture_name in textures else texture_names.get(os.path.splitext(texture_name or "")[0])
+            digest = hashlib.sha256(b"".join((
+                shape.positions.tobytes(), shape.uvs.tobytes(), shape.faces.tobytes(), (texture_name or "").encode(),
+            ))).hexdigest()
+
+            mesh = shared.get(digest)
+            if mesh is None:
+                mesh = build_mesh(shape.name, shape.positions, shape.faces, shape.uvs[shape.faces.ravel()], aura.version)
+                if texture_name is not None:
+                    if texture_name not in materials:
+                        materials[texture_name] = new_material(texture_name, load_image(texture_name, textures[texture_name], images))
+                    mesh.materials.append(materials[texture_name])
+                shared[digest] = mesh
+
+            obj = bpy.data.objects.new(bone.name, mesh)
+            collection.objects.link(obj)
+            obj.parent = armature_obj
+            if bone.name in armature_obj.data.bones:
+                obj.parent_type = 'BONE'
+                obj.parent_bone = bone.name
+            objects[bone.name] = obj
+
+        for clip in aura.clips:
+            for bone_name, keys in (clip.tracks or {}).items():
+                obj = objects.get(bone_name)
+                if obj is None or len(keys) == 0:
+                    continue
+                action = bpy.data.actions.new(name="%s_%s" % (clip.name, bone_name))
+                action["ymd_import"] = name
+                actions.append(action.name)
+                obj.animation_data_create().action = action
+                obj.rotation_mode = 'QUATERNION'
+
+                frames = np.arange(len(keys), dtype=np.float32)
+                key_count += add_transform_fcurves(action, "", frames, keys[:, KEY_LOCATION], keys[:, KEY_ROTATION][:, [3, 0, 1, 2]], keys[:, KEY_SCALE],
+                                                   key_reduction, key_tolerance, stats)
+
+    if stats is not None:
+        stats.add("keyframes", count=key_count)
+    return actions
 
 """
 thanks to @Tiniifan
 https://github.com/Tiniifan/Level-5-blender-addon/blob/e331fb7a2bad17eb486a1530e08c8872bd99e784/operators/fileio_xmtn.py
 """
-def calculate_transformed_location(pose_bone, location):
-    parent = pose_bone.parent
-    while parent and not parent.bone.use_deform:
-        parent = parent.parent
-
-    pose_matrix = pose_bone.matrix
-    if parent:
-        parent_matrix = parent.matrix
-        pose_matrix = parent_matrix.inverted() @ pose_matrix
-
-    return pose_matrix.inverted() @ location
-    
-def calculate_transformed_rotation(pose_bone, rotation):
-    parent = pose_bone.parent
-    while parent and not parent.bone.use_deform:
-        parent = parent.parent
-
-    pose_matrix = pose_bone.matrix
-    if parent:
-        parent_matrix = parent.matrix
-        pose_matrix = parent_matrix.inverted() @ pose_matrix
-
-    # Create a Quaternion directly from Euler angles
-    rotation_quaternion = Quaternion(rotation)
-
-    # Convert quaternion rotation to Matrix
-    rotation_matrix = rotation_quaternion.to_matrix().to_4x4()
-
-    # Multiply pose matrix by rotation matrix
-    transformed_matrix = pose_matrix.inverted() @ rotation_matrix
-
-    # Extract quaternion from the result
-    transformed_quaternion = transformed_matrix.to_quaternion()
-
-    return transformed_quaternion
-    
-def calculate_transformed_scale(pose_bone, scale):
-    parent = pose_bone.parent
-    while parent and not parent.bone.use_deform:
-        parent = parent.parent
+def calculate_pose_matrix(bone, parent):
+    """
+    Returns the inverted rest matrix of a bone relative to its nearest deforming
+    parent, as a (4,4) array. It is read from the rest data of the armature, so
+    neither the mode, the frame nor an action already playing change it, and it
+    is computed once per bone and shared by all of its keys.
 
-    pose_matrix = pose_bone.matrix
+    Args:
+    - bone (bpy.types.Bone): Animated bone.
+    - parent (bpy.types.Bone): Nearest deforming parent, or None.
+    """
+    rest_matrix = bone.matrix_local
     if parent:
-        parent_matrix = parent.matrix
-        pose_matrix = parent_matrix.inverted() @ pose_matrix
-
-    # Create scale matrices for each axis
-    scale_matrix_x = Matrix.Scale(scale[0], 4, (1, 0, 0))
-    scale_matrix_y = Matrix.Scale(scale[1], 4, (0, 1, 0))
-    scale_matrix_z = Matrix.Scale(scale[2], 4, (0, 0, 1))
-
-    # Multiply pose matrix by scale matrices
-    transformed_matrix = pose_matrix.inverted() @ (scale_matrix_x @ scale_matrix_y @ scale_matrix_z)
-
-    # Extract scales from the result
-    transformed_scale = transformed_matrix.to_scale()
-
-    return transformed_scale
-
-def decrypt_file(key, input_file, output_file=None, chunksize=64*1024):
-    if not output_file:
-        output_file = os.path.splitext(input_file)[0] + '.zip'
-
-    filesize = os.path.getsize(input_file)
-
-    cipher = AES.new(key, AES.MODE_CBC, b'0000000000000000')
-
-    with open(input_file, 'rb') as infile:
-        with open(output_file, 'wb') as outfile:
-            while True:
-                chunk = infile.read(chunksize)
-                if len(chunk) == 0:
-                    break
-                outfile.write(cipher.decrypt(chunk))
+        rest_matrix = parent.matrix_local.inverted() @ rest_matrix
 
-            outfile.truncate(filesize)
+    return np.array(rest_matrix.inverted(), dtype=np.float64)
 
 # 2609010 line 169 (custom material)
\ No newline at end of file
@@ -0,0 +1,8 @@
+"""
+The tests only use core, which needs no Blender. The add-on root imports bpy,
+so the repository directory is put on sys.path and core imported on its own.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,25 @@
+from core.benchmark import compare, mismatches
+
+def result(version=20181101, repeat=5, vertices=2000):
+    stage = {"seconds": 0.5, "best": 0.4, "bytes": 0, "count": 0, "mb_per_s": 0, "items_per_s": 0}
+    return {
+        "version": version,
+        "repeat": repeat,
+        "sizes": {"small": {"options": {"vertices": vertices}, "bytes": 0, "stages": {"parse_ymd": stage}, "peaks": {}}},
+    }
+
+def test_same_parameters_compare():
+    assert mismatches(result(), result()) == []
+    lines, regressions = compare(result(), result())
+    assert regressions == []
+
+def test_different_parameters_are_reported():
+    assert len(mismatches(result(version=20158017), result())) == 1
+    assert len(mismatches(result(repeat=3), result())) == 1
+    assert len(mismatches(result(vertices=100), result())) == 1
+
+def test_baseline_without_parameters_is_reported():
+    baseline = result()
+    del baseline["repeat"]
+    del baseline["sizes"]["small"]["options"]
+    assert len(mismatches(result(), baseline)) == 2
@@ -0,0 +1,115 @@
+import glob
+import os
+import time
+
+import numpy as np
+import pytest
+
+from core import cache
+from core.cache import cache_entries, load_ez
+from core.synthetic import synthetic_archive
+from core.timing import Stats
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = tmp_path / "model.ez"
+    path.write_bytes(synthetic_archive("model", meshes=2, vertices=300, bones=8, groups=4, clips=2, keys=10, auras=1))
+    return str(path)
+
+def load(archive, cache_dir, **options):
+    stats = Stats()
+    result = load_ez(archive, True, str(cache_dir), stats=stats, **options)
+    stages = stats.to_dict()
+    return result, stages["cache"]["count"], "decrypt" in stages
+
+def same_model(a, b):
+    assert [i.name for i in a.bones] == [i.name for i in b.bones]
+    for mesh_a, mesh_b in zip(a.meshes, b.meshes):
+        np.testing.assert_array_equal(mesh_a.positions, mesh_b.positions)
+        np.testing.assert_array_equal(mesh_a.faces, mesh_b.faces)
+        np.testing.assert_array_equal(mesh_a.skin.weight, mesh_b.skin.weight)
+    for clip_a, clip_b in zip(a.clips, b.clips):
+        assert clip_a.tracks.keys() == clip_b.tracks.keys()
+        for name in clip_a.tracks:
+            np.testing.assert_array_equal(clip_a.tracks[name], clip_b.tracks[name])
+
+def test_miss_then_hit(archive, tmp_path):
+    cache_dir = tmp_path / "cache"
+    (model, textures, model_info, auras), hits, decrypted = load(archive, cache_dir)
+    assert hits == 0 and decrypted
+    assert len(cache_entries(str(cache_dir))) == 1
+
+    (cached, cached_textures, cached_info, cached_auras), hits, decrypted = load(archive, cache_dir)
+    assert hits == 1 and not decrypted
+    same_model(model, cached)
+    assert cached_textures == textures
+    assert cached_info == model_info
+    assert cached_auras.keys() == auras.keys()
+
+@pytest.mark.parametrize("cut", [2, 10, 40, -100])
+def test_corrupt_entry(archive, tmp_path, cut):
+    cache_dir = tmp_path / "cache"
+    model = load(archive, cache_dir)[0][0]
+    path = glob.glob(str(cache_dir / "*"))[0]
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:cut])
+
+    reparsed, hits, decrypted = load(archive, cache_dir)
+    assert hits == 0 and decrypted
+    same_model(model, reparsed[0])
+    # The corrupt entry was replaced
+    assert os.path.getsize(path) == len(data)
+    assert load(archive, cache_dir)[1] == 1
+
+def test_requested_clips(archive, tmp_path):
+    cache_dir = tmp_path / "cache"
+    load(archive, cache_dir)
+    model = load(archive, cache_dir, clip_names=[])[0][0]
+    assert all(i.tracks is None for i in model.clips)
+    model = load(archive, cache_dir, clip_names=["clip_01"])[0][0]
+    assert [i.tracks is not None for i in model.clips] == [False, True]
+    # The entry itself keeps every clip
+    assert all(i.tracks is not None for i in load(archive, cache_dir)[0][0].clips)
+
+def test_entry_larger_than_the_cache(archive, tmp_path):
+    cache_dir = tmp_path / "cache"
+    load_ez(archive, True, str(cache_dir), max_size=1)
+    assert len(cache_entries(str(cache_dir))) == 1
+
+def test_hit_without_touching_the_entry(archive, tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    load(archive, cache_dir)
+
+    def read_only(path, *args, **kwargs):
+        raise PermissionError(path)
+    monkeypatch.setattr(cache.os, "utime", read_only)
+    assert load(archive, cache_dir)[1] == 1
+
+def test_entry_removed_while_listing(archive, tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    load(archive, cache_dir)
+    stat = os.stat
+
+    def evicted(path, *args, **kwargs):
+        if str(path).endswith(cache.EXTENSION):
+            raise FileNotFoundError(path)
+        return stat(path, *args, **kwargs)
+    monkeypatch.setattr(cache.os, "stat", evicted)
+    assert cache_entries(str(cache_dir)) == []
+
+def test_stale_temporary_files(archive, tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    stale = cache_dir / "interrupted.tmp"
+    fresh = cache_dir / "writing.tmp"
+    stale.write_bytes(b"x")
+    fresh.write_bytes(b"x")
+    old = time.time() - cache.STALE_SECONDS - 10
+    os.utime(stale, (old, old))
+
+    load(archive, cache_dir)
+    assert not stale.exists()
+    assert fresh.exists()
@@ -0,0 +1,46 @@
+import json
+import os
+
+import pytest
+
+from core import convert as convert_module
+from core.convert import PROGRESS_FILE, convert, convert_file
+from core.synthetic import synthetic_archive
+
+
+def crashing_convert_file(input_file, *args):
+    # Stands for a worker killed by the system while converting one archive
+    if "crash" in os.path.basename(input_file):
+        os._exit(1)
+    return convert_file(input_file, *args)
+
+def write_archive(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(synthetic_archive(path.stem, meshes=1, vertices=30, bones=4, groups=2, clips=1, keys=5))
+    return path
+
+def progress(output):
+    with open(os.path.join(output, PROGRESS_FILE), encoding='utf-8') as f:
+        return {os.path.basename(entry["path"]): entry["ok"] for entry in map(json.loads, f)}
+
+def test_bad_archive_does_not_stop_the_run(tmp_path):
+    write_archive(tmp_path / "in" / "a.ez")
+    (tmp_path / "in" / "bad.ez").write_bytes(b"not an archive")
+    results = convert([str(tmp_path / "in")], str(tmp_path / "out"), workers=2, log=lambda line: None)
+    assert sorted((os.path.basename(i["path"]), i["ok"]) for i in results) == [("a.ez", True), ("bad.ez", False)]
+    assert progress(tmp_path / "out") == {"a.ez": True, "bad.ez": False}
+
+def test_dead_worker_fails_only_its_archive(tmp_path, monkeypatch):
+    for name in ("a", "b", "crash", "d"):
+        write_archive(tmp_path / "in" / (name + ".ez"))
+    monkeypatch.setattr(convert_module, "convert_file", crashing_convert_file)
+    results = convert([str(tmp_path / "in")], str(tmp_path / "out"), workers=2, log=lambda line: None)
+    assert progress(tmp_path / "out") == {"a.ez": True, "b.ez": True, "crash.ez": False, "d.ez": True}
+    assert len(results) == 4
+
+def test_output_collision(tmp_path):
+    write_archive(tmp_path / "one" / "model.ez")
+    write_archive(tmp_path / "two" / "model.ez")
+    with pytest.raises(ValueError):
+        convert([str(tmp_path / "one"), str(tmp_path / "two")], str(tmp_path / "out"), log=lambda line: None)
+    assert not os.path.exists(tmp_path / "out")
@@ -0,0 +1,78 @@
+import numpy as np
+
+from core.gltf import skin_attributes
+from core.model import Mesh, Skin
+from core.parser import parse_ymd, vertex_influences
+from core.synthetic import synthetic_ymd
+
+
+def reference_influences(skin, face_groups_idx):
+    """
+    Plain loop version of vertex_influences.
+    """
+    weights = {}
+    for vertex, group in enumerate(face_groups_idx):
+        for i in range(skin.offsets[group], skin.offsets[group + 1]):
+            if skin.weight[i] != 0:
+                key = (vertex, int(skin.bone_idx[i]))
+                weights[key] = weights.get(key, 0.0) + float(skin.weight[i])
+    return weights
+
+def as_dict(vertices, bone_idx, weight):
+    return {(int(v), int(b)): float(w) for v, b, w in zip(vertices, bone_idx, weight)}
+
+def check(skin, face_groups_idx):
+    vertices, bone_idx, weight = vertex_influences(skin, face_groups_idx)
+    expected = reference_influences(skin, face_groups_idx)
+    found = as_dict(vertices, bone_idx, weight)
+    assert len(vertices) == len(found)
+    assert found.keys() == expected.keys()
+    for key, value in expected.items():
+        assert abs(found[key] - value) < 1e-6
+
+def test_synthetic_meshes():
+    model = parse_ymd(synthetic_ymd(meshes=2, vertices=600, bones=12, groups=7, influences=3))
+    for mesh in model.meshes:
+        check(mesh.skin, mesh.face_groups_idx)
+
+def test_zero_weights_and_repeated_bones():
+    # Group 0: bone 1 twice and a zero weight, group 1: empty, group 2: one bone
+    skin = Skin(["a", "b", "c"],
+                np.array([0, 4, 4, 5], np.int32),
+                np.array([1, 2, 1, 0, 2], np.int32),
+                np.array([0.25, 0.5, 0.25, 0.0, 1.0], np.float32))
+    face_groups_idx = np.array([0, 1, 2, 0, 2, 1], np.int32)
+    check(skin, face_groups_idx)
+    vertices, bone_idx, weight = vertex_influences(skin, face_groups_idx)
+    assert as_dict(vertices, bone_idx, weight)[(0, 1)] == 0.5
+
+def test_empty():
+    vertices, bone_idx, weight = vertex_influences(Skin.empty(), np.empty(0, np.int32))
+    assert len(vertices) == len(bone_idx) == len(weight) == 0
+
+def test_gltf_skin_attributes():
+    skin = Skin(["a", "b", "c", "d", "e", "f"],
+                np.array([0, 6, 6, 8], np.int32),
+                np.array([0, 1, 2, 3, 4, 1, 5, 2], np.int32),
+                np.array([0.1, 0.2, 0.3, 0.1, 0.2, 0.1, 0.0, 2.0], np.float32))
+    face_groups_idx = np.array([2, 0, 1, 0], np.int32)
+    mesh = Mesh("object", "mesh", np.zeros((4, 3), np.float32), None, None, None, face_groups_idx, skin)
+    # Bone 5 is outside the joint tree
+    joint_of_bone = np.array([10, 11, 12, 13, 14, -1])
+    sets = skin_attributes(mesh, joint_of_bone, 7)
+    assert len(sets) == 2
+    joints = np.concatenate([i[0] for i in sets], axis=1)
+    weights = np.concatenate([i[1] for i in sets], axis=1)
+
+    expected = reference_influences(skin, face_groups_idx)
+    for vertex in range(len(face_groups_idx)):
+        reference = {joint_of_bone[b]: w for (v, b), w in expected.items() if v == vertex and joint_of_bone[b] >= 0}
+        if not reference:
+            reference = {7: 1.0}
+        total = sum(reference.values())
+        found = {int(j): float(w) for j, w in zip(joints[vertex], weights[vertex]) if w > 0}
+        assert found.keys() == reference.keys()
+        for joint, value in reference.items():
+            assert abs(found[joint] - value / total) < 1e-6
+        # Strongest influence first
+        assert np.all(np.diff(weights[vertex][weights[vertex] > 0]) <= 0)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from core.keyframes import bezier_handles, interpolate, key_slopes, reduce_keys
+
+
+def sampled_track(count=120, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = np.arange(count, dtype=np.float64)
+    t = frames / count
+    values = np.stack([
+        np.sin(2 * np.pi * t),
+        np.where(t < 0.5, t, 1 - t),
+        np.full(count, 0.25),
+        np.cumsum(rng.normal(0, 0.01, count)),
+    ], axis=1)
+    return frames, values
+
+def evaluate(frames, values, keep, mode):
+    """
+    Evaluates every channel of the reduced curve at every frame.
+    """
+    slopes = key_slopes(frames, values) if mode == "BEZIER" else None
+    index = np.broadcast_to(np.arange(len(frames))[:, None], keep.shape)
+    prev = np.maximum.accumulate(np.where(keep, index, 0), axis=0)
+    next = np.minimum.accumulate(np.where(keep, index, len(frames) - 1)[::-1], axis=0)[::-1]
+    # A constant channel keeps one key and holds its value
+    next = np.where(keep.sum(axis=0) == 1, prev, next)
+    return interpolate(frames, values, slopes, prev, next)
+
+@pytest.mark.parametrize("mode", ["LINEAR", "BEZIER"])
+@pytest.mark.parametrize("tolerance", [0.0001, 0.001, 0.01])
+def test_within_tolerance(mode, tolerance):
+    frames, values = sampled_track()
+    keep = reduce_keys(frames, values, tolerance, mode)
+    assert keep[0].all()
+    assert keep.sum() < keep.size
+    error = np.abs(evaluate(frames, values, keep, mode) - values)
+    assert error.max() <= tolerance + 1e-9
+
+def test_looser_tolerance_keeps_fewer_keys():
+    frames, values = sampled_track()
+    counts = [reduce_keys(frames, values, tolerance).sum() for tolerance in (0.0001, 0.001, 0.01)]
+    assert counts[0] >= counts[1] >= counts[2]
+
+def test_constant_and_linear_channels():
+    frames = np.arange(50, dtype=np.float64)
+    values = np.stack([np.full(50, 3.0), frames * 0.5], axis=1)
+    keep = reduce_keys(frames, values, 1e-6)
+    assert keep[:, 0].sum() == 1
+    np.testing.assert_array_equal(np.flatnonzero(keep[:, 1]), [0, 49])
+
+def test_short_and_empty_tracks():
+    assert reduce_keys(np.empty(0), np.empty((0, 3))).shape == (0, 3)
+    keep = reduce_keys(np.arange(2.0), np.array([[0.0, 1.0], [0.0, 2.0]]))
+    np.testing.assert_array_equal(keep, [[True, True], [False, True]])
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        reduce_keys(np.arange(3.0), np.zeros((3, 1)), mode="CUBIC")
+
+def test_bezier_handles_follow_the_slope():
+    frames = np.array([0.0, 3.0, 9.0])
+    values = np.array([0.0, 1.0, 0.0])
+    slopes = np.array([1.0, 0.0, -0.5])
+    left, right = bezier_handles(frames, values, slopes)
+    np.testing.assert_allclose(left[:, 0], [-1.0, 2.0, 7.0])
+    np.testing.assert_allclose(right[:, 0], [1.0, 5.0, 11.0])
+    np.testing.assert_allclose(right[:, 1] - values, slopes * (right[:, 0] - frames))
@@ -0,0 +1,52 @@
+from core.obj import write_obj
+from core.parser import parse_ymd
+from core.synthetic import synthetic_ymd
+
+
+def read_materials(path):
+    materials = {}
+    name = None
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.startswith("newmtl "):
+                name = line.split(None, 1)[1].strip()
+                materials[name] = None
+            elif line.startswith("map_Kd "):
+                materials[name] = line.split(None, 1)[1].strip()
+    return materials
+
+def shared_name_model():
+    model = parse_ymd(synthetic_ymd(meshes=2, vertices=30, bones=4, groups=2, clips=0))
+    for mesh in model.meshes:
+        mesh.name = "body"
+    return model
+
+def test_single_file_materials(tmp_path):
+    model = shared_name_model()
+    textures = ["tex_a.png", "tex_b.png"]
+    model_info = {"material": [{"name": "object_00", "texture": ["tex_a"]}, {"name": "object_01", "texture": ["tex_b"]}]}
+    write_obj(model, str(tmp_path), "single", textures=textures, model_info=model_info)
+
+    with open(tmp_path / "model.obj", encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    assert lines[0] == "mtllib model.mtl"
+    used = [line.split(None, 1)[1] for line in lines if line.startswith("usemtl ")]
+    materials = read_materials(tmp_path / "model.mtl")
+    assert len(set(used)) == 2
+    assert [materials[i] for i in used] == ["tex_a.png", "tex_b.png"]
+
+def test_split_files_materials(tmp_path):
+    model = shared_name_model()
+    files = write_obj(model, str(tmp_path), "split", textures=["tex_00.png"])
+    assert len(files) == 2
+    for file_name in files:
+        with open(file_name, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        mtl = lines[0].split(None, 1)[1]
+        used = [line.split(None, 1)[1] for line in lines if line.startswith("usemtl ")]
+        assert read_materials(tmp_path / mtl) == {used[0]: "tex_00.png"}
+
+def test_untextured(tmp_path):
+    model = shared_name_model()
+    write_obj(model, str(tmp_path), "single")
+    assert set(read_materials(tmp_path / "model.mtl").values()) == {None}
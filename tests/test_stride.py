@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from core.parser import open_source, parse_ymd, read_keys
+from core.synthetic import int_bytes, string_bytes, synthetic_ymd
+
+
+def track(count, stride, padding=1.0, fps=30):
+    """
+    Returns count keys of stride floats with padding after the 11 known floats,
+    and the (count,11) keys read_keys should find.
+    """
+    rng = np.random.default_rng(count * 100 + stride)
+    keys = np.full((count, stride), padding, np.float32)
+    keys[:, 0] = np.arange(count) / fps
+    keys[:, 1:11] = rng.uniform(-1, 1, (count, 10))
+    return keys.tobytes(), keys[:, :11]
+
+@pytest.mark.parametrize("count", [2, 3, 8, 60])
+@pytest.mark.parametrize("stride", [12, 13, 16, 20])
+def test_padded_track(count, stride):
+    data, expected = track(count, stride)
+    # The next track follows, as in a clip
+    data = open_source(data + string_bytes("next_bone") + int_bytes(count) + track(count, stride)[0])
+    keys, found = read_keys(data, count)
+    # Two keys are read at the right stride but do not set it for the clip
+    assert found == (stride if count >= 3 else None)
+    assert data.tell() == count * stride * 4
+    np.testing.assert_array_equal(keys, expected)
+
+@pytest.mark.parametrize("keys", [3, 60])
+@pytest.mark.parametrize("key_stride", [12, 16])
+def test_synthetic_clips(keys, key_stride):
+    model = parse_ymd(synthetic_ymd(meshes=1, vertices=30, bones=6, clips=2, keys=keys, key_stride=key_stride))
+    assert len(model.clips) == 2
+    for clip in model.clips:
+        assert clip.stride == key_stride
+        assert len(clip.tracks) == 6
+        for keys_array in clip.tracks.values():
+            assert keys_array.shape == (keys, 11)
+            np.testing.assert_allclose(keys_array[:, 0], np.arange(keys) / 30, rtol=1e-6)
+
+@pytest.mark.parametrize("stride", [13, 16])
+def test_two_key_tracks_do_not_set_the_clip_stride(stride):
+    # Padding of 1.0 right after the 12th float reads as a second key time at stride 12
+    first, expected = track(2, stride)
+    data = open_source(first + track(5, stride)[0])
+    keys, found = read_keys(data, 2)
+    np.testing.assert_array_equal(keys, expected)
+    assert found is None
+    keys, found = read_keys(data, 5)
+    assert found == stride
+
+def test_single_key_tracks():
+    data, expected = track(1, 12)
+    keys, found = read_keys(open_source(data + string_bytes("next_bone")), 1)
+    np.testing.assert_array_equal(keys, expected)
+    assert found is None
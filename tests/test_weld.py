@@ -0,0 +1,41 @@
+import numpy as np
+
+from core.parser import parse_ymd
+from core.synthetic import synthetic_ymd
+from core.weld import weld_mesh, weld_rows
+
+
+def test_weld_rows():
+    rows = np.array([[0, 0], [1, 1], [0, 0], [2, 2], [1, 1]], np.float32)
+    keep, remap = weld_rows(rows)
+    np.testing.assert_array_equal(keep, [0, 1, 3])
+    np.testing.assert_array_equal(remap, [0, 1, 0, 2, 1])
+
+def test_weld_rows_compares_bits():
+    rows = np.array([[0.0], [-0.0], [1.0], [1.0 + 1e-7]], np.float32)
+    keep, remap = weld_rows(rows)
+    assert len(keep) == 4
+
+def test_weld_mesh_keeps_every_corner():
+    mesh = parse_ymd(synthetic_ymd(meshes=1, vertices=900, bones=4, groups=3)).meshes[0]
+    # Duplicate every triangle so that welding has corners to merge
+    doubled = weld_mesh(type(mesh)(
+        mesh.object_name, mesh.name,
+        np.concatenate((mesh.positions, mesh.positions)), np.concatenate((mesh.normals, mesh.normals)),
+        np.concatenate((mesh.uvs, mesh.uvs)), np.concatenate((mesh.faces, mesh.faces + len(mesh.positions))),
+        np.concatenate((mesh.face_groups_idx, mesh.face_groups_idx)), mesh.skin,
+    ))
+    assert len(doubled.positions) <= len(mesh.positions)
+    corners = mesh.faces.ravel()
+    welded = doubled.faces[:len(mesh.faces)].ravel()
+    for original, merged in ((mesh.positions, doubled.positions), (mesh.normals, doubled.normals),
+                             (mesh.uvs, doubled.uvs), (mesh.face_groups_idx, doubled.face_groups_idx)):
+        np.testing.assert_array_equal(original[corners], merged[welded])
+    np.testing.assert_array_equal(doubled.faces[:len(mesh.faces)], doubled.faces[len(mesh.faces):])
+
+def test_weld_without_seams_keeps_positions_and_groups():
+    mesh = parse_ymd(synthetic_ymd(meshes=1, vertices=300, bones=4, groups=3)).meshes[0]
+    welded = weld_mesh(mesh, seams=False)
+    corners = mesh.faces.ravel()
+    np.testing.assert_array_equal(mesh.positions[corners], welded.positions[welded.faces.ravel()])
+    np.testing.assert_array_equal(mesh.face_groups_idx[corners], welded.face_groups_idx[welded.faces.ravel()])